@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+""" Measures the import time and memory of the package.
+
+Every case runs in a new interpreter a few times. The results contain the median import time, the memory allocated by
+the import and the amount of modules it loaded:
+
+    python3 benchmarks/imports.py --output imports.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CASES = [
+    ('gateways package', 'import electronics.gateways'),
+    ('devices package', 'import electronics.devices'),
+    ('MockGateway + LM75', 'from electronics.gateways import MockGateway\nfrom electronics.devices import LM75'),
+    ('BusPirate', 'from electronics.gateways import BusPirate'),
+    ('LinuxDevice', 'from electronics.gateways import LinuxDevice'),
+    ('SimulatedGateway', 'from electronics.gateways import SimulatedGateway'),
+    ('everything', 'from electronics.gateways import *\nfrom electronics.devices import *'),
+]
+
+# Runs in the child interpreter, the statement is measured after the interpreter itself is loaded. Tracing the memory
+# makes imports a lot slower, so the time and the memory are measured in separate interpreters.
+_PROBE = """
+import json, sys, time, tracemalloc
+before = set(sys.modules)
+if {trace}:
+    tracemalloc.start()
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+memory = tracemalloc.get_traced_memory()[0] if {trace} else 0
+loaded = sorted(set(sys.modules) - before)
+print(json.dumps({{'seconds': elapsed, 'bytes': memory, 'modules': loaded}}))
+"""
+
+
+def _probe(statement, trace):
+    process = subprocess.run([sys.executable, '-c', _PROBE.format(statement=statement, trace=trace)], cwd=ROOT,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if process.returncode != 0:
+        raise Exception(process.stderr.decode().strip().splitlines()[-1])
+    return json.loads(process.stdout.decode())
+
+
+def measure(statement, repeat):
+    """ Run an import statement in new interpreters
+
+    :param statement: The import statement
+    :param repeat: Amount of interpreters to start for the timing
+    :return: dict with the median time, the allocated memory and the loaded modules or the error
+    """
+    try:
+        seconds = statistics.median(_probe(statement, False)['seconds'] for i in range(repeat))
+        traced = _probe(statement, True)
+    except Exception as e:
+        return {'error': str(e)}
+    modules = traced['modules']
+    return {
+        'seconds': seconds,
+        'bytes': traced['bytes'],
+        'modules': len(modules),
+        'package_modules': [module for module in modules if module.startswith('electronics')],
+        'dependencies': [module for module in ('serial', 'smbus', 'asyncio', 'numpy') if module in modules],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the import time of the package')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    parser.add_argument('--repeat', type=int, default=5, help='Amount of interpreters per case')
+    args = parser.parse_args()
+
+    results = {}
+    for name, statement in CASES:
+        result = results[name] = measure(statement, args.repeat)
+        if 'error' in result:
+            print('{:<20} {}'.format(name, result['error']))
+            continue
+        print('{:<20} {:>8.2f} ms {:>8.0f} kB {:>4d} modules {:>3d} package modules  {}'.format(
+            name, result['seconds'] * 1000, result['bytes'] / 1024, result['modules'],
+            len(result['package_modules']), ', '.join(result['dependencies'])))
+
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(results, handle, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
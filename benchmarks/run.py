@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+""" Benchmarks for the hot paths of the drivers.
+
+Every benchmark runs a driver method against simulated devices and measures the time per call, the bus transactions
+and bytes per call and the memory the call allocates. The results are written as JSON so runs can be compared:
+
+    python3 benchmarks/run.py --output before.json
+    python3 benchmarks/run.py --output after.json --compare before.json
+
+The comparison exits with status 1 when a benchmark got slower than the threshold, does more transactions or
+allocates more memory than the baseline.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from electronics.gateways import SimulatedGateway  # noqa: E402
+from electronics.gateways.models import LM75Model, BMP180Model, MPU6050Model, HMC5883LModel, MCP23017Model, \
+    HT16K33Model  # noqa: E402
+from electronics.devices import LM75, BMP180, MPU6050I2C, HMC5883L, MCP23017I2C, HT16K33, SegmentDisplayGPIO  # noqa
+from electronics.gpio import GPIOBus  # noqa: E402
+
+BENCHMARKS = []
+
+
+def benchmark(name):
+    """ Register a benchmark. The decorated function gets a SimulatedGateway and returns the function to measure. """
+
+    def decorator(function):
+        BENCHMARKS.append((name, function))
+        return function
+
+    return decorator
+
+
+@benchmark('LM75.temperature')
+def lm75_temperature(gw):
+    gw.attach(0x49, LM75Model(temperature=21.5))
+    return LM75(gw).temperature
+
+
+@benchmark('BMP180.pressure')
+def bmp180_pressure(gw):
+    gw.attach(0x77, BMP180Model())
+    # Measure the driver, not the conversion time of the chip
+    sensor = BMP180(gw, sleep=lambda seconds: None)
+    sensor.load_calibration()
+    return sensor.pressure
+
+
+@benchmark('MPU6050I2C.acceleration')
+def mpu6050_acceleration(gw):
+    gw.attach(0x68, MPU6050Model(acceleration=(100, 200, 2048)))
+    sensor = MPU6050I2C(gw)
+    sensor.wakeup()
+    return sensor.acceleration
+
+
+@benchmark('HMC5883L.gauss')
+def hmc5883l_gauss(gw):
+    gw.attach(0x1e, HMC5883LModel(field=(100, 200, 300), registers={0x02: 0x00}))
+    sensor = HMC5883L(gw)
+    sensor.config()
+    return sensor.gauss
+
+
+@benchmark('MCP23017I2C.sync')
+def mcp23017_sync(gw):
+    gw.attach(0x20, MCP23017Model())
+    expander = MCP23017I2C(gw)
+    expander.IODIRA = 0x00
+    expander.sync()
+    state = [0]
+
+    def toggle():
+        state[0] ^= 0xff
+        expander.GPIOA = state[0]
+        expander.sync()
+
+    return toggle
+
+
+@benchmark('GPIOBus.write')
+def gpiobus_write(gw):
+    gw.attach(0x20, MCP23017Model())
+    expander = MCP23017I2C(gw)
+    expander.IODIRA = 0x00
+    expander.sync()
+    bus = GPIOBus(expander.get_pins()[0:4])
+    state = [0]
+
+    def write():
+        state[0] = (state[0] + 1) & 0x0f
+        bus.write(state[0])
+
+    return write
+
+
+@benchmark('SegmentDisplayGPIO.write')
+def segmentdisplay_write(gw):
+    gw.attach(0x20, MCP23017Model())
+    expander = MCP23017I2C(gw)
+    expander.IODIRA = 0x00
+    expander.sync()
+    display = SegmentDisplayGPIO(expander.get_pins()[0:7])
+    state = [0]
+
+    def write():
+        state[0] = (state[0] + 1) % 10
+        display.write(state[0])
+
+    return write
+
+
+@benchmark('HT16K33.flush')
+def ht16k33_flush(gw):
+    gw.attach(0x70, HT16K33Model())
+    matrix = HT16K33(gw)
+    state = [0]
+
+    def flush():
+        state[0] = (state[0] + 1) & 0x07
+        matrix.set_row(state[0], 0xffff)
+        matrix.set_row((state[0] + 7) & 0x07, 0)
+        matrix.flush()
+
+    return flush
+
+
+def measure(setup, number, repeat):
+    """ Run a benchmark and collect its results
+
+    :param setup: The benchmark function
+    :param number: Amount of calls per timing run
+    :param repeat: Amount of timing runs
+    :return: dict with the results
+    """
+    gw = SimulatedGateway()
+    function = setup(gw)
+    function()
+
+    # Bus traffic, the metrics are only enabled for this pass so they don't add to the timing
+    metrics = gw.enable_metrics()
+    for i in range(number):
+        function()
+    transactions = metrics.transactions / number
+    bus_bytes = (metrics.bytes_read + metrics.bytes_written) / number
+    gw.disable_metrics()
+
+    # Time per call, the fastest run is the least disturbed by the rest of the system
+    runs = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for r in range(repeat):
+            start = time.perf_counter_ns()
+            for i in range(number):
+                function()
+            runs.append((time.perf_counter_ns() - start) / number)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    # Memory: the peak of the temporary allocations of a single call and the memory that is still allocated after
+    # many calls, which points to a leak or a growing cache
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function()
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        function()
+        peak = tracemalloc.get_traced_memory()[1] - before
+        gc.collect()
+        before = tracemalloc.get_traced_memory()[0]
+        for i in range(number):
+            function()
+        gc.collect()
+        retained = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'calls': number * repeat,
+        'ns_per_call': min(runs),
+        'ns_per_call_median': statistics.median(runs),
+        'transactions_per_call': transactions,
+        'bus_bytes_per_call': bus_bytes,
+        'alloc_peak_bytes': peak,
+        'alloc_retained_bytes': retained,
+    }
+
+
+def environment():
+    """ Describe the machine and the code version so results from different runs can be matched """
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                         cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'system': platform.system(),
+        'commit': commit,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def compare(baseline, results, threshold):
+    """ Compare results with a baseline
+
+    :return: List of regression messages, empty when there are none
+    """
+    regressions = []
+    print('{:<28} {:>12} {:>12} {:>8}  {:>6} {:>6}'.format('benchmark', 'baseline ns', 'ns', 'change', 'tx', 'alloc'))
+    for name, result in results.items():
+        old = baseline['benchmarks'].get(name)
+        if old is None:
+            print('{:<28} {:>12} {:>12.0f}'.format(name, '-', result['ns_per_call']))
+            continue
+        change = result['ns_per_call'] / old['ns_per_call'] - 1
+        transactions = result['transactions_per_call'] - old['transactions_per_call']
+        allocations = result['alloc_peak_bytes'] - old['alloc_peak_bytes']
+        print('{:<28} {:>12.0f} {:>12.0f} {:>+7.1%}  {:>+6.2f} {:>+6d}'.format(name, old['ns_per_call'],
+                                                                             result['ns_per_call'], change,
+                                                                             transactions, allocations))
+        if change > threshold:
+            regressions.append('{} is {:.1%} slower'.format(name, change))
+        if transactions > 0:
+            regressions.append('{} does {:.2f} more transactions per call'.format(name, transactions))
+        if allocations > old['alloc_peak_bytes'] * threshold:
+            regressions.append('{} allocates {} bytes more per call'.format(name, allocations))
+        if result['alloc_retained_bytes'] > max(old['alloc_retained_bytes'], 0) * (1 + threshold) + 1024:
+            regressions.append('{} keeps {} bytes allocated'.format(name, result['alloc_retained_bytes']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the driver hot paths')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    parser.add_argument('--compare', metavar='BASELINE', help='Compare with the results in this JSON file')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='Allowed slowdown as a fraction before it is a regression (default 0.1)')
+    parser.add_argument('--filter', default='', help='Only run the benchmarks that contain this text')
+    parser.add_argument('--number', type=int, default=1000, help='Calls per timing run')
+    parser.add_argument('--repeat', type=int, default=7, help='Amount of timing runs')
+    args = parser.parse_args()
+
+    results = {}
+    for name, setup in BENCHMARKS:
+        if args.filter not in name:
+            continue
+        results[name] = measure(setup, args.number, args.repeat)
+        if not args.compare:
+            result = results[name]
+            print('{:<28} {:>9.0f} ns {:>6.2f} tx {:>6.1f} B/call {:>7d} B peak'.format(
+                name, result['ns_per_call'], result['transactions_per_call'], result['bus_bytes_per_call'],
+                result['alloc_peak_bytes']))
+
+    report = {'environment': environment(), 'benchmarks': results}
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(report, handle, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as handle:
+            baseline = json.load(handle)
+        regressions = compare(baseline, results, args.threshold)
+        for message in regressions:
+            print('REGRESSION: {}'.format(message))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
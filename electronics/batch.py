@@ -0,0 +1,186 @@
+import collections
+import time
+
+from electronics.trace import TraceBuffer
+
+I2CTransaction = collections.namedtuple('I2CTransaction', ['kind', 'address', 'register', 'payload'])
+I2CTransaction.__doc__ = """ A single I2C transaction in a batch. The payload is the length for reads and the data for writes. """
+
+READ = 0
+WRITE = 1
+READ_REGISTER = 2
+WRITE_REGISTER = 3
+
+
+def execute_sequential(bus, transactions):
+    """ Execute a list of transactions one by one with the normal gateway methods. This is the fallback for gateways
+    that don't have a faster bulk path.
+
+    :param bus: The gateway
+    :param transactions: List of I2CTransaction instances
+    :return: List with the result for every transaction, None for writes
+    """
+    results = []
+    for transaction in transactions:
+        kind = transaction.kind
+        if kind == READ_REGISTER:
+            results.append(bus.i2c_read_register(transaction.address, transaction.register, transaction.payload))
+        elif kind == WRITE_REGISTER:
+            bus.i2c_write_register(transaction.address, transaction.register, transaction.payload)
+            results.append(None)
+        elif kind == READ:
+            results.append(bus.i2c_read(transaction.address, transaction.payload))
+        else:
+            bus.i2c_write(transaction.address, transaction.payload)
+            results.append(None)
+    return results
+
+
+class PendingRead(object):
+    """ Result of a read inside a batch. The value is available with result() after the batch is flushed. """
+
+    def __init__(self, transform=None, source=None):
+        self._transform = transform
+        self._source = source
+        self._done = False
+        self._value = None
+
+    def done(self):
+        """ Check if the read has been executed
+
+        :return: True if the result is available
+        """
+        if self._source is not None:
+            return self._source.done()
+        return self._done
+
+    def result(self):
+        """ Get the result of the read
+
+        :return: The data returned by the device, decoded if the read was created with a transform
+        """
+        if self._source is not None:
+            value = self._source.result()
+        elif not self._done:
+            raise Exception('The batch containing this read has not been flushed yet')
+        else:
+            value = self._value
+        if self._transform is not None:
+            return self._transform(value)
+        return value
+
+    def map(self, transform):
+        """ Create a new PendingRead that applies a function to the result of this read
+
+        :param transform: Function that gets the result and returns the decoded value
+        """
+        return PendingRead(transform, self)
+
+    def _set(self, value):
+        self._value = value
+        self._done = True
+
+
+class I2CBatch(object):
+    """ Collects transactions from one or more devices on the same bus and executes them in a single flush.
+
+    Use I2CDevice.batch() to create a batch for a device. Inside the batch the write methods of the device are
+    queued and the read methods return a PendingRead instead of the data. When the batch is left the transactions
+    are handed to the i2c_transfer() method of the gateway, which sends them using the fastest path it has. Gateways
+    without i2c_transfer() execute the transactions one by one.
+
+    .. testsetup::
+
+        from electronics.gateways import MockGateway
+        from electronics.devices import LM75, MPU6050I2C
+        gw = MockGateway()
+
+    :Example:
+
+    >>> sensor = LM75(gw)
+    >>> sixaxis = MPU6050I2C(gw)
+    >>> with sensor.batch() as batch:
+    ...     batch.attach(sixaxis)
+    ...     sixaxis.wakeup()
+    ...     raw_temperature = sensor.i2c_read(2)
+    ...     acceleration = sixaxis.read_block(MPU6050I2C.ACCEL_OUT)
+    >>> raw_temperature.result()
+    bytearray(b'\\x01\\x02')
+    >>> acceleration.result()
+    (772, 1286, 1800)
+    """
+
+    def __init__(self, bus):
+        self.bus = bus
+        self.queue = []
+        self.devices = []
+        self.depth = 0
+
+    def attach(self, device):
+        """ Record the transactions of another device on the same bus in this batch
+
+        :param device: I2CDevice instance
+        """
+        if device.i2c_bus is not self.bus:
+            raise ValueError('Only devices on the same bus can be batched together')
+        if device._batch is self:
+            return
+        device._batch = self
+        self.devices.append(device)
+
+    def add(self, device, kind, register, payload):
+        """ Queue a transaction, this is called by the I2CDevice methods
+
+        :return: A PendingRead for reads, None for writes
+        """
+        pending = None
+        if kind == READ or kind == READ_REGISTER:
+            pending = PendingRead()
+        self.queue.append((device, I2CTransaction(kind, device.address, register, payload), pending))
+        return pending
+
+    def flush(self):
+        """ Execute all queued transactions """
+        if not self.queue:
+            return
+        queue = self.queue
+        self.queue = []
+        transactions = [item[1] for item in queue]
+
+        start = time.perf_counter()
+        transfer = getattr(self.bus, 'i2c_transfer', None)
+        if transfer is None:
+            results = execute_sequential(self.bus, transactions)
+        else:
+            results = transfer(transactions)
+        end = time.perf_counter()
+
+        for (device, transaction, pending), result in zip(queue, results):
+            if pending is not None:
+                pending._set(result)
+            if device.tracer is not None:
+                self._trace(device, transaction, start, end)
+
+    def _trace(self, device, transaction, start, end):
+        if transaction.kind == READ or transaction.kind == READ_REGISTER:
+            direction = TraceBuffer.READ
+            length = transaction.payload
+        else:
+            direction = TraceBuffer.WRITE
+            length = 1 if isinstance(transaction.payload, int) else len(transaction.payload)
+        device.tracer.record(transaction.address, transaction.register, direction, length, start, end)
+
+    def __enter__(self):
+        self.depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.depth -= 1
+        if self.depth == 0:
+            for device in self.devices:
+                device._batch = None
+            self.devices = []
+        if exc_type is None:
+            self.flush()
+        elif self.depth == 0:
+            self.queue = []
@@ -0,0 +1,407 @@
+import argparse
+import collections
+import os
+import signal
+import socket
+import socketserver
+import struct
+import sys
+import threading
+
+from electronics.batch import I2CTransaction, execute_sequential, READ, WRITE, READ_REGISTER, WRITE_REGISTER
+from electronics.gateways.base import Gateway, GatewayCapabilities, synchronized, coalesced
+from electronics.gateways.metrics import metered, metered_transfer, BusMetrics
+
+DEFAULT_PATH = '/tmp/electronics-broker.sock'
+
+# Request: operation and flags, gateway number, device address, register (NO_REGISTER for raw transactions) and the
+# length. Writes and OPEN are followed by length bytes of data.
+REQUEST = struct.Struct('<BBBHI')
+
+# Response: status and length, followed by length bytes with the read data, the capabilities or the error message
+RESPONSE = struct.Struct('<BI')
+
+# The I2C operations use the transaction kinds from electronics.batch
+OP_OPEN = 0x10
+# Reserved for SPI transfers, none of the gateways implement SPI yet
+OP_SPI = 0x20
+
+# Set on every request of a batch except the last, the broker executes the batch with a single i2c_transfer()
+FLAG_MORE = 0x80
+
+NO_REGISTER = 0xFFFF
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+# Capabilities in the OPEN response: gateway number, flags, max_transfer (0 for no limit) and the cost estimates
+CAPABILITIES = struct.Struct('<BBIff')
+_CAPABILITY_FLAGS = ['i2c', 'i2c_raw', 'i2c_block', 'i2c_combined', 'i2c_bulk', 'spi']
+
+
+def _encode_capabilities(index, capabilities):
+    flags = 0
+    for bit, name in enumerate(_CAPABILITY_FLAGS):
+        if getattr(capabilities, name):
+            flags |= 1 << bit
+    return CAPABILITIES.pack(index, flags, capabilities.max_transfer or 0, capabilities.transaction_cost,
+                             capabilities.byte_cost)
+
+
+def _decode_capabilities(data):
+    index, flags, max_transfer, transaction_cost, byte_cost = CAPABILITIES.unpack(data)
+    options = {}
+    for bit, name in enumerate(_CAPABILITY_FLAGS):
+        options[name] = bool(flags & (1 << bit))
+    return index, GatewayCapabilities(max_transfer=max_transfer or None, transaction_cost=transaction_cost,
+                                      byte_cost=byte_cost, **options)
+
+
+def _payload(data):
+    if isinstance(data, int):
+        return bytes([data])
+    return bytes(data)
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        broker = self.server.broker
+        buffer = bytearray()
+        while True:
+            try:
+                data = self.request.recv(65536)
+            except ConnectionError:
+                return
+            if not data:
+                return
+            buffer += data
+
+            # Execute every complete request in the buffer and answer them with a single send
+            responses = bytearray()
+            offset = 0
+            while True:
+                group, end = broker.parse_group(buffer, offset)
+                if group is None:
+                    break
+                responses += broker.execute(group)
+                offset = end
+            del buffer[:offset]
+            if responses:
+                self.request.sendall(responses)
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class Broker(object):
+    """ Shares gateways with other processes over a Unix domain socket.
+
+    The broker opens the gateways once and keeps them open, clients use BrokerGateway to access them. Every client
+    connection gets its own thread, the gateway locks keep the transactions of different clients apart. The requests
+    of a client are pipelined: the broker executes every request that has arrived and sends all responses at once.
+    A batch from a client is executed as a single i2c_transfer() on the gateway.
+
+    Start the broker from the command line:
+
+    .. code-block:: bash
+
+        python3 -m electronics.broker --buspirate pirate=/dev/ttyUSB0 --linux i2c1=1
+
+    .. testsetup::
+
+        import os
+        import tempfile
+        from electronics.gateways import MockGateway
+        from electronics.devices import LM75, BMP180
+        from electronics.broker import Broker, BrokerGateway
+        path = os.path.join(tempfile.mkdtemp(), 'broker.sock')
+
+    :Example:
+
+    >>> broker = Broker({'mock': MockGateway()}, path)
+    >>> broker.start()
+    >>> # In the client process
+    >>> gw = BrokerGateway(path, 'mock')
+    >>> sensor = LM75(gw)
+    >>> sensor.temperature()
+    1.0078125
+    >>> barometer = BMP180(gw)
+    >>> barometer.temperature()
+    -134.1
+    >>> gw.close()
+    >>> broker.stop()
+
+    :param gateways: dict with a name for every gateway instance, the first gateway is the default
+    :param path: The path of the socket
+    """
+
+    def __init__(self, gateways, path=DEFAULT_PATH):
+        self.gateways = collections.OrderedDict(gateways)
+        self.names = list(self.gateways)
+        self.path = path
+        self.server = None
+        self._thread = None
+
+    def parse_group(self, buffer, offset):
+        """ Find the next complete request or batch of requests in the receive buffer
+
+        :return: Tuple with a list of (operation, gateway, address, register, length, data) and the offset after the
+                 group, the list is None if the group is not complete yet
+        """
+        group = []
+        while True:
+            if len(buffer) - offset < REQUEST.size:
+                return None, offset
+            operation, gateway, address, register, length = REQUEST.unpack_from(buffer, offset)
+            offset += REQUEST.size
+            kind = operation & ~FLAG_MORE
+            data = None
+            if kind in (WRITE, WRITE_REGISTER, OP_OPEN, OP_SPI):
+                if len(buffer) - offset < length:
+                    return None, offset
+                data = bytes(buffer[offset:offset + length])
+                offset += length
+            group.append((kind, gateway, address, register, length, data))
+            if not operation & FLAG_MORE:
+                return group, offset
+
+    def execute(self, group):
+        """ Execute a request or batch and build the responses """
+        kind, index = group[0][0], group[0][1]
+        if kind == OP_OPEN:
+            name = group[0][5].decode() or self.names[0]
+            if name not in self.gateways:
+                return self._error('Unknown gateway {}'.format(name))
+            index = self.names.index(name)
+            gateway = self.gateways[name]
+            capabilities = getattr(gateway, 'capabilities', None) or GatewayCapabilities(i2c_raw=True)
+            return self._response(_encode_capabilities(index, capabilities))
+        if kind == OP_SPI:
+            return self._error('SPI is not supported by the broker')
+        if index >= len(self.names):
+            return self._error('Unknown gateway {}'.format(index), len(group))
+
+        gateway = self.gateways[self.names[index]]
+        transactions = []
+        for kind, index, address, register, length, data in group:
+            register = None if register == NO_REGISTER else register
+            payload = length if kind == READ or kind == READ_REGISTER else data
+            transactions.append(I2CTransaction(kind, address, register, payload))
+        try:
+            if len(transactions) == 1:
+                results = execute_sequential(gateway, transactions)
+            elif hasattr(gateway, 'i2c_transfer'):
+                results = gateway.i2c_transfer(transactions)
+            else:
+                results = execute_sequential(gateway, transactions)
+        except Exception as e:
+            return self._error('{}: {}'.format(type(e).__name__, e), len(group))
+
+        response = bytearray()
+        for result in results:
+            response += self._response(bytes(result) if result is not None else b'')
+        return response
+
+    def _response(self, data):
+        return RESPONSE.pack(STATUS_OK, len(data)) + data
+
+    def _error(self, message, count=1):
+        message = message.encode()
+        return (RESPONSE.pack(STATUS_ERROR, len(message)) + message) * count
+
+    def serve_forever(self):
+        """ Run the broker until stop() is called """
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.server = _Server(self.path, _Handler)
+        self.server.broker = self
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    def start(self):
+        """ Run the broker in a background thread """
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.server = _Server(self.path, _Handler)
+        self.server.broker = self
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """ Stop the broker and remove the socket """
+        if self.server is None:
+            return
+        self.server.shutdown()
+        self.server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.server = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class BrokerGateway(Gateway):
+    """ Gateway for a bus that is shared by a Broker process. Drivers use it like any other gateway, batches are sent
+    to the broker in a single message.
+
+    :Example:
+
+    >>> from electronics.broker import BrokerGateway
+    >>> gw = BrokerGateway() # doctest: +SKIP
+    >>> # Select a gateway on the broker by name
+    >>> gw = BrokerGateway('/tmp/electronics-broker.sock', 'pirate') # doctest: +SKIP
+
+    :param path: The path of the broker socket
+    :param gateway: Name of the gateway on the broker, None for the first gateway
+    """
+
+    def __init__(self, path=DEFAULT_PATH, gateway=None):
+        self.path = path
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(path)
+        self._buffer = bytearray()
+        name = (gateway or '').encode()
+        self.socket.sendall(REQUEST.pack(OP_OPEN, 0, 0, NO_REGISTER, len(name)) + name)
+        self.index, remote = _decode_capabilities(self._response())
+
+        # The broker executes batches in one go, so batches are always faster than single transactions
+        self.capabilities = GatewayCapabilities(i2c=remote.i2c, i2c_raw=remote.i2c_raw, i2c_block=remote.i2c_block,
+                                                i2c_combined=remote.i2c_combined, i2c_bulk=True,
+                                                max_transfer=remote.max_transfer,
+                                                transaction_cost=remote.transaction_cost, byte_cost=remote.byte_cost)
+
+    def _receive(self, length):
+        while len(self._buffer) < length:
+            data = self.socket.recv(65536)
+            if not data:
+                raise Exception('Connection to the broker was closed')
+            self._buffer += data
+        result = bytes(self._buffer[0:length])
+        del self._buffer[0:length]
+        return result
+
+    def _response(self):
+        status, length = RESPONSE.unpack(self._receive(RESPONSE.size))
+        data = self._receive(length)
+        if status != STATUS_OK:
+            raise Exception('Broker: {}'.format(data.decode()))
+        return data
+
+    def _request(self, transaction, more=False):
+        kind = transaction.kind
+        register = NO_REGISTER if transaction.register is None else transaction.register
+        operation = kind | FLAG_MORE if more else kind
+        if kind == READ or kind == READ_REGISTER:
+            return REQUEST.pack(operation, self.index, transaction.address, register, transaction.payload)
+        data = _payload(transaction.payload)
+        return REQUEST.pack(operation, self.index, transaction.address, register, len(data)) + data
+
+    def _execute(self, transaction):
+        self.socket.sendall(self._request(transaction))
+        return self._response()
+
+    @coalesced
+    @metered(BusMetrics.READ, register=False)
+    def i2c_read(self, address, length):
+        return self._execute(I2CTransaction(READ, address, None, length))
+
+    @synchronized
+    @metered(BusMetrics.WRITE, register=False)
+    def i2c_write(self, address, data):
+        self._execute(I2CTransaction(WRITE, address, None, data))
+
+    @coalesced
+    @metered(BusMetrics.READ)
+    def i2c_read_register(self, address, register, length):
+        return self._execute(I2CTransaction(READ_REGISTER, address, register, length))
+
+    @synchronized
+    @metered(BusMetrics.WRITE)
+    def i2c_write_register(self, address, register, data):
+        self._execute(I2CTransaction(WRITE_REGISTER, address, register, data))
+
+    @synchronized
+    @metered_transfer
+    def i2c_transfer(self, transactions):
+        """ Send a list of transactions to the broker in a single message, the broker executes them with a single
+        i2c_transfer() on its gateway.
+
+        :param transactions: List of electronics.batch.I2CTransaction instances
+        :return: List with the result for every transaction, None for writes
+        """
+        if not transactions:
+            return []
+        packet = bytearray()
+        for index, transaction in enumerate(transactions):
+            packet += self._request(transaction, more=index < len(transactions) - 1)
+        self.socket.sendall(packet)
+
+        # Read all responses before raising so the stream stays in sync
+        results = []
+        error = None
+        for transaction in transactions:
+            try:
+                response = self._response()
+            except Exception as e:
+                error = error or e
+                response = None
+            if transaction.kind == READ or transaction.kind == READ_REGISTER:
+                results.append(response)
+            else:
+                results.append(None)
+        if error is not None:
+            raise error
+        return results
+
+    @synchronized
+    def close(self):
+        """ Disconnect from the broker """
+        self.socket.close()
+
+
+def _named(value):
+    if '=' not in value:
+        raise argparse.ArgumentTypeError('Use NAME=VALUE')
+    return value.split('=', 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Share gateways with other processes over a Unix domain socket')
+    parser.add_argument('--socket', default=DEFAULT_PATH, help='Path of the socket')
+    parser.add_argument('--buspirate', type=_named, action='append', default=[], metavar='NAME=DEVICE',
+                        help='Open a Bus Pirate')
+    parser.add_argument('--linux', type=_named, action='append', default=[], metavar='NAME=INDEX',
+                        help='Open a Linux i2c bus')
+    parser.add_argument('--mock', action='append', default=[], metavar='NAME', help='Add a mock gateway')
+    args = parser.parse_args()
+
+    gateways = collections.OrderedDict()
+    for name, device in args.buspirate:
+        from electronics.gateways.buspirate import BusPirate
+        gateways[name] = BusPirate(device)
+    for name, index in args.linux:
+        from electronics.gateways.linuxdevice import LinuxDevice
+        gateways[name] = LinuxDevice(int(index))
+    for name in args.mock:
+        from electronics.gateways.mock import MockGateway
+        gateways[name] = MockGateway()
+    if not gateways:
+        parser.error('Add at least one gateway')
+
+    broker = Broker(gateways, args.socket)
+    # Leave through the cleanup in serve_forever() when the service manager stops the broker
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        broker.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
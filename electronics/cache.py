@@ -0,0 +1,157 @@
+import collections
+import copy
+import functools
+import inspect
+import threading
+import time
+
+
+class ReadCache(object):
+    """ Cache for the results of device read methods.
+
+    Attach the cache to a device with the read methods and the time in seconds their result stays fresh. Calls within
+    that time return the cached value without bus traffic. The cache holds a limited amount of results, the least
+    recently used result is removed when it is full. Writes to the device don't update the cache, use invalidate()
+    after changing the configuration of a device.
+
+    .. testsetup::
+
+        from electronics.gateways import MockGateway
+        from electronics.devices import LM75, BMP180
+        from electronics.cache import ReadCache
+        gw = MockGateway()
+
+    :Example:
+
+    >>> now = [0.0]
+    >>> cache = ReadCache(maxsize=64, clock=lambda: now[0])
+    >>> sensor = LM75(gw)
+    >>> barometer = BMP180(gw)
+    >>> cache.attach(sensor, temperature=1.0)
+    >>> cache.attach(barometer, temperature=1.0, pressure=0.1)
+    >>> sensor.temperature()
+    1.0078125
+    >>> now[0] = 0.5
+    >>> sensor.temperature()
+    1.0078125
+    >>> now[0] = 1.5
+    >>> sensor.temperature()
+    3.015625
+    >>> stats = cache.statistics()
+    >>> stats['hits'], stats['misses'], stats['size']
+    (1, 2, 1)
+    >>> # Remove the cached values of a device or of all devices
+    >>> cache.invalidate(sensor)
+    >>> cache.detach(sensor)
+
+    :param maxsize: Maximum amount of cached results
+    :param clock: Function that returns the current time in seconds, defaults to time.monotonic
+    """
+
+    def __init__(self, maxsize=128, clock=time.monotonic):
+        if maxsize < 1:
+            raise ValueError('The cache should hold at least one result')
+        self.maxsize = maxsize
+        self.clock = clock
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.reset_statistics()
+
+    def reset_statistics(self):
+        """ Clear the hit and miss counters """
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def statistics(self):
+        """ Get the cache counters
+
+        :return: dict with the amount of hits, misses, evictions, the current size and the hit ratio
+        """
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'hit_ratio': self.hits / total if total else 0.0,
+        }
+
+    def attach(self, device, **ttls):
+        """ Cache read methods of a device
+
+        :param device: The device instance
+        :param ttls: The name of a read method as keyword with the time in seconds its result stays fresh
+        """
+        for name, ttl in ttls.items():
+            method = getattr(type(device), name, None)
+            if method is None or not callable(method):
+                raise AttributeError('{} has no method {}'.format(type(device).__name__, name))
+            setattr(device, name, self._wrap(device, name, ttl, getattr(device, name)))
+
+    def detach(self, device, *names):
+        """ Stop caching the methods of a device and remove its cached values
+
+        :param device: The device instance
+        :param names: Names of the methods to stop caching, all methods if empty
+        """
+        for name in names or list(vars(device)):
+            if getattr(vars(device).get(name), '__read_cache__', None) is self:
+                delattr(device, name)
+        self.invalidate(device)
+
+    def invalidate(self, device=None):
+        """ Remove cached values
+
+        :param device: Only remove the values of this device, or remove everything when None
+        """
+        with self._lock:
+            if device is None:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries if key[0] is device]:
+                del self._entries[key]
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > self.clock():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, copy.copy(entry[1])
+            self.misses += 1
+            return False, None
+
+    def _store(self, key, ttl, value):
+        with self._lock:
+            self._entries[key] = (self.clock() + ttl, copy.copy(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _wrap(self, device, name, ttl, method):
+        if inspect.iscoroutinefunction(method):
+            @functools.wraps(method)
+            async def wrapper(*args):
+                key = (device, name) + args
+                hit, value = self._lookup(key)
+                if hit:
+                    return value
+                value = await method(*args)
+                self._store(key, ttl, value)
+                return value
+        else:
+            @functools.wraps(method)
+            def wrapper(*args):
+                key = (device, name) + args
+                hit, value = self._lookup(key)
+                if hit:
+                    return value
+                value = method(*args)
+                self._store(key, ttl, value)
+                return value
+
+        wrapper.__read_cache__ = self
+        return wrapper
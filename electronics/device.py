@@ -1,32 +1,212 @@
-import logging
+import contextlib
+import time
+
+from electronics.batch import I2CBatch, PendingRead, READ, WRITE, READ_REGISTER, WRITE_REGISTER
+from electronics.registers import Register, register_state
+from electronics.trace import TraceBuffer
+
+
+def _length(data):
+    if isinstance(data, int):
+        return 1
+    return len(data)
+
+
+def _join(parts):
+    result = bytearray()
+    for part in parts:
+        result.extend(part)
+    return bytes(result)
+
+
+def _legacy_capabilities(bus):
+    # Gateways that don't subclass Gateway only promise the register methods
+    from electronics.gateways.base import GatewayCapabilities
+    return GatewayCapabilities(i2c=True, i2c_raw=hasattr(bus, 'i2c_read'))
 
 
 class I2CDevice(object):
+    # Object with a record() method that is called for every transaction, see electronics.trace. Set this on the
+    # class to trace all devices or on an instance to trace a single device. None disables tracing.
+    tracer = None
+
+    # The I2CBatch this device is recording in, see batch()
+    _batch = None
+
     def __init__(self, bus, address):
-        if not hasattr(bus, 'i2c_write_register') or not hasattr(bus, 'i2c_read_register'):
+        capabilities = getattr(bus, 'capabilities', None)
+        if capabilities is None:
+            if not hasattr(bus, 'i2c_write_register') or not hasattr(bus, 'i2c_read_register'):
+                raise Exception('Bus does not support i2c read and write')
+            capabilities = _legacy_capabilities(bus)
+        elif not capabilities.i2c:
             raise Exception('Bus does not support i2c read and write')
 
         self.i2c_bus = bus
         self.address = address
 
+        # Capabilities of the gateway, see electronics.gateways.base.GatewayCapabilities
+        self.capabilities = capabilities
+        self._max_transfer = capabilities.max_transfer
+
     def i2c_read(self, length):
+        if self._batch is not None:
+            return self._batch.add(self, READ, None, length)
+        if self.tracer is None:
+            return self.i2c_bus.i2c_read(self.address, length)
+        start = time.perf_counter()
         response = self.i2c_bus.i2c_read(self.address, length)
-        logging.debug('{} -> PC: {}'.format(self.address, repr(response)))
+        self.tracer.record(self.address, None, TraceBuffer.READ, length, start, time.perf_counter())
         return response
 
     def i2c_write(self, bytes):
-        logging.debug('PC -> {}: {}'.format(self.address, repr(bytes)))
-        return self.i2c_bus.i2c_write(self.address, bytes)
+        if self._batch is not None:
+            return self._batch.add(self, WRITE, None, bytes)
+        if self.tracer is None:
+            return self.i2c_bus.i2c_write(self.address, bytes)
+        start = time.perf_counter()
+        result = self.i2c_bus.i2c_write(self.address, bytes)
+        self.tracer.record(self.address, None, TraceBuffer.WRITE, _length(bytes), start, time.perf_counter())
+        return result
 
     def i2c_read_register(self, register, length):
-        logging.debug('0x{:02X} -> PC: reg 0x{:02X}:'.format(self.address, register))
+        if self._max_transfer is not None and length > self._max_transfer:
+            return self._read_register_chunked(register, length)
+        if self._batch is not None:
+            return self._batch.add(self, READ_REGISTER, register, length)
+        if self.tracer is None:
+            return self.i2c_bus.i2c_read_register(self.address, register, length)
+        start = time.perf_counter()
         response = self.i2c_bus.i2c_read_register(self.address, register, length)
-        logging.debug(repr(response))
+        self.tracer.record(self.address, register, TraceBuffer.READ, length, start, time.perf_counter())
         return response
 
     def i2c_write_register(self, register, bytes):
-        logging.debug('PC -> 0x{:02X} reg 0x{:02X}: {}'.format(self.address, register, repr(bytes)))
-        return self.i2c_bus.i2c_write_register(self.address, register, bytes)
+        if self._batch is not None:
+            return self._batch.add(self, WRITE_REGISTER, register, bytes)
+        if self.tracer is None:
+            return self.i2c_bus.i2c_write_register(self.address, register, bytes)
+        start = time.perf_counter()
+        result = self.i2c_bus.i2c_write_register(self.address, register, bytes)
+        self.tracer.record(self.address, register, TraceBuffer.WRITE, _length(bytes), start, time.perf_counter())
+        return result
+
+    async def _bus_call_async(self, method, *args):
+        bus = self.i2c_bus
+        coroutine = getattr(bus, method + '_async', None)
+        if coroutine is not None:
+            return await coroutine(self.address, *args)
+        # Blocking gateway, keep the event loop running while it waits. asyncio is imported here because it is slow to
+        # import and only needed by applications that already use it.
+        import asyncio
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, getattr(bus, method), self.address, *args)
+
+    async def i2c_read_async(self, length):
+        return await self._bus_call_async('i2c_read', length)
+
+    async def i2c_write_async(self, bytes):
+        return await self._bus_call_async('i2c_write', bytes)
+
+    async def i2c_read_register_async(self, register, length):
+        return await self._bus_call_async('i2c_read_register', register, length)
+
+    async def i2c_write_register_async(self, register, bytes):
+        return await self._bus_call_async('i2c_write_register', register, bytes)
+
+    async def read_block_async(self, block):
+        """ Coroutine version of read_block() """
+        return block.decode(await self.i2c_read_register_async(block.address, block.length))
+
+    def _read_register_chunked(self, register, length):
+        # The gateway can't transfer this much at once, read it in parts and rely on the register auto-increment
+        parts = []
+        for offset in range(0, length, self._max_transfer):
+            parts.append(self.i2c_read_register(register + offset, min(self._max_transfer, length - offset)))
+        if self._batch is not None:
+            # Inside a batch the parts are PendingReads that are all flushed together, join them once the last is done
+            return parts[-1].map(lambda last: _join([part.result() for part in parts]))
+        return _join(parts)
+
+    def read_block(self, block):
+        """ Read a RegisterBlock and decode it
+
+        :param block: RegisterBlock instance declared on the device class
+        :return: Tuple with the decoded values or a PendingRead inside a batch
+        """
+        raw = self.i2c_read_register(block.address, block.length)
+        if isinstance(raw, PendingRead):
+            return raw.map(block.decode)
+        return block.decode(raw)
+
+    def batch(self):
+        """ Record the transactions of this device and send them together when the context is left. Inside the
+        batch the read methods return a PendingRead, use result() on it after the batch. If the device is already
+        in a batch the transactions queued so far are sent when this block is left.
+
+        :Example:
+
+        .. code-block:: python
+
+            with sensor.batch():
+                sensor.i2c_write_register(0xF4, 0x2E)
+                raw = sensor.i2c_read_register(0xF6, 2)
+            value = raw.result()
+
+        :return: I2CBatch instance
+        """
+        if self._batch is not None:
+            return self._batch
+        current = I2CBatch(self.i2c_bus)
+        current.attach(self)
+        return current
+
+    def flush_registers(self):
+        """ Write the registers that are modified since the last flush to the device """
+        state = register_state(self)
+        while state.dirty:
+            address, register = state.dirty.popitem(last=False)
+            self.i2c_write_register(address, register.struct.pack(state.values[address]))
+
+    async def flush_registers_async(self):
+        """ Coroutine version of flush_registers() """
+        state = register_state(self)
+        while state.dirty:
+            address, register = state.dirty.popitem(last=False)
+            await self.i2c_write_register_async(address, register.struct.pack(state.values[address]))
+
+    def refresh_registers(self):
+        """ Load the current value of all declared registers from the device into the shadow copy """
+        state = register_state(self)
+        for register in type(self)._declared_registers():
+            raw = self.i2c_read_register(register.address, register.struct.size)
+            state.values[register.address] = register.struct.unpack(raw)[0]
+            state.dirty.pop(register.address, None)
+
+    @classmethod
+    def _declared_registers(cls):
+        result = {}
+        for klass in reversed(cls.__mro__):
+            for value in vars(klass).values():
+                if isinstance(value, Register):
+                    result[value.address] = value
+        return [result[address] for address in sorted(result)]
+
+    @contextlib.contextmanager
+    def deferred_writes(self, flush=True):
+        """ Context manager that collects register changes and writes every changed register once at the end.
+        Use this to change multiple bitfields in the same register with a single write.
+
+        :param flush: Write the changes at the end. Use False to send them with flush_registers_async() instead
+        """
+        state = register_state(self)
+        state.deferred += 1
+        try:
+            yield self
+        finally:
+            state.deferred -= 1
+        if state.deferred == 0 and flush:
+            self.flush_registers()
 
 
 class GPIODevice(object):
@@ -1,6 +1,37 @@
-from .bmp180 import *
-from .hmc5883l import *
-from .lm75 import *
-from .mpu6050 import *
-from .mcp23017 import *
-from .segmentdisplay import *
+""" The drivers are imported on first use, so using one device doesn't load all of them. A wildcard import loads all
+drivers. """
+import importlib
+
+# Name of every public class and the module it is in
+_EXPORTS = {
+    'BMP180': 'bmp180',
+    'DS18B20': 'ds18b20',
+    'HMC5883L': 'hmc5883l',
+    'HT16K33': 'ht16k33',
+    'HT16K33SegmentDisplay': 'ht16k33',
+    'LM75': 'lm75',
+    'MPU6050I2C': 'mpu6050',
+    'MCP23017I2C': 'mcp23017',
+    'SegmentDisplayFont': 'segmentdisplay',
+    'SevenSegmentDisplayFont': 'segmentdisplay',
+    'FourteenSegmentDisplayFont': 'segmentdisplay',
+    'SegmentTextRenderer': 'segmentdisplay',
+    'SegmentDisplayGPIO': 'segmentdisplay',
+    'MultiplexedSegmentDisplayGPIO': 'segmentdisplay',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError('module {} has no attribute {}'.format(__name__, name))
+    value = getattr(importlib.import_module('.' + module, __name__), name)
+    # Cache it in the module so the next lookup doesn't come here
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -1,5 +1,6 @@
 from electronics.device import I2CDevice
 import struct
+import time
 
 
 class BMP180(I2CDevice):
@@ -26,6 +27,12 @@ class BMP180(I2CDevice):
     >>> sensor.pressure()
     360808
 
+    A measurement starts a conversion and waits for it before the result is read, this takes 4.5ms for the
+    temperature and up to 25.5ms for the pressure.
+
+    :param bus: The gateway
+    :param address: The I2C address of the sensor
+    :param sleep: Function that waits for the conversion
     """
     MODE_ULTRALOWPOWER = 0
     MODE_STANDARD = 1
@@ -38,7 +45,11 @@ class BMP180(I2CDevice):
     BMP085_READTEMPCMD = 0x2E
     BMP085_READPRESSURECMD = 0x34
 
-    def __init__(self, bus, address=0x77):
+    # Conversion time in seconds for the temperature and for the pressure in every mode
+    TEMPERATURE_CONVERSION_TIME = 0.0045
+    PRESSURE_CONVERSION_TIME = (0.0045, 0.0075, 0.0135, 0.0255)
+
+    def __init__(self, bus, address=0x77, sleep=time.sleep):
         # This is the calibration from the datasheet.
         self.cal = {
             'AC1': 480,
@@ -54,6 +65,7 @@ class BMP180(I2CDevice):
             'MD': 2868
         }
         self.mode = self.MODE_STANDARD
+        self.sleep = sleep
         super().__init__(bus, address)
 
     def load_calibration(self):
@@ -75,15 +87,42 @@ class BMP180(I2CDevice):
 
     def get_raw_temp(self):
         self.i2c_write_register(0xF4, 0x2E)
+        # The result is only valid after the conversion, this can't be batched with the start of the conversion
+        self.sleep(self.TEMPERATURE_CONVERSION_TIME)
         raw = self.i2c_read_register(0xF6, 2)
         return struct.unpack('>h', raw)[0]
 
     def get_raw_pressure(self):
         self.i2c_write_register(0xF4, 0x34 + (self.mode << 6))
+        self.sleep(self.PRESSURE_CONVERSION_TIME[self.mode])
         raw = self.i2c_read_register(0xF6, 3)
+        return self._decode_raw_pressure(raw)
+
+    async def get_raw_temp_async(self):
+        """ Coroutine version of get_raw_temp(), waits for the conversion without blocking the event loop """
+        import asyncio
+        await self.i2c_write_register_async(0xF4, 0x2E)
+        await asyncio.sleep(self.TEMPERATURE_CONVERSION_TIME)
+        raw = await self.i2c_read_register_async(0xF6, 2)
+        return struct.unpack('>h', raw)[0]
+
+    async def get_raw_pressure_async(self):
+        """ Coroutine version of get_raw_pressure(), waits for the conversion without blocking the event loop """
+        import asyncio
+        await self.i2c_write_register_async(0xF4, 0x34 + (self.mode << 6))
+        await asyncio.sleep(self.PRESSURE_CONVERSION_TIME[self.mode])
+        raw = await self.i2c_read_register_async(0xF6, 3)
+        return self._decode_raw_pressure(raw)
+
+    def _decode_raw_pressure(self, raw):
         (msw, lsb) = struct.unpack('>HB', raw)
         return ((msw << 8) + lsb) >> (8 - self.mode)
 
+    def _b5(self, ut):
+        x1 = ((ut - self.cal['AC6']) * self.cal['AC5']) >> 15
+        x2 = (self.cal['MC'] << 11) // (x1 + self.cal['MD'])
+        return x1 + x2
+
     def temperature(self):
         """Get the temperature from the sensor.
 
@@ -97,10 +136,14 @@ class BMP180(I2CDevice):
         21.4
 
         """
-        ut = self.get_raw_temp()
-        x1 = ((ut - self.cal['AC6']) * self.cal['AC5']) >> 15
-        x2 = (self.cal['MC'] << 11) // (x1 + self.cal['MD'])
-        b5 = x1 + x2
+        return self._compensate_temperature(self.get_raw_temp())
+
+    async def temperature_async(self):
+        """ Coroutine version of temperature() """
+        return self._compensate_temperature(await self.get_raw_temp_async())
+
+    def _compensate_temperature(self, ut):
+        b5 = self._b5(ut)
         return ((b5 + 8) >> 4) / 10
 
     def pressure(self):
@@ -119,9 +162,16 @@ class BMP180(I2CDevice):
         """
         ut = self.get_raw_temp()
         up = self.get_raw_pressure()
-        x1 = ((ut - self.cal['AC6']) * self.cal['AC5']) >> 15
-        x2 = (self.cal['MC'] << 11) // (x1 + self.cal['MD'])
-        b5 = x1 + x2
+        return self._compensate_pressure(ut, up)
+
+    async def pressure_async(self):
+        """ Coroutine version of pressure() """
+        ut = await self.get_raw_temp_async()
+        up = await self.get_raw_pressure_async()
+        return self._compensate_pressure(ut, up)
+
+    def _compensate_pressure(self, ut, up):
+        b5 = self._b5(ut)
         b6 = b5 - 4000
         x1 = (self.cal['B2'] * (b6 * b6) >> 12) >> 11
         x2 = (self.cal['AC2'] * b6) >> 11
@@ -0,0 +1,175 @@
+import struct
+import time
+
+from electronics.onewire import OneWireDevice, OneWireTransaction, SKIP_ROM, crc8, transfer
+
+
+class DS18B20(OneWireDevice):
+    """
+    Interface to the Maxim DS18B20 1-Wire temperature sensor. Multiple sensors can share the bus, every sensor is
+    addressed with its ROM code.
+
+    :Usage:
+
+    * Use find() to get a sensor instance for every DS18B20 on the bus
+    * Use temperature() to measure the temperature of a single sensor
+    * Use temperatures() to measure all sensors at once
+
+    Every measurement takes up to 750ms. temperatures() starts the conversion in all sensors with a single command
+    and then reads all scratchpads in one transfer, so a string of sensors is measured in the time of a single
+    conversion instead of a conversion per sensor.
+
+    .. testsetup::
+
+        from electronics.gateways import SimulatedGateway, VirtualClock
+        from electronics.gateways.models import DS18B20Model
+        from electronics.devices import DS18B20
+        gw = SimulatedGateway(clock=VirtualClock())
+        for i in range(20):
+            gw.attach_onewire(DS18B20Model(serial=i + 1, temperature=20 + i / 4))
+
+    :Example:
+
+    >>> sensors = DS18B20.find(gw)
+    >>> len(sensors)
+    20
+    >>> sensors[0]
+    <DS18B20 2810000000000045>
+    >>> # The sensors haven't converted yet, the power-on value of 85 degrees is not a measurement
+    >>> DS18B20.read_all(sensors[0:2])
+    [None, None]
+    >>> sensors[0].temperature(sleep=gw.clock.sleep)
+    23.75
+    >>> # All 20 sensors in a single conversion time
+    >>> start = gw.clock()
+    >>> temperatures = DS18B20.temperatures(sensors, sleep=gw.clock.sleep)
+    >>> min(temperatures), max(temperatures)
+    (20.0, 24.75)
+    >>> gw.clock() - start
+    0.75
+
+    :param bus: Gateway with 1-Wire support
+    :param rom: The 8 byte ROM code, None when the sensor is the only device on the bus
+    """
+    FAMILY = 0x28
+
+    CONVERT_T = 0x44
+    READ_SCRATCHPAD = 0xBE
+    WRITE_SCRATCHPAD = 0x4E
+
+    # The temperature register after power-on is 85 degrees until the first conversion is done. It is only rejected
+    # when this driver didn't start a conversion yet, after that it is a real measurement of 85 degrees.
+    POWER_ON_VALUE = b'\x50\x05'
+
+    # Conversion time in seconds for every resolution in bits
+    CONVERSION_TIME = {
+        9: 0.09375,
+        10: 0.1875,
+        11: 0.375,
+        12: 0.75,
+    }
+
+    def __init__(self, bus, rom=None):
+        super().__init__(bus, rom)
+        self.resolution = 12
+        # A conversion was started, the scratchpad has a measurement instead of the power-on value
+        self.converted = False
+
+    def convert(self):
+        """ Start a temperature conversion in this sensor """
+        self.onewire_command([self.CONVERT_T])
+        self.converted = True
+
+    def read_scratchpad(self):
+        """ Read the 9 byte scratchpad with the result of the last conversion
+
+        :return: bytes
+        """
+        return self._check_scratchpad(self.onewire_command([self.READ_SCRATCHPAD], 9))
+
+    def temperature(self, sleep=time.sleep):
+        """ Measure the temperature
+
+        :param sleep: Function that waits for the conversion
+        :return: The temperature in degree celcius
+        """
+        self.convert()
+        sleep(self.CONVERSION_TIME[self.resolution])
+        return self._convert_temperature(self.read_scratchpad())
+
+    def set_resolution(self, resolution, high_alarm=75, low_alarm=70):
+        """ Set the resolution of the conversions, a lower resolution converts faster
+
+        :param resolution: 9, 10, 11 or 12 bits
+        :param high_alarm: High alarm temperature in degree celcius
+        :param low_alarm: Low alarm temperature in degree celcius
+        """
+        if resolution not in self.CONVERSION_TIME:
+            raise ValueError('Invalid resolution')
+        config = ((resolution - 9) << 5) | 0x1F
+        self.onewire_command(struct.pack('Bbb', self.WRITE_SCRATCHPAD, high_alarm, low_alarm) + bytes([config]))
+        self.resolution = resolution
+
+    @classmethod
+    def convert_all(cls, bus):
+        """ Start a temperature conversion in all sensors on the bus with a single skip ROM command
+
+        :param bus: Gateway with 1-Wire support
+        """
+        transfer(bus, [OneWireTransaction(True, bytes([SKIP_ROM, cls.CONVERT_T]), 0)])
+
+    @classmethod
+    def read_all(cls, sensors):
+        """ Read the result of the last conversion of a list of sensors on the same bus in a single transfer
+
+        :param sensors: List of DS18B20 instances
+        :return: List with the temperature in degree celcius for every sensor, None for a sensor that didn't answer
+                 with a valid scratchpad or hasn't converted
+        """
+        if not sensors:
+            return []
+        transactions = [sensor.command([cls.READ_SCRATCHPAD], 9) for sensor in sensors]
+        results = []
+        for sensor, scratchpad in zip(sensors, transfer(sensors[0].onewire_bus, transactions)):
+            if sensor._scratchpad_error(scratchpad) is None:
+                results.append(cls._convert_temperature(scratchpad))
+            else:
+                results.append(None)
+        return results
+
+    @classmethod
+    def temperatures(cls, sensors, sleep=time.sleep):
+        """ Measure a list of sensors on the same bus. All sensors on the bus convert at the same time, so this takes a
+        single conversion time.
+
+        :param sensors: List of DS18B20 instances
+        :param sleep: Function that waits for the conversion
+        :return: List with the temperature in degree celcius for every sensor, None for a sensor that didn't answer
+                 with a valid scratchpad or hasn't converted
+        """
+        if not sensors:
+            return []
+        cls.convert_all(sensors[0].onewire_bus)
+        for sensor in sensors:
+            sensor.converted = True
+        sleep(max(cls.CONVERSION_TIME[sensor.resolution] for sensor in sensors))
+        return cls.read_all(sensors)
+
+    def _check_scratchpad(self, scratchpad):
+        error = self._scratchpad_error(scratchpad)
+        if error is not None:
+            raise Exception(error)
+        return scratchpad
+
+    def _scratchpad_error(self, scratchpad):
+        if scratchpad is None or scratchpad == b'\xff' * 9:
+            return 'No answer from sensor'
+        if len(scratchpad) != 9 or crc8(scratchpad) != 0:
+            return 'Invalid scratchpad CRC: {}'.format(repr(scratchpad))
+        if scratchpad[0:2] == self.POWER_ON_VALUE and not self.converted:
+            return 'Sensor has not converted, the scratchpad has the power-on value'
+        return None
+
+    @staticmethod
+    def _convert_temperature(scratchpad):
+        return struct.unpack('<h', scratchpad[0:2])[0] / 16.0
@@ -1,5 +1,5 @@
 from electronics.device import I2CDevice
-import struct
+from electronics.registers import Register, BitField, RegisterBlock
 
 
 class HMC5883L(I2CDevice):
@@ -30,6 +30,16 @@ class HMC5883L(I2CDevice):
     MODE_POSITIVE_BIAS = 1
     MODE_NEGATIVE_BIAS = 2
 
+    CONFIG_A = Register(0x00, reset=0x10)
+    CONFIG_B = Register(0x01, reset=0x20)
+
+    averaging = BitField(CONFIG_A, 5, 2, values={1: 0, 2: 1, 4: 2, 8: 3})
+    datarate = BitField(CONFIG_A, 2, 3, values={0.75: 0, 1.5: 1, 3: 2, 7.5: 3, 15: 4, 30: 5, 75: 6})
+    measurement_mode = BitField(CONFIG_A, 0, 2)
+    gain = BitField(CONFIG_B, 5, 3, values={1370: 0, 1090: 1, 820: 2, 660: 3, 440: 4, 390: 5, 330: 6, 230: 7})
+
+    DATA_OUT = RegisterBlock(0x03, '>HHH')
+
     def __init__(self, bus, address=0x1e):
         self.resolution = 1090
         super().__init__(bus, address)
@@ -42,34 +52,10 @@ class HMC5883L(I2CDevice):
         :param datarate: Datarate in hertz
         :param mode: one of the MODE_* constants
         """
-        averaging_conf = {
-            1: 0,
-            2: 1,
-            4: 2,
-            8: 3
-        }
-
-        if averaging not in averaging_conf.keys():
-            raise Exception('Averaging should be one of: 1,2,4,8')
-        datarates = {
-            0.75: 0,
-            1.5: 1,
-            3: 2,
-            7.5: 4,
-            15: 5,
-            30: 6,
-            75: 7
-        }
-        if datarate not in datarates.keys():
-            raise Exception(
-                    'Datarate of {} Hz is not support choose one of: {}'.format(datarate, ', '.join(datarates.keys())))
-
-        config_a = 0
-        config_a &= averaging_conf[averaging] << 5
-        config_a &= datarates[datarate] << 2
-        config_a &= mode
-
-        self.i2c_write_register(0x00, config_a)
+        with self.deferred_writes():
+            self.averaging = averaging
+            self.datarate = datarate
+            self.measurement_mode = mode
 
     def set_resolution(self, resolution=1090):
         """
@@ -92,26 +78,9 @@ class HMC5883L(I2CDevice):
 
         :param resolution: The resolution of the sensor
         """
-        options = {
-            1370: 0,
-            1090: 1,
-            820: 2,
-            660: 3,
-            440: 4,
-            390: 5,
-            330: 6,
-            230: 7
-        }
-
-        if resolution not in options.keys():
-            raise Exception('Resolution of {} steps is not supported'.format(resolution))
-
+        self.gain = resolution
         self.resolution = resolution
 
-        config_b = 0
-        config_b &= options[resolution] << 5
-        self.i2c_write_register(0x01, config_b)
-
     def raw(self):
         """
         Get the magnetometer values as raw data from the sensor as tuple (x,y,z)
@@ -122,8 +91,13 @@ class HMC5883L(I2CDevice):
         >>> sensor.raw()
         (3342, 3856, 4370)
         """
-        result = self.i2c_read_register(0x03, 6)
-        return struct.unpack('>HHH', result)
+        return self.read_block(self.DATA_OUT)
+
+    async def raw_async(self):
+        """
+        Coroutine version of raw()
+        """
+        return await self.read_block_async(self.DATA_OUT)
 
     def gauss(self):
         """
@@ -135,7 +109,15 @@ class HMC5883L(I2CDevice):
         >>> sensor.gauss()
         (16.56, 21.2888, 26.017599999999998)
         """
-        raw = self.raw()
+        return self._convert_gauss(self.raw())
+
+    async def gauss_async(self):
+        """
+        Coroutine version of gauss()
+        """
+        return self._convert_gauss(await self.raw_async())
+
+    def _convert_gauss(self, raw):
         factors = {
             1370: 0.73,
             1090: 0.92,
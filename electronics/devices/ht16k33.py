@@ -0,0 +1,224 @@
+from electronics.device import I2CDevice
+from electronics.devices.segmentdisplay import FourteenSegmentDisplayFont, SegmentTextRenderer
+
+
+class HT16K33(I2CDevice):
+    """
+    Interface for the Holtek HT16K33 RAM mapping 16*8 LED controller driver
+
+    :Usage:
+
+    * Use set_row() and set_pixel() to modify the framebuffer
+    * Use flush() to send the modified part of the framebuffer to the chip
+    * Use set_brightness() and set_blink() to change the display settings
+
+    The display RAM of the chip is kept in a framebuffer on the instance. Drawing only changes the framebuffer,
+    flush() compares it with a copy of what is in the chip RAM and only sends the bytes that changed. Changed bytes
+    that are close together are sent together in one burst write.
+
+    .. testsetup::
+
+        from electronics.gateways import MockGateway
+        from electronics.devices import HT16K33, HT16K33SegmentDisplay
+        gw = MockGateway()
+
+    :Example:
+
+    >>> matrix = HT16K33(gw)
+    >>> matrix.set_brightness(8)
+    >>> # Light up the first row and a single pixel
+    >>> matrix.set_row(0, 0xffff)
+    >>> matrix.set_pixel(3, 5, True)
+    >>> # Send the changes to the chip, this returns the amount of bytes written
+    >>> matrix.flush()
+    3
+    >>> # Nothing changed so nothing is sent
+    >>> matrix.flush()
+    0
+
+    :param bus: The gateway the chip is connected to
+    :param address: The I2C address of the chip, 0x70-0x77 depending on the address pins
+    """
+    BLINK_OFF = 0
+    BLINK_2HZ = 1
+    BLINK_1HZ = 2
+    BLINK_HALFHZ = 3
+
+    CMD_SYSTEM_SETUP = 0x20
+    CMD_DISPLAY_SETUP = 0x80
+    CMD_DIMMING = 0xE0
+
+    RAM_SIZE = 16
+
+    # Changed bytes with a gap of up to this many unchanged bytes between them are sent in the same burst. Resending
+    # a few unchanged bytes is cheaper than the address and register bytes of a new transaction.
+    MERGE_GAP = 2
+
+    def __init__(self, bus, address=0x70):
+        super().__init__(bus, address)
+        self.buffer = bytearray(self.RAM_SIZE)
+        self.brightness = 15
+        self.blink = self.BLINK_OFF
+        self.enabled = True
+
+        # Copy of the display RAM on the chip, None if the contents are unknown
+        self._ram = None
+
+        # Start the oscillator
+        self.i2c_write([self.CMD_SYSTEM_SETUP | 0x01])
+        self.clear()
+        self.flush()
+        self._update_display_setup()
+        self.i2c_write([self.CMD_DIMMING | self.brightness])
+
+    def _update_display_setup(self):
+        self.i2c_write([self.CMD_DISPLAY_SETUP | (self.blink << 1) | int(self.enabled)])
+
+    def set_brightness(self, brightness):
+        """ Set the brightness of the display
+
+        :param brightness: Brightness level 0-15
+        """
+        if not 0 <= brightness <= 15:
+            raise ValueError('Brightness should be between 0 and 15')
+        self.brightness = brightness
+        self.i2c_write([self.CMD_DIMMING | brightness])
+
+    def set_blink(self, blink):
+        """ Set the blink rate of the display
+
+        :param blink: One of the BLINK_* constants
+        """
+        if blink not in [self.BLINK_OFF, self.BLINK_2HZ, self.BLINK_1HZ, self.BLINK_HALFHZ]:
+            raise ValueError('Blink should be one of the BLINK_* constants')
+        self.blink = blink
+        self._update_display_setup()
+
+    def set_enabled(self, enabled):
+        """ Turn the display on or off. The framebuffer is kept when the display is off.
+
+        :param enabled: True to turn the display on
+        """
+        self.enabled = enabled
+        self._update_display_setup()
+
+    def clear(self):
+        """ Clear the framebuffer """
+        for i in range(0, self.RAM_SIZE):
+            self.buffer[i] = 0
+
+    def set_row(self, row, value):
+        """ Set all 16 pixels in a row of the framebuffer
+
+        :param row: Row number 0-7
+        :param value: 16 bit int, bit 0 is column 0
+        """
+        self.buffer[row * 2] = value & 0xff
+        self.buffer[row * 2 + 1] = (value >> 8) & 0xff
+
+    def set_pixel(self, column, row, value):
+        """ Set a single pixel in the framebuffer
+
+        :param column: Column number 0-15
+        :param row: Row number 0-7
+        :param value: True to light up the pixel
+        """
+        index = row * 2 + (column >> 3)
+        bit = 1 << (column & 0x07)
+        if value:
+            self.buffer[index] |= bit
+        else:
+            self.buffer[index] &= ~bit & 0xff
+
+    def _dirty_runs(self):
+        if self._ram is None:
+            return [(0, self.RAM_SIZE)]
+
+        runs = []
+        start = None
+        end = None
+        for i in range(0, self.RAM_SIZE):
+            if self.buffer[i] != self._ram[i]:
+                if start is None:
+                    start = i
+                elif i - end > self.MERGE_GAP:
+                    runs.append((start, end))
+                    start = i
+                end = i + 1
+        if start is not None:
+            runs.append((start, end))
+        return runs
+
+    def flush(self):
+        """ Send the changed parts of the framebuffer to the chip
+
+        :return: The amount of bytes written to the display RAM
+        """
+        written = 0
+        for start, end in self._dirty_runs():
+            self.i2c_write_register(start, self.buffer[start:end])
+            written += end - start
+        self._ram = bytearray(self.buffer)
+        return written
+
+
+class HT16K33SegmentDisplay(object):
+    """
+    Alphanumeric display made of one or more 14 segment backpacks driven by HT16K33 chips. Every chip drives up to 8
+    characters, the text continues on the next chip in the list.
+
+    :Example:
+
+    >>> # Two 4 character backpacks chained on the same bus
+    >>> display = HT16K33SegmentDisplay([HT16K33(gw, 0x70), HT16K33(gw, 0x71)])
+    >>> display.write('pyElec')
+    >>> display.set_brightness(4)
+    >>> display.set_blink(HT16K33.BLINK_1HZ)
+
+    :param chips: List of HT16K33 instances, the first one is the leftmost
+    :param digits_per_chip: The amount of characters connected to every chip
+    :param font: Font instance for the characters, defaults to the 14 segment font
+    """
+
+    def __init__(self, chips, digits_per_chip=4, font=None):
+        self.chips = chips
+        self.digits_per_chip = digits_per_chip
+        self.digits = len(chips) * digits_per_chip
+        self.renderer = SegmentTextRenderer(font or FourteenSegmentDisplayFont(), self.digits)
+
+    def write(self, text):
+        """ Display text on the display. The text is right aligned and cut off to fit the display.
+
+        :type text: str or int
+        :param text: Text to display
+        """
+        self.show(self.renderer.render(text))
+
+    def show(self, frame):
+        """ Display a frame that is prerendered with the renderer of this display
+
+        :param frame: Tuple with the segment bitmask for every character
+        """
+        for index, value in enumerate(frame):
+            chip = self.chips[index // self.digits_per_chip]
+            digit = index % self.digits_per_chip
+            chip.buffer[digit * 2] = value & 0xff
+            chip.buffer[digit * 2 + 1] = (value >> 8) & 0xff
+        for chip in self.chips:
+            chip.flush()
+
+    def set_brightness(self, brightness):
+        """ Set the brightness of all chips
+
+        :param brightness: Brightness level 0-15
+        """
+        for chip in self.chips:
+            chip.set_brightness(brightness)
+
+    def set_blink(self, blink):
+        """ Set the blink rate of all chips
+
+        :param blink: One of the HT16K33.BLINK_* constants
+        """
+        for chip in self.chips:
+            chip.set_blink(blink)
@@ -29,8 +29,23 @@ class LM75(I2CDevice):
     def temperature(self):
         """ Get the temperature in degree celcius
         """
-        result = self.i2c_read(2)
-        value = struct.unpack('>H', result)[0]
+        if self.capabilities.i2c_raw:
+            # The pointer register is at the temperature register after power-on
+            result = self.i2c_read(2)
+        else:
+            result = self.i2c_read_register(0x00, 2)
+        return self._convert_temperature(result)
+
+    async def temperature_async(self):
+        """ Coroutine version of temperature() """
+        if self.capabilities.i2c_raw:
+            result = await self.i2c_read_async(2)
+        else:
+            result = await self.i2c_read_register_async(0x00, 2)
+        return self._convert_temperature(result)
+
+    def _convert_temperature(self, raw):
+        value = struct.unpack('>H', raw)[0]
 
         if value < 32768:
             return value / 256.0
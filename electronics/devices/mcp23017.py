@@ -1,5 +1,6 @@
 from electronics.device import I2CDevice
 from electronics.pin import GPIOPin
+from electronics.registers import Register, register_state
 import struct
 
 
@@ -76,31 +77,21 @@ class MCP23017I2C(I2CDevice):
     POLARITY_NORMAL = False
     POLARITY_INVERTED = True
 
+    # The register changes are collected and sent by sync()
+    IODIRA = Register(0x00, reset=0xff, write_through=False)
+    IODIRB = Register(0x01, reset=0xff, write_through=False)
+    IPOLA = Register(0x02, write_through=False)
+    IPOLB = Register(0x03, write_through=False)
+    GPINTENA = Register(0x04, write_through=False)
+    GPINTENB = Register(0x05, write_through=False)
+    GPPUA = Register(0x0C, write_through=False)
+    GPPUB = Register(0x0D, write_through=False)
+    GPIOA = Register(0x12, write_through=False)
+    GPIOB = Register(0x13, write_through=False)
+
     def __init__(self, bus, address=0x20):
         super().__init__(bus, address)
 
-        self.IODIRA = 0xff
-        self.IODIRB = 0xff
-        self.IPOLA = 0x00
-        self.IPOLB = 0x00
-        self.GPINTENA = 0x00
-        self.GPINTENB = 0x00
-        self.GPPUA = 0x00
-        self.GPPUB = 0x00
-        self.GPIOA = 0x00
-        self.GPIOB = 0x00
-
-        self._IODIRA = 0xff
-        self._IODIRB = 0xff
-        self._IPOLA = 0x00
-        self._IPOLB = 0x00
-        self._GPINTENA = 0x00
-        self._GPINTENB = 0x00
-        self._GPPUA = 0x00
-        self._GPPUB = 0x00
-        self._GPIOA = 0x00
-        self._GPIOB = 0x00
-
         # Set basic device configuration
         self.i2c_write_register(0x0A, [0b00100000])
         self.i2c_write_register(0x0B, [0b00100000])
@@ -157,9 +148,10 @@ class MCP23017I2C(I2CDevice):
         :return: Boolean representing the input level
         """
         port, pin = self.pin_to_port(pin)
-        self.i2c_write([0x12 + port])
-        raw = self.i2c_read(1)
-        value = struct.unpack('>B', raw)[0]
+        with self.batch():
+            self.i2c_write([0x12 + port])
+            raw = self.i2c_read(1)
+        value = struct.unpack('>B', raw.result())[0]
         return (value & (1 << pin)) > 0
 
     def read_port(self, port):
@@ -178,11 +170,20 @@ class MCP23017I2C(I2CDevice):
         :param port: use 'A' to read port A and 'B' for port b
         :return: An int where every bit represents the input level.
         """
+        raw = self.i2c_read_register(self._port_register(port), 1)
+        return struct.unpack('>B', raw)[0]
+
+    async def read_port_async(self, port):
+        """ Coroutine version of read_port() """
+        raw = await self.i2c_read_register_async(self._port_register(port), 1)
+        return struct.unpack('>B', raw)[0]
+
+    def _port_register(self, port):
         if port == 'A':
-            raw = self.i2c_read_register(0x12, 1)
+            return 0x12
         elif port == 'B':
-            raw = self.i2c_read_register(0x13, 1)
-        return struct.unpack('>B', raw)[0]
+            return 0x13
+        raise AttributeError('Port {} does not exist, use A or B'.format(port))
 
     def write(self, pin, value):
         """ Set the pin state.
@@ -212,6 +213,27 @@ class MCP23017I2C(I2CDevice):
             raise AttributeError('Port {} does not exist, use A or B'.format(port))
         self.sync()
 
+    def write_pins(self, levels):
+        """ Set the state of multiple pins at once. The pins are grouped per port and every changed port is sent in
+        the same I2C write, so a GPIOBus spanning both ports costs a single transaction.
+
+        :Example:
+
+        >>> expander = MCP23017I2C(gw)
+        >>> pins = expander.get_pins()
+        >>> expander.write_pins([(pins[0], True), (pins[8], True)])
+        >>> expander.GPIOA, expander.GPIOB
+        (1, 2)
+
+        :param levels: List of (GPIOPin, bool) tuples with pin references of this chip
+        """
+        for pin, value in levels:
+            if pin.inverted:
+                value = not value
+            port, bit = self.pin_to_port(pin.arguments['pin'])
+            self._update_register('GPIOB' if port == 1 else 'GPIOA', bit, value)
+        self.sync()
+
     def sync(self):
         """ Upload the changed registers to the chip
 
@@ -219,23 +241,19 @@ class MCP23017I2C(I2CDevice):
         You need to call this method if you modify one of the register attributes (mcp23017.IODIRA for example) or
         if you use one of the helper attributes (mcp23017.direction_A0 for example)
         """
-        registers = {
-            0x00: 'IODIRA',
-            0x01: 'IODIRB',
-            0x02: 'IPOLA',
-            0x03: 'IPOLB',
-            0x04: 'GPINTENA',
-            0x05: 'GPINTENB',
-            0x0C: 'GPPUA',
-            0x0D: 'GPPUB',
-            0x12: 'GPIOA',
-            0x13: 'GPIOB'
-        }
-        for reg in registers:
-            name = registers[reg]
-            if getattr(self, name) != getattr(self, '_' + name):
-                self.i2c_write_register(reg, [getattr(self, name)])
-                setattr(self, '_' + name, getattr(self, name))
+        state = register_state(self)
+        if 0x12 in state.dirty and 0x13 in state.dirty:
+            # IOCON.SEQOP is set, so the address pointer toggles between GPIOA and GPIOB and both fit in one write
+            del state.dirty[0x12]
+            del state.dirty[0x13]
+            self.flush_registers()
+            self.i2c_write_register(0x12, [state.values[0x12], state.values[0x13]])
+            return
+        self.flush_registers()
+
+    async def sync_async(self):
+        """ Coroutine version of sync() """
+        await self.flush_registers_async()
 
     def pin_to_port(self, pin):
         if len(pin) != 2:
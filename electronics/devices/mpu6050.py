@@ -1,5 +1,5 @@
 from electronics.device import I2CDevice
-import struct
+from electronics.registers import Register, BitField, RegisterBlock
 
 
 class MPU6050I2C(I2CDevice):
@@ -45,6 +45,17 @@ class MPU6050I2C(I2CDevice):
     RANGE_GYRO_1000DEG = 0x10
     RANGE_GYRO_2000DEG = 0x18
 
+    GYRO_CONFIG = Register(0x1b)
+    ACCEL_CONFIG = Register(0x1c)
+    INT_PIN_CFG = Register(0x37)
+    PWR_MGMT_1 = Register(0x6b, reset=0x40)
+
+    i2c_bypass_enable = BitField(INT_PIN_CFG, 1)
+
+    ACCEL_OUT = RegisterBlock(0x3B, '>HHH')
+    TEMP_OUT = RegisterBlock(0x41, '>h')
+    GYRO_OUT = RegisterBlock(0x43, '>HHH')
+
     def __init__(self, bus, address=0x68):
         self.accel_range = None
         self.gyro_range = None
@@ -69,8 +80,8 @@ class MPU6050I2C(I2CDevice):
                 )
 
         """
-        self.i2c_write_register(0x1c, accel)
-        self.i2c_write_register(0x1b, gyro)
+        self.ACCEL_CONFIG = accel
+        self.GYRO_CONFIG = gyro
         self.accel_range = accel
         self.gyro_range = gyro
 
@@ -81,21 +92,23 @@ class MPU6050I2C(I2CDevice):
         :param enable:
         :return:
         """
-        current = self.i2c_read_register(0x37, 1)[0]
-        if enable:
-            current |= 0b00000010
-        else:
-            current &= 0b11111101
-        self.i2c_write_register(0x37, current)
+        self.i2c_bypass_enable = enable
 
     def wakeup(self):
         """Wake the sensor from sleep."""
-        self.i2c_write_register(0x6b, 0x00)
+        self.PWR_MGMT_1 = 0x00
+        self.awake = True
+
+    async def wakeup_async(self):
+        """Coroutine version of wakeup()"""
+        with self.deferred_writes(flush=False):
+            self.PWR_MGMT_1 = 0x00
+        await self.flush_registers_async()
         self.awake = True
 
     def sleep(self):
         """Put the sensor back to sleep."""
-        self.i2c_write_register(0x6b, 0x01)
+        self.PWR_MGMT_1 = 0x01
         self.awake = False
 
     def temperature(self):
@@ -110,12 +123,13 @@ class MPU6050I2C(I2CDevice):
         >>> sensor.temperature()
         49.38
         """
-        if not self.awake:
-            raise Exception("MPU6050 is in sleep mode, use wakeup()")
+        self._check_awake()
+        return self._convert_temperature(self.read_block(self.TEMP_OUT))
 
-        raw = self.i2c_read_register(0x41, 2)
-        raw = struct.unpack('>h', raw)[0]
-        return round((raw / 340) + 36.53, 2)
+    async def temperature_async(self):
+        """Coroutine version of temperature()"""
+        self._check_awake()
+        return self._convert_temperature(await self.read_block_async(self.TEMP_OUT))
 
     def acceleration(self):
         """Return the acceleration in G's
@@ -129,19 +143,13 @@ class MPU6050I2C(I2CDevice):
         >>> sensor.acceleration()
         (0.6279296875, 0.87890625, 1.1298828125)
         """
-        if not self.awake:
-            raise Exception("MPU6050 is in sleep mode, use wakeup()")
+        self._check_awake()
+        return self._convert_acceleration(self.read_block(self.ACCEL_OUT))
 
-        raw = self.i2c_read_register(0x3B, 6)
-        x, y, z = struct.unpack('>HHH', raw)
-        scales = {
-            self.RANGE_ACCEL_2G: 16384,
-            self.RANGE_ACCEL_4G: 8192,
-            self.RANGE_ACCEL_8G: 4096,
-            self.RANGE_ACCEL_16G: 2048
-        }
-        scale = scales[self.accel_range]
-        return x / scale, y / scale, z / scale
+    async def acceleration_async(self):
+        """Coroutine version of acceleration()"""
+        self._check_awake()
+        return self._convert_acceleration(await self.read_block_async(self.ACCEL_OUT))
 
     def angular_rate(self):
         """Return the angular rate for every axis in degree/second.
@@ -155,11 +163,34 @@ class MPU6050I2C(I2CDevice):
         >>> sensor.angular_rate()
         (1.380859375, 1.6318359375, 1.8828125)
         """
+        self._check_awake()
+        return self._convert_angular_rate(self.read_block(self.GYRO_OUT))
+
+    async def angular_rate_async(self):
+        """Coroutine version of angular_rate()"""
+        self._check_awake()
+        return self._convert_angular_rate(await self.read_block_async(self.GYRO_OUT))
+
+    def _check_awake(self):
         if not self.awake:
             raise Exception("MPU6050 is in sleep mode, use wakeup()")
 
-        raw = self.i2c_read_register(0x43, 6)
-        x, y, z = struct.unpack('>HHH', raw)
+    def _convert_temperature(self, raw):
+        return round((raw[0] / 340) + 36.53, 2)
+
+    def _convert_acceleration(self, raw):
+        x, y, z = raw
+        scales = {
+            self.RANGE_ACCEL_2G: 16384,
+            self.RANGE_ACCEL_4G: 8192,
+            self.RANGE_ACCEL_8G: 4096,
+            self.RANGE_ACCEL_16G: 2048
+        }
+        scale = scales[self.accel_range]
+        return x / scale, y / scale, z / scale
+
+    def _convert_angular_rate(self, raw):
+        x, y, z = raw
         scales = {
             self.RANGE_GYRO_250DEG: 16384,
             self.RANGE_GYRO_500DEG: 8192,
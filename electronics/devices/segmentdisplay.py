@@ -1,8 +1,51 @@
+import threading
+import time
+
 from electronics.device import GPIODevice
 from electronics.gpio import GPIOBus
 
 
-class SevenSegmentDisplayFont(object):
+class SegmentDisplayFont(object):
+    """ Base class for the segment display fonts.
+
+    The font is defined as a dict that maps characters to segment bitmasks. The first time the font is used it's
+    compiled into a flat table indexed by the code point of the character, after that a lookup is a single index
+    operation instead of converting and hashing a string. Uppercase letters are folded to lowercase when the table is
+    compiled, so every display shows the same glyph for a letter regardless of its case.
+    """
+    font = {}
+
+    # Compiled lookup table, shared by all instances of a font class
+    _table = None
+
+    @classmethod
+    def table(cls):
+        """ Get the compiled font as a tuple indexed by code point. Characters that are not in the font are None. """
+        if cls.__dict__.get('_table') is None:
+            table = [None] * 128
+            for code in range(0, 128):
+                table[code] = cls.font.get(chr(code).lower())
+            cls._table = tuple(table)
+        return cls._table
+
+    def lookup(self, char):
+        """ Get the segment bitmask for a single character
+
+        :type char: str or int
+        :param char: Character to look up, ints 0-9 are looked up as the digit
+        """
+        if isinstance(char, int):
+            char = str(char)
+        try:
+            value = self.table()[ord(char)]
+        except (IndexError, TypeError):
+            value = None
+        if value is None:
+            raise KeyError('Character {} is not in the font'.format(repr(char)))
+        return value
+
+
+class SevenSegmentDisplayFont(SegmentDisplayFont):
     font = {
         '0': 0b01110111,
         '1': 0b00100100,
@@ -48,7 +91,7 @@ class SevenSegmentDisplayFont(object):
         return self.font[str(item).lower()]
 
 
-class FourteenSegmentDisplayFont(object):
+class FourteenSegmentDisplayFont(SegmentDisplayFont):
     font = {
         '0': 0b0000110000111111,
         '1': 0b0000000000000110,
@@ -150,6 +193,92 @@ class FourteenSegmentDisplayFont(object):
         return self.font[str(item)]
 
 
+class SegmentTextRenderer(object):
+    """ Render text into frames for a multi-digit segment display.
+
+    A frame is a tuple with a value for every digit. The characters are looked up in a compiled font table once and
+    the complete sequence of frames for scrolling is built up front, so an animation only has to push the precomputed
+    values to the port.
+
+    If select_offset is set then every value also has the bit for its digit select set, starting at that bit
+    offset. This is the format MultiplexedSegmentDisplayGPIO writes to its port.
+
+    .. testsetup::
+
+        from electronics.devices import SegmentTextRenderer, SevenSegmentDisplayFont
+
+    :Example:
+
+    >>> renderer = SegmentTextRenderer(SevenSegmentDisplayFont(), 4)
+    >>> renderer.render('42')
+    (0, 0, 46, 93)
+    >>> renderer.render('HI') == renderer.render('hi')
+    True
+    >>> frames = renderer.scroll('hi')
+    >>> len(frames)
+    7
+    >>> frames[3]
+    (0, 62, 18, 0)
+
+    :param font: Font instance to render the characters with
+    :param digits: Number of digits on the display
+    :param select_offset: Bit offset of the first digit select bit or None to render only the segments
+    """
+
+    def __init__(self, font, digits, select_offset=None):
+        self.font = font
+        self.digits = digits
+        if select_offset is None:
+            self.selects = (0,) * digits
+        else:
+            self.selects = tuple(1 << (select_offset + i) for i in range(0, digits))
+
+    def _codes(self, text):
+        return [self.font.lookup(char) for char in text]
+
+    def render(self, text):
+        """ Render text into a single frame. The text is right aligned and cut off to fit the display.
+
+        :type text: str or int
+        :param text: Text to render
+        :return: Tuple with a value for every digit
+        """
+        text = str(text).rjust(self.digits)
+        codes = self._codes(text[0:self.digits])
+        return tuple(code | select for code, select in zip(codes, self.selects))
+
+    def scroll(self, text, marquee=False):
+        """ Render the frames for text scrolling from the right side of the display to the left.
+
+        :param text: Text to scroll
+        :param marquee: If True the frames form a loop where the start of the text follows the end after a gap
+        :return: List of frames
+        """
+        gap = ' ' * self.digits
+        if marquee:
+            codes = self._codes(str(text) + gap)
+            count = len(codes)
+            codes = codes + codes[0:self.digits]
+        else:
+            codes = self._codes(gap + str(text) + gap)
+            count = len(codes) - self.digits + 1
+
+        frames = []
+        for start in range(0, count):
+            window = codes[start:start + self.digits]
+            frames.append(tuple(code | select for code, select in zip(window, self.selects)))
+        return frames
+
+
+def _font_for_width(width):
+    if width == 7:
+        return SevenSegmentDisplayFont()
+    elif width == 14:
+        return FourteenSegmentDisplayFont()
+    else:
+        raise AttributeError('Incorrect number of pins supplied, use 7 or 14 pins')
+
+
 class SegmentDisplayGPIO(GPIODevice):
     """Class for driving a single character 7 or 14 segment display connected to GPIO pins
 
@@ -169,7 +298,7 @@ class SegmentDisplayGPIO(GPIODevice):
     .. testsetup::
 
         from electronics.gateways import MockGateway
-        from electronics.devices import SevenSegmentGPIO
+        from electronics.devices import SegmentDisplayGPIO
         from electronics.devices import MCP23017I2C
         gw = MockGateway()
 
@@ -184,6 +313,8 @@ class SegmentDisplayGPIO(GPIODevice):
     >>> display.write(6)
     >>> # Letters are also supported
     >>> display.write('h')
+    >>> display.glyphs['H'] == display.glyphs['h']
+    True
 
     """
 
@@ -194,19 +325,163 @@ class SegmentDisplayGPIO(GPIODevice):
 
         if isinstance(segments, list):
             segments = GPIOBus(segments)
-        if segments.width == 7:
-            self.font = SevenSegmentDisplayFont()
-        if segments.width == 14:
-            self.font = FourteenSegmentDisplayFont()
-        else:
-            raise AttributeError('Incorrect number of pins supplied, use 7 or 14 pins')
+        self.font = _font_for_width(segments.width)
         self.segments = segments
 
+        # Every character the display accepts mapped to its segments, so write() is a single dict lookup
+        table = self.font.table()
+        self.glyphs = {}
+        for code in range(0, 128):
+            value = table[code]
+            if value is not None:
+                self.glyphs[chr(code)] = value
+        for digit in range(0, 10):
+            self.glyphs[digit] = self.glyphs[str(digit)]
+
     def write(self, char):
-        """ Display a single character on the display
+        """ Display a single character on the display. Uppercase letters are shown as their lowercase glyph.
 
         :type char: str or int
         :param char: Character to display
         """
-        char = str(char).lower()
-        self.segments.write(self.font[char])
+        self.segments.write(self.glyphs[char])
+
+
+class MultiplexedSegmentDisplayGPIO(GPIODevice):
+    """Class for driving a multiplexed multi-digit 7 or 14 segment display connected to GPIO pins
+
+    The segment pins of all digits are connected together and every digit has its own select pin (the common anode or
+    cathode). Only one digit is lit at a time, a background thread scans through the digits fast enough that they all
+    appear to be lit.
+
+    The segment pins and digit select pins are combined into one bus so every digit in the scan costs a single port
+    write that sets the segments and the digit select at the same time. On a port expander like the MCP23017 that is
+    a single I2C transaction per digit, so the segments of one digit never show up on its neighbour. The segments use
+    the same pin order as SegmentDisplayGPIO. Use the invert operator (~) on the digit select pins if your display
+    has common anodes.
+
+    The text is rendered into a complete frame before it is handed to the refresh thread, the thread keeps scanning
+    the previous frame until the new one is done. Updating the text never stalls the refresh.
+
+    .. testsetup::
+
+        from electronics.gateways import SimulatedGateway
+        from electronics.gateways.models import MCP23017Model
+        from electronics.devices import MultiplexedSegmentDisplayGPIO
+        from electronics.devices import MCP23017I2C
+        gw = SimulatedGateway()
+        chip = gw.attach(0x20, MCP23017Model())
+
+    :Example:
+
+    >>> expander = MCP23017I2C(gw)
+    >>> expander.IODIRA = 0x00
+    >>> expander.IODIRB = 0x00
+    >>> expander.sync()
+    >>> pins = expander.get_pins()
+    >>> # 7 segment pins and 4 digit select pins
+    >>> display = MultiplexedSegmentDisplayGPIO(pins[0:7], pins[7:11])
+    >>> display.write(1337)
+    >>> display.frame
+    (164, 365, 621, 1063)
+    >>> # Scan all digits once, this is what the refresh thread does continuously
+    >>> metrics = gw.enable_metrics()
+    >>> display.refresh()
+    >>> # Every digit is a single I2C transaction
+    >>> metrics.transactions
+    4
+    >>> chip.outputs(0), chip.outputs(1)
+    (39, 8)
+    >>> # Start and stop the background refresh thread
+    >>> display.start() # doctest: +SKIP
+    >>> display.write('h1') # doctest: +SKIP
+    >>> display.stop() # doctest: +SKIP
+
+    :param segments: List of segment pins or GPIOBus instance
+    :param digits: List of digit select pins, the first pin is the leftmost digit
+    :param refresh_rate: Number of times per second every digit is lit
+    """
+
+    def __init__(self, segments, digits, refresh_rate=100):
+        if isinstance(segments, GPIOBus):
+            segments = segments.pins
+        self.font = _font_for_width(len(segments))
+        self.width = len(segments)
+        self.digits = len(digits)
+        self.port = GPIOBus(list(segments) + list(digits))
+        self.refresh_rate = refresh_rate
+
+        # Number of digit slots where the refresh thread was more than a full slot late
+        self.late_slots = 0
+
+        self.renderer = SegmentTextRenderer(self.font, self.digits, select_offset=self.width)
+        self.frame = (0,) * self.digits
+        self._thread = None
+        self._stop = threading.Event()
+
+    def write(self, text):
+        """ Display text on the display. The text is cut off or padded with spaces to fit the amount of digits.
+
+        :type text: str or int
+        :param text: Text to display
+        """
+        self.show(self.renderer.render(text))
+
+    def show(self, frame):
+        """ Display a frame that is prerendered with the renderer of this display.
+
+        :Example:
+
+        >>> display = MultiplexedSegmentDisplayGPIO(pins[0:7], pins[7:11])
+        >>> frames = display.renderer.scroll('hello')
+        >>> for frame in frames:
+        ...     display.show(frame)
+        ...     time.sleep(0.2) # doctest: +SKIP
+
+        :param frame: Tuple with a port value for every digit
+        """
+        # Swapping the reference is atomic, the refresh thread finishes scanning the previous frame
+        self.frame = frame
+
+    def refresh(self):
+        """ Scan through all digits once. This is called continuously by the refresh thread, you only have to call it
+        yourself if you don't use start()
+        """
+        for value in self.frame:
+            self.port.write(value)
+
+    def start(self):
+        """ Start the background thread that refreshes the display """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._refresh_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """ Stop the refresh thread and blank the display """
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.port.write(0)
+
+    def _refresh_loop(self):
+        slot = 1.0 / (self.refresh_rate * self.digits)
+        deadline = time.monotonic()
+        while not self._stop.is_set():
+            # Keep a reference to the frame so a write() halfway the scan doesn't tear the frame
+            frame = self.frame
+            for value in frame:
+                self.port.write(value)
+
+                # Sleep until an absolute deadline so the time spent writing doesn't add up as drift
+                deadline += slot
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    self._stop.wait(delay)
+                elif delay < -slot:
+                    # Don't try to catch up after a stall, that would flash the digits in a burst
+                    self.late_slots += 1
+                    deadline = time.monotonic()
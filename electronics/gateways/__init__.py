@@ -1,5 +1,40 @@
-import platform
-from .buspirate import *
-if not platform.system() is "Windows":
-    from .linuxdevice import *
-from .mock import *
+""" The gateways are imported on first use, so a gateway only needs its own dependencies: the BusPirate needs pyserial
+and the LinuxDevice needs smbus. A wildcard import loads all gateways. """
+import importlib
+
+# Name of every public class and the module it is in
+_EXPORTS = {
+    'BusPirate': 'buspirate',
+    'LinuxDevice': 'linuxdevice',
+    'MockGateway': 'mock',
+    'AsyncGateway': 'aio',
+    'AsyncLinuxDevice': 'aio',
+    'AsyncBusPirate': 'aio',
+    'SimulatedGateway': 'simulator',
+    'RegisterModel': 'simulator',
+    'OneWireModel': 'simulator',
+    'VirtualClock': 'timing',
+    'TimingModel': 'timing',
+    'BusPirateTiming': 'timing',
+    'LinuxTiming': 'timing',
+    'RecordingGateway': 'replay',
+    'ReplayGateway': 'replay',
+    'LogRecord': 'replay',
+    'read_log': 'replay',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError('module {} has no attribute {}'.format(__name__, name))
+    value = getattr(importlib.import_module('.' + module, __name__), name)
+    # Cache it in the module so the next lookup doesn't come here
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
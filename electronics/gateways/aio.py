@@ -0,0 +1,134 @@
+import asyncio
+import concurrent.futures
+
+__all__ = ['AsyncGateway', 'AsyncLinuxDevice', 'AsyncBusPirate']
+
+
+class AsyncGateway(object):
+    """ Asyncio interface for a blocking gateway.
+
+    Every transaction runs in a worker thread that belongs to this gateway, so the transactions on one bus stay in
+    order while the event loop keeps running. Gateways for different buses each have their own worker and run at the
+    same time. The ``*_async`` i2c methods have the same arguments as the blocking gateway methods but are coroutines.
+    The blocking methods are still available, they wait for the worker thread. Devices use them for the setup in their
+    constructor.
+
+    Devices use an async gateway through their ``*_async`` methods, for example ``LM75.temperature_async()``.
+
+    .. testsetup::
+
+        import asyncio
+        from electronics.gateways import MockGateway, AsyncGateway
+        from electronics.devices import LM75, MPU6050I2C
+
+    :Example:
+
+    >>> gw = AsyncGateway(MockGateway())
+    >>> sensor = LM75(gw)
+    >>> sixaxis = MPU6050I2C(gw)
+    >>> async def poll():
+    ...     await sixaxis.wakeup_async()
+    ...     return await asyncio.gather(sensor.temperature_async(), sixaxis.acceleration_async())
+    >>> asyncio.run(poll())
+    [1.0078125, (0.376953125, 0.6279296875, 0.87890625)]
+
+    :param gateway: The blocking gateway instance
+    """
+    def __init__(self, gateway):
+        self.gateway = gateway
+        self.capabilities = gateway.capabilities
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    def _run(self, method, *args):
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(self.executor, method, *args)
+
+    def _call(self, method, *args):
+        return self.executor.submit(method, *args).result()
+
+    async def i2c_read_async(self, address, length):
+        return await self._run(self.gateway.i2c_read, address, length)
+
+    async def i2c_write_async(self, address, data):
+        return await self._run(self.gateway.i2c_write, address, data)
+
+    async def i2c_read_register_async(self, address, register, length):
+        return await self._run(self.gateway.i2c_read_register, address, register, length)
+
+    async def i2c_write_register_async(self, address, register, data):
+        return await self._run(self.gateway.i2c_write_register, address, register, data)
+
+    async def i2c_transfer_async(self, transactions):
+        return await self._run(self.gateway.i2c_transfer, transactions)
+
+    def i2c_read(self, address, length):
+        return self._call(self.gateway.i2c_read, address, length)
+
+    def i2c_write(self, address, data):
+        return self._call(self.gateway.i2c_write, address, data)
+
+    def i2c_read_register(self, address, register, length):
+        return self._call(self.gateway.i2c_read_register, address, register, length)
+
+    def i2c_write_register(self, address, register, data):
+        return self._call(self.gateway.i2c_write_register, address, register, data)
+
+    def i2c_transfer(self, transactions):
+        return self._call(self.gateway.i2c_transfer, transactions)
+
+    def close(self):
+        """ Stop the worker thread and close the gateway """
+        self.executor.shutdown()
+        if hasattr(self.gateway, 'close'):
+            self.gateway.close()
+
+
+class AsyncLinuxDevice(AsyncGateway):
+    """ Asyncio interface for a Linux i2c bus, the ioctls run in a worker thread for this bus.
+
+    :Example:
+
+    >>> from electronics.gateways import AsyncLinuxDevice
+    >>> gw = AsyncLinuxDevice(1) # doctest: +SKIP
+
+    :param i2c_bus_index: The number of the i2c bus.
+    """
+
+    def __init__(self, i2c_bus_index):
+        from electronics.gateways.linuxdevice import LinuxDevice
+        super().__init__(LinuxDevice(i2c_bus_index))
+
+
+class AsyncBusPirate(AsyncGateway):
+    """ Asyncio interface for the Bus Pirate.
+
+    The transactions run in the worker thread of this gateway with the blocking BusPirate code, so they hold the lock
+    of the BusPirate instance, are split in groups of PIPELINE_DEPTH transactions and never block the event loop
+    while waiting for the serial port. The blocking methods can be mixed with the coroutines, the lock keeps the
+    commands and responses on the serial port in order.
+
+    Use the open() coroutine to create an instance:
+
+    >>> from electronics.gateways import AsyncBusPirate
+    >>> gw = await AsyncBusPirate.open('/dev/ttyUSB0') # doctest: +SKIP
+    >>> # The blocking BusPirate instance is available for the configuration
+    >>> gw.pirate.pullup = True # doctest: +SKIP
+
+    :param pirate: A connected BusPirate instance
+    """
+    def __init__(self, pirate):
+        super().__init__(pirate)
+        self.pirate = pirate
+
+    @classmethod
+    async def open(cls, device, baud=115200):
+        """ Connect to a Bus Pirate without blocking the event loop
+
+        :param device: The path to the unix device created when plugging in the Bus Pirate.
+        :param baud: The Bus Pirate baudrate
+        :return: AsyncBusPirate instance
+        """
+        from electronics.gateways.buspirate import BusPirate
+        loop = asyncio.get_running_loop()
+        pirate = await loop.run_in_executor(None, BusPirate, device, baud)
+        return cls(pirate)
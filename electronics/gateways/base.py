@@ -0,0 +1,189 @@
+import copy
+import functools
+import itertools
+import threading
+
+from electronics.batch import execute_sequential, READ, READ_REGISTER
+from electronics.gateways.metrics import MeteredGateway
+
+# Guards the lazy creation of the gateway locks
+_lock_guard = threading.Lock()
+
+
+class GatewayCapabilities(object):
+    """ Describes what a gateway can do and how expensive it is. Drivers and helpers use this to pick the fastest way
+    to talk to a device instead of assuming the slowest common path.
+
+    .. testsetup::
+
+        from electronics.gateways import MockGateway
+        gw = MockGateway()
+
+    :Example:
+
+    >>> gw.capabilities
+    <GatewayCapabilities i2c i2c_raw i2c_block i2c_combined i2c_bulk max_transfer=None>
+    >>> # Estimate how long three 6 byte register reads take
+    >>> gw.capabilities.estimate(3, 18)
+    0.0
+
+    :param i2c: Supports reading and writing registers on I2C devices
+    :param i2c_raw: Supports i2c_read and i2c_write without register address
+    :param i2c_block: Reads and writes of multiple registers are done in a single transaction instead of a transaction
+                      for every byte
+    :param i2c_combined: Register reads use a repeated start between writing the register address and reading the data
+    :param i2c_bulk: i2c_transfer is faster than executing the transactions one by one
+    :param max_transfer: Maximum amount of data bytes in a single transaction or None for no limit
+    :param spi: Supports SPI transfers
+    :param onewire: Supports 1-Wire transactions, see electronics.onewire
+    :param transaction_cost: Estimated fixed overhead of a single transaction in seconds
+    :param byte_cost: Estimated time to transfer a single data byte in seconds
+    """
+
+    def __init__(self, i2c=True, i2c_raw=False, i2c_block=False, i2c_combined=False, i2c_bulk=False, max_transfer=None,
+                 spi=False, transaction_cost=0.0, byte_cost=0.0, onewire=False):
+        self.i2c = i2c
+        self.i2c_raw = i2c_raw
+        self.i2c_block = i2c_block
+        self.i2c_combined = i2c_combined
+        self.i2c_bulk = i2c_bulk
+        self.max_transfer = max_transfer
+        self.spi = spi
+        self.onewire = onewire
+        self.transaction_cost = transaction_cost
+        self.byte_cost = byte_cost
+
+    def estimate(self, transactions, data_bytes):
+        """ Estimate the time it takes to execute transactions one by one
+
+        :param transactions: Amount of transactions
+        :param data_bytes: Total amount of data bytes in the transactions
+        :return: Estimated time in seconds
+        """
+        return transactions * self.transaction_cost + data_bytes * self.byte_cost
+
+    def __repr__(self):
+        flags = []
+        for name in ['i2c', 'i2c_raw', 'i2c_block', 'i2c_combined', 'i2c_bulk', 'spi', 'onewire']:
+            if getattr(self, name):
+                flags.append(name)
+        return '<GatewayCapabilities {} max_transfer={}>'.format(' '.join(flags), self.max_transfer)
+
+
+def synchronized(method):
+    """ Decorator for gateway methods that have to run without other threads using the gateway at the same time """
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+def coalesced(method):
+    """ Decorator for the i2c read methods of a gateway. The read holds the gateway lock and identical reads that were
+    waiting for the lock while it ran get a copy of its result instead of reading again. The result is from a
+    transaction that started after they were called, so they never get older data than they would have otherwise.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, *args):
+        if not self.coalesce_reads:
+            with self.lock:
+                return method(self, *args)
+
+        lock = self.lock
+        key = (method.__name__,) + args
+        called = next(self._sequence)
+        with lock:
+            previous = self._completed.get(key)
+            if previous is not None and previous[0] > called:
+                return copy.copy(previous[1])
+            started = next(self._sequence)
+            result = method(self, *args)
+            # Keep a copy, the caller is allowed to modify its result
+            self._completed[key] = (started, copy.copy(result))
+            return result
+
+    return wrapper
+
+
+class Gateway(MeteredGateway):
+    """ Base class for gateways.
+
+    Subclasses implement the i2c methods and describe themselves with the capabilities attribute. The base class
+    provides a sequential i2c_transfer so every gateway can execute a batch, gateways with a faster bulk path
+    override it and set i2c_bulk in their capabilities.
+
+    Gateways can be shared between threads. Every transaction and every i2c_transfer() holds the lock of the gateway
+    so the transactions of different threads don't interleave. Use the lock yourself to run several transactions
+    without other threads in between:
+
+    .. code-block:: python
+
+        with gateway.lock:
+            sensor.i2c_write_register(0xF4, 0x2E)
+            raw = sensor.i2c_read_register(0xF6, 2)
+
+    Identical reads from different threads that wait for the bus at the same time are executed once and share the
+    result. Set coalesce_reads to False on gateways with devices where every read has to reach the device, like a
+    FIFO that is read by multiple threads.
+
+    Subclasses use the synchronized decorator on methods that change the state of the gateway and the coalesced
+    decorator on the i2c read methods.
+    """
+    capabilities = GatewayCapabilities(i2c=False)
+
+    # Execute identical concurrent reads once, see coalesced()
+    coalesce_reads = True
+
+    @property
+    def lock(self):
+        """ The reentrant lock that is held during every transaction """
+        state = self.__dict__
+        if '_lock' not in state:
+            # Created on first use so subclasses don't have to call the constructor of this class
+            with _lock_guard:
+                if '_lock' not in state:
+                    state['_completed'] = {}
+                    state['_sequence'] = itertools.count()
+                    state['_lock'] = threading.RLock()
+        return state['_lock']
+
+    def i2c_read(self, address, length):
+        raise NotImplementedError()
+
+    def i2c_write(self, address, data):
+        raise NotImplementedError()
+
+    def i2c_read_register(self, address, register, length):
+        raise NotImplementedError()
+
+    def i2c_write_register(self, address, register, data):
+        raise NotImplementedError()
+
+    @synchronized
+    def i2c_transfer(self, transactions):
+        """ Execute a list of transactions and return the results
+
+        :param transactions: List of electronics.batch.I2CTransaction instances
+        :return: List with the result for every transaction, None for writes
+        """
+        return execute_sequential(self, transactions)
+
+    def estimate_transfer(self, transactions):
+        """ Estimate the time it takes to execute a list of transactions on this gateway
+
+        :param transactions: List of electronics.batch.I2CTransaction instances
+        :return: Estimated time in seconds
+        """
+        data_bytes = 0
+        for transaction in transactions:
+            if transaction.kind == READ or transaction.kind == READ_REGISTER:
+                data_bytes += transaction.payload
+            elif isinstance(transaction.payload, int):
+                data_bytes += 1
+            else:
+                data_bytes += len(transaction.payload)
+        return self.capabilities.estimate(len(transactions), data_bytes)
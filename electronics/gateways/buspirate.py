@@ -1,8 +1,16 @@
+import contextlib
+import sys
+import threading
+import time
 import serial
-from electronics.pin import DigitalOutputPin
+from electronics.pin import DigitalOutputPin, AnalogInputPin
+from electronics.batch import I2CTransaction, execute_sequential, READ, WRITE, READ_REGISTER, WRITE_REGISTER
+from electronics.gateways.base import Gateway, GatewayCapabilities, synchronized, coalesced
+from electronics.gateways.metrics import metered, metered_transfer, BusMetrics
+from electronics.onewire import OneWireTransaction
 
 
-class BusPirate(object):
+class BusPirate(Gateway):
     """
     Class for using a Bus Pirate as I2C, GPIO or SPI or UART gateway. The code uses the Bus Pirate in bitbang mode
     (This doesn't mean the pins are bitbanged but that the communication is in binary mode instead of an ascii shell)
@@ -10,6 +18,7 @@ class BusPirate(object):
     devices probably work.
 
     :example:
+
     >>> from electronics.gateways import BusPirate
     >>> # Open the Bus Pirate at the first USB-serial port
     >>> gw = BusPirate("/dev/ttyUSB0") # doctest: +SKIP
@@ -19,9 +28,11 @@ class BusPirate(object):
     The Bus Pirate supports multiple modes. This module will make sure the Bus Pirate is in the correct mode as soon
     as you use a read or write command. You can specify the peripheral configuration as attributes on the gateway
     instance. The configuration will be applied when switching the Bus Pirate mode. You can also switch the peripheral
-    configuration at runtime with the set_peripheral command.
+    configuration at runtime with the set_peripheral command. The gateway keeps track of the configuration of the
+    adapter and only sends the commands that change something.
 
     :example:
+
     >>> from electronics.gateways import BusPirate
     >>> from electronics.devices import LM75
     >>> # Open the Bus Pirate
@@ -37,8 +48,39 @@ class BusPirate(object):
     >>> gw.set_peripheral(pullup=False, aux=True) # doctest: +SKIP
     >>> # The pullup is now  disabled and the aux pin set to VCC
 
+    Connecting only takes a few milliseconds when the Bus Pirate is still in a binary mode from a previous session,
+    the gateway detects the current mode instead of starting over from the user terminal. The configuration left over
+    from that session is replaced with the configuration of the gateway on the first command. Pass the mode and the
+    peripheral configuration to the constructor to enter the mode while connecting, the mode switch and the
+    configuration are sent in a single write so the first transaction doesn't have to wait for them.
+
+    :example:
+
+    >>> gw = BusPirate("/dev/ttyUSB0", mode=BusPirate.MODE_I2C, power=True, pullup=True,
+    ...                i2c_speed='400kHz') # doctest: +SKIP
+    >>> gw.mode == BusPirate.MODE_I2C # doctest: +SKIP
+    True
+
+    i2c_transfer(), used by I2CDevice.batch(), can send the commands of multiple transactions in a single serial
+    write so the USB round trip is only paid once per group. The firmware of the Bus Pirate v3 only has a 4 byte
+    receive FIFO and loses the commands that arrive while it is busy with a transaction, so this is disabled by
+    default. Set PIPELINE_DEPTH on the instance to enable it for firmware that buffers its input, or for short
+    transactions on a fast bus where the FIFO keeps up.
+
+    :example:
+
+    >>> gw = BusPirate("/dev/ttyUSB0") # doctest: +SKIP
+    >>> gw.PIPELINE_DEPTH = 16 # doctest: +SKIP
+
     :param device: The path to the unix device created when plugging in the Bus Pirate.
     :param baud: The Bus Pirate baudrate. The default is 115200
+    :param debug: Check the status of every write then read command before sending the data
+    :param mode: Mode to enter while connecting, one of the MODE_* constants. None to stay in the current mode
+    :param power: Enable the power supply
+    :param pullup: Enable the internal pull-up resistors
+    :param aux: The AUX pin output state
+    :param chip_select: The CS pin output state
+    :param i2c_speed: One of '400kHz', '100kHz', '50kHz' or '5kHz', None for the default of the Bus Pirate
     """
 
     MODE_RAW = 0
@@ -47,59 +89,280 @@ class BusPirate(object):
     MODE_UART = 3
     MODE_ONEWIRE = 4
 
-    def __init__(self, device, baud=115200, debug=False):
+    # Maximum amount of transactions sent in one serial write by i2c_transfer(). The Bus Pirate v3 firmware polls a 4
+    # byte UART FIFO and drops the commands that arrive while it is busy on the bus, so the default waits for the
+    # response of every transaction. See the class documentation to opt in to pipelining.
+    PIPELINE_DEPTH = 1
+
+    # Every transaction is a round trip over the USB-serial adapter, the data bytes go over the serial port at 115200
+    # baud. The write then read command is limited by the 4096 byte buffer in the Bus Pirate.
+    capabilities = GatewayCapabilities(i2c=True, i2c_raw=True, i2c_block=True, i2c_combined=True, i2c_bulk=True,
+                                       max_transfer=4096, transaction_cost=0.002, byte_cost=10 / 115200,
+                                       onewire=True)
+
+    I2C_SPEEDS = {
+        '400kHz': 400000,
+        '100kHz': 100000,
+        '50kHz': 50000,
+        '5kHz': 5000,
+    }
+
+    # Answers to the version command in every binary mode, a Bus Pirate in raw mode enters SPI mode on this command
+    MODE_BANNERS = {
+        b'SPI1': MODE_SPI,
+        b'I2C1': MODE_I2C,
+        b'ART1': MODE_UART,
+        b'1W01': MODE_ONEWIRE,
+    }
+
+    # The user terminal enters binary mode after 20 zero bytes
+    SYNC_BYTES = 20
+
+    # Time in seconds to wait for the answer to the mode probe and the maximum time for the binary mode sync
+    PROBE_TIMEOUT = 0.02
+    SYNC_TIMEOUT = 1.0
+
+    # The ADC is 10 bits and measures through a divider by 2 from the 3.3V reference, so the range is 0 to 6.6V
+    ADC_MAX = 1024
+    ADC_VOLTAGE = 6.6
+
+    # Returning to raw mode resets the pins and turns the power supplies off, this is the peripheral byte for that
+    PERIPHERAL_RESET = 0x40
+
+    def __init__(self, device, baud=115200, debug=False, mode=None, power=False, pullup=False, aux=False,
+                 chip_select=False, i2c_speed=None):
         self.device = serial.Serial(device, baud)
         self.mode = self.MODE_RAW
         self.debug = debug
 
-        self.pullup = False
-        self.power = False
-        self.aux = False
-        self.chip_select = False
-        self.i2c_speed = None  # default
-
-        for i in range(0, 20):
-            self.device.timeout = 0.1
-            self.device.write(b"\x00")
-            try:
-                if self.device.read(5) == b"BBIO1":
-                    break
-            except TimeoutError:
-                print("Timeout")
-        else:
-            raise Exception("Could not initialize BusPirate in binary mode")
+        self.pullup = pullup
+        self.power = power
+        self.aux = aux
+        self.chip_select = chip_select
+        self.i2c_speed = i2c_speed  # None is the default of the Bus Pirate
+
+        # UART settings from uart_config(), None for the defaults of the Bus Pirate
+        self.uart_baud = None
+        self.uart_framing = None
+
+        # The config the adapter actually has, None when it is unknown. Commands that wouldn't change it are skipped.
+        self._forget_config()
+
+        # The active UART stream and whether the Bus Pirate is stuck in bridge mode until it is reset
+        self._uart_stream = None
+        self._bridged = False
+
+        # Commands queued inside pipeline() and the amount of acks they will send back
+        self._pipeline_depth = 0
+        self._queued = bytearray()
+        self._queued_acks = 0
+
+        self.mode = self._sync()
         self.device.timeout = 1
-        self.device.flushInput()
-        self.device.flushOutput()
-        
+        if mode is not None and mode == self.mode:
+            # Still in the right mode from a previous session, only the peripheral config has to be applied
+            self._apply_config()
+        elif mode is not None:
+            self.switch_mode(mode)
+
+    def _sync(self):
+        """ Get the Bus Pirate in a binary mode and find out which mode it is in
+
+        :return: One of the MODE_* constants
+        """
+        device = self.device
+        device.reset_input_buffer()
+
+        # A Bus Pirate that is still in a binary mode answers the version command of that mode immediately
+        device.timeout = self.PROBE_TIMEOUT
+        device.write(b'\x01')
+        mode = self.MODE_BANNERS.get(device.read(4))
+        if mode is not None:
+            return mode
+
+        # The user terminal or an unknown state. A burst of zero bytes gets the terminal in binary mode and a binary
+        # mode back to raw mode. Every zero byte after that is answered with another BBIO1.
+        device.reset_input_buffer()
+        device.write(b'\x00' * self.SYNC_BYTES)
+        received = bytearray()
+        deadline = time.monotonic() + self.SYNC_TIMEOUT
+        while b'BBIO1' not in received:
+            if time.monotonic() > deadline:
+                raise Exception("Could not initialize BusPirate in binary mode")
+            received += device.read(max(device.in_waiting, 1))
+
+        # Drop the answers to the remaining zero bytes, the line is in sync when nothing arrives within the timeout
+        while device.read(max(device.in_waiting, 1)):
+            pass
+        return self.MODE_RAW
+
+    def _write(self, packet):
+        """ Write to the Bus Pirate. The commands queued in a pipeline go first in the same write and their acks are
+        checked before the answers to the packet are read.
+        """
+        acks = self._queued_acks
+        if acks:
+            packet = self._queued + packet
+            self._queued = bytearray()
+            self._queued_acks = 0
+        self.device.write(packet)
+        if acks:
+            self._check_acks(acks)
+
+    def _check_acks(self, acks):
+        response = self.device.read(acks)
+        if response != b"\x01" * acks:
+            self._forget_config()
+            raise Exception("Setting peripheral failed. Received: {}".format(repr(response)))
+
+    def _forget_config(self, peripheral=None):
+        self._applied_peripheral = peripheral
+        self._applied_speed = None
+        self._applied_uart_speed = None
+        self._applied_uart_framing = None
+
+    def _peripheral_byte(self):
+        peripheral_byte = 64
+        if self.chip_select:
+            peripheral_byte |= 0x01
+        if self.aux:
+            peripheral_byte |= 0x02
+        if self.pullup:
+            peripheral_byte |= 0x04
+        if self.power:
+            peripheral_byte |= 0x08
+        return peripheral_byte
+
+    def _config_packet(self, mode):
+        """ The commands that change the peripheral config and the I2C speed of the adapter in a mode. Every command
+        is answered with a single ack byte.
+        """
+        packet = bytearray()
+        if mode == self.MODE_RAW:
+            # Raw bitbang mode uses other commands for the pins, the config is applied when a mode is entered
+            return packet
+        peripheral_byte = self._peripheral_byte()
+        if peripheral_byte != self._applied_peripheral:
+            packet.append(peripheral_byte)
+        if mode == self.MODE_I2C and self.i2c_speed and self.i2c_speed != self._applied_speed:
+            packet.append(self._speed_byte(self.i2c_speed))
+        if mode == self.MODE_UART:
+            if self.uart_baud is not None and self.uart_baud != self._applied_uart_speed:
+                packet.append(0b01100000 | self.UART_SPEEDS[self.uart_baud])
+            if self.uart_framing is not None and self.uart_framing != self._applied_uart_framing:
+                packet.append(self.uart_framing)
+        return packet
+
+    def _config_applied(self, mode):
+        if mode == self.MODE_RAW:
+            return
+        self._applied_peripheral = self._peripheral_byte()
+        if mode == self.MODE_I2C and self.i2c_speed and self.i2c_speed != self._applied_speed:
+            self._applied_speed = self.i2c_speed
+            self._i2c_speed_changed()
+        if mode == self.MODE_UART:
+            self._applied_uart_speed = self.uart_baud
+            self._applied_uart_framing = self.uart_framing
+
+    def _apply_config(self):
+        """ Send the config commands that change something. Inside pipeline() they are queued for the next write. """
+        packet = self._config_packet(self.mode)
+        if not packet:
+            return
+        self._queued += packet
+        self._queued_acks += len(packet)
+        self._config_applied(self.mode)
+        if not self._pipeline_depth:
+            self._write(bytearray())
+
+    @contextlib.contextmanager
+    def pipeline(self):
+        """ Queue the peripheral and I2C speed changes instead of waiting for the ack of every command. The queued
+        commands are sent in front of the next I2C command, like the i2c_transfer() of a batch, or when the block is
+        left. This makes the aux and chip select pins usable around a batch without extra round trips.
+
+        :example:
+
+        >>> gw = BusPirate("/dev/ttyUSB0", mode=BusPirate.MODE_I2C) # doctest: +SKIP
+        >>> cs = gw.get_chip_select_pin() # doctest: +SKIP
+        >>> sensor = LM75(gw) # doctest: +SKIP
+        >>> with gw.pipeline(): # doctest: +SKIP
+        ...     cs.write(True)
+        ...     with sensor.batch():
+        ...         raw = sensor.i2c_read(2)
+        ...     cs.write(False)
+        """
+        with self.lock:
+            self._pipeline_depth += 1
+        try:
+            yield self
+        finally:
+            with self.lock:
+                self._pipeline_depth -= 1
+                if not self._pipeline_depth and self._queued_acks:
+                    self._write(bytearray())
+
+    @synchronized
     def close(self):
         """disconnect from the hardware and make it available again."""
         self.device.close()
-        
+
+    @synchronized
     def switch_mode(self, new_mode):
-        """ Explicitly switch the Bus Pirate mode
+        """ Explicitly switch the Bus Pirate mode. The mode commands only work in raw mode, so the Bus Pirate returns
+        to raw mode first. The mode switch and the peripheral configuration are sent in a single write. If the Bus
+        Pirate is already in the mode only the changed configuration is sent.
 
         :param new_mode: The mode to switch to. Use the buspirate.MODE_* constants
         """
-        packet = bytearray()
-        packet.append(new_mode)
-        self.device.write(packet)
+        if self._bridged:
+            raise Exception("The Bus Pirate is in UART bridge mode, it has to be reset to use other modes")
+        if self._uart_stream is not None and new_mode != self.mode:
+            raise Exception("Close the UART stream before switching modes")
+        if new_mode == self.mode:
+            self._apply_config()
+            return
+
         possible_responses = {
             self.MODE_I2C: b'I2C1',
             self.MODE_RAW: b'BBIO1',
-            self.MODE_SPI: b'API1',
+            self.MODE_SPI: b'SPI1',
             self.MODE_UART: b'ART1',
             self.MODE_ONEWIRE: b'1W01'
         }
         expected = possible_responses[new_mode]
-        response = self.device.read(4)
-        if response != expected:
+        packet = bytearray()
+        response = bytearray()
+        if self.mode != self.MODE_RAW:
+            packet.append(0x00)
+            response += b'BBIO1'
+        if new_mode != self.MODE_RAW:
+            packet.append(new_mode)
+            response += expected
+        # The configuration of the previous mode is gone after the return to raw mode
+        self._forget_config(self.PERIPHERAL_RESET)
+        config = self._config_packet(new_mode)
+        self._write(packet + config)
+        received = self.device.read(len(response))
+        if received != response:
+            if received.startswith(b'BBIO1'):
+                self.mode = self.MODE_RAW
             raise Exception('Could not switch mode')
         self.mode = new_mode
-        self.set_peripheral()
-        if self.i2c_speed:
-            self._set_i2c_speed(self.i2c_speed)
+        if config:
+            self._check_acks(len(config))
+        self._config_applied(new_mode)
+
+    def _enter_mode(self, mode):
+        """ Switch to a mode before a command for that mode. A Bus Pirate that is still in the mode from a previous
+        session has an unknown configuration, the configuration of the gateway is applied on the first command.
+        """
+        if self.mode != mode:
+            self.switch_mode(mode)
+        elif self._applied_peripheral is None:
+            self._apply_config()
 
+    @synchronized
     def set_peripheral(self, power=None, pullup=None, aux=None, chip_select=None):
         """ Set the peripheral config at runtime.
         If a parameter is None then the config will not be changed.
@@ -109,6 +372,10 @@ class BusPirate(object):
         :param aux: Set the AUX pin output state
         :param chip_select: Set the CS pin output state
         """
+        if self._bridged:
+            raise Exception("The Bus Pirate is in UART bridge mode, it has to be reset to change the peripherals")
+        if self._uart_stream is not None:
+            raise Exception("Close the UART stream before changing the peripherals, the acks would mix with the data")
         if power is not None:
             self.power = power
         if pullup is not None:
@@ -117,78 +384,134 @@ class BusPirate(object):
             self.aux = aux
         if chip_select is not None:
             self.chip_select = chip_select
-        # Set peripheral status
-        peripheral_byte = 64
-        if self.chip_select:
-            peripheral_byte |= 0x01
-        if self.aux:
-            peripheral_byte |= 0x02
-        if self.pullup:
-            peripheral_byte |= 0x04
-        if self.power:
-            peripheral_byte |= 0x08
-
-        self.device.write(bytearray([peripheral_byte]))
-        response = self.device.read(1)
-        if response != b"\x01":
-            raise Exception("Setting peripheral failed. Received: {}".format(repr(response)))
+        self._apply_config()
 
+    @synchronized
     def i2c_write_then_read(self, data, read_length):
+        packet = self._write_then_read_header(data, read_length)
+        self._write(packet)
+
+        if self.debug:
+            status = self.device.read(1)
+            if status == b'\x00':
+                raise Exception('Read or write out of bounds')
+
+        self.device.write(bytearray(data))
+        return self._write_then_read_response(read_length)
+
+    def _write_then_read_header(self, data, read_length):
         packet = bytearray()
         # Write then read mode
         packet.append(0x08)
 
         # Write data length
-        packet.append(0x00)
-        packet.append(len(data))
+        packet.append(len(data) >> 8)
+        packet.append(len(data) & 0xff)
 
         # Read data length
-        packet.append(0x00)
-        packet.append(read_length)
-
-        self.device.write(packet)
+        packet.append(read_length >> 8)
+        packet.append(read_length & 0xff)
+        return packet
 
-        if self.debug:
-            status = self.device.read(1)
-            if status == b'\x00':
-                raise Exception('Read or write out of bounds')
-
-        self.device.write(bytearray(data))
-        response = self.device.read(read_length + 1)
-        if response[0] == 0x00:
+    def _write_then_read_response(self, read_length):
+        status = self.device.read(1)
+        if status == b'\x00':
             raise Exception('No ack from device')
+        if status != b'\x01':
+            raise Exception('Unknown response: {}'.format(repr(status)))
+        return self.device.read(read_length)
+
+    def _i2c_payload(self, transaction):
+        if transaction.kind == READ:
+            return [(transaction.address << 1) | 0b00000001], transaction.payload
+        if transaction.kind == READ_REGISTER:
+            return [(transaction.address << 1) | 0b00000001, transaction.register], transaction.payload
 
-        if response[0] == 0x01:
-            return response[1:]
+        payload = [transaction.address << 1]
+        if transaction.kind == WRITE_REGISTER:
+            payload.append(transaction.register)
+        if isinstance(transaction.payload, int):
+            payload.append(transaction.payload)
         else:
-            raise Exception('Unknown response: {}'.format(repr(response)))
+            payload.extend(transaction.payload)
+        return payload, 0
 
+    @coalesced
+    @metered(BusMetrics.READ, register=False)
     def i2c_read(self, address, length):
-        if self.mode != self.MODE_I2C:
-            self.switch_mode(self.MODE_I2C)
-        read_address = (address << 1) | 0b00000001
-        return self.i2c_write_then_read([read_address], length)
+        self._enter_mode(self.MODE_I2C)
+        return self.i2c_write_then_read(*self._i2c_payload(I2CTransaction(READ, address, None, length)))
 
+    @synchronized
+    @metered(BusMetrics.WRITE, register=False)
     def i2c_write(self, address, data):
-        if self.mode != self.MODE_I2C:
-            self.switch_mode(self.MODE_I2C)
-        write_address = (address << 1)
-        out = bytearray([write_address]) + bytearray(data)
-        self.i2c_write_then_read(out, 0)
+        self._enter_mode(self.MODE_I2C)
+        self.i2c_write_then_read(*self._i2c_payload(I2CTransaction(WRITE, address, None, data)))
 
+    @coalesced
+    @metered(BusMetrics.READ)
     def i2c_read_register(self, address, register, length):
-        if self.mode != self.MODE_I2C:
-            self.switch_mode(self.MODE_I2C)
-        read_address = (address << 1) | 0b00000001
-        return self.i2c_write_then_read([read_address, register], length)
+        self._enter_mode(self.MODE_I2C)
+        return self.i2c_write_then_read(*self._i2c_payload(I2CTransaction(READ_REGISTER, address, register, length)))
 
+    @synchronized
+    @metered(BusMetrics.WRITE)
     def i2c_write_register(self, address, register, data):
-        if self.mode != self.MODE_I2C:
-            self.switch_mode(self.MODE_I2C)
-        write_address = address << 1
-        payload = [write_address, register]
-        payload.extend(data)
-        self.i2c_write_then_read(payload, 0)
+        self._enter_mode(self.MODE_I2C)
+        self.i2c_write_then_read(*self._i2c_payload(I2CTransaction(WRITE_REGISTER, address, register, data)))
+
+    @synchronized
+    @metered_transfer
+    def i2c_transfer(self, transactions):
+        """ Execute a list of transactions with pipelining. The commands for a group of PIPELINE_DEPTH transactions
+        are sent in a single serial write and the responses are read afterwards, so the USB round trip is only paid
+        once per group instead of for every transaction. This is used by I2CDevice.batch().
+
+        :param transactions: List of electronics.batch.I2CTransaction instances
+        :return: List with the result for every transaction, None for writes
+        """
+        self._enter_mode(self.MODE_I2C)
+        if self.debug:
+            # Debug mode checks the status after every header, that can't be pipelined
+            return execute_sequential(self, transactions)
+
+        results = []
+        for offset in range(0, len(transactions), self.PIPELINE_DEPTH):
+            group = transactions[offset:offset + self.PIPELINE_DEPTH]
+            packet = bytearray()
+            read_lengths = []
+            for transaction in group:
+                data, read_length = self._i2c_payload(transaction)
+                packet += self._write_then_read_header(data, read_length)
+                packet += bytearray(data)
+                read_lengths.append(read_length)
+            self._write(packet)
+
+            # Read all responses before raising so the stream stays in sync
+            error = None
+            for transaction, read_length in zip(group, read_lengths):
+                try:
+                    response = self._write_then_read_response(read_length)
+                except Exception as e:
+                    error = error or e
+                    response = None
+                if transaction.kind == READ or transaction.kind == READ_REGISTER:
+                    results.append(response)
+                else:
+                    results.append(None)
+            if error is not None:
+                raise error
+        return results
+
+    def estimate_transfer(self, transactions):
+        """ Estimate the time i2c_transfer() takes, the round trip is only paid once for every pipelined group
+
+        :param transactions: List of electronics.batch.I2CTransaction instances
+        :return: Estimated time in seconds
+        """
+        groups = (len(transactions) + self.PIPELINE_DEPTH - 1) // self.PIPELINE_DEPTH
+        per_transaction = super().estimate_transfer(transactions)
+        return per_transaction - (len(transactions) - groups) * self.capabilities.transaction_cost
 
     def get_aux_pin(self):
         """ Get reference to the aux output on the Bus Pirate
@@ -202,25 +525,506 @@ class BusPirate(object):
         """
         return DigitalOutputPin(self, '_write_cs')
 
+    def get_adc_pin(self):
+        """ Get reference to the ADC input on the Bus Pirate. The ADC only works in raw mode, the Bus Pirate leaves
+        the current mode for the measurement and enters it again on the next command for that mode. See
+        read_adc_raw() for the effect on the power supply and the pull-ups.
+
+        :return: AnalogInputPin instance, read() returns the level between 0 and 1 of the 0 to 6.6V range
+        """
+        return AnalogInputPin(self, '_read_adc_pin', name='ADC')
+
+    def _read_adc_pin(self):
+        return self.read_adc_raw() / self.ADC_MAX
+
+    def _enter_adc_mode(self):
+        """ Switch to raw mode for the ADC. The return to raw mode resets the pins, which turns the power supply and
+        the pull-ups off. The returned commands turn them back on, send them in front of the ADC command. Every
+        command is answered with a byte with the state of the pins.
+        """
+        if self.mode == self.MODE_RAW:
+            return bytearray()
+        self.switch_mode(self.MODE_RAW)
+        if not (self.power or self.pullup or self.aux or self.chip_select):
+            return bytearray()
+        # AUX and CS as outputs, the other pins are inputs like after the reset
+        packet = bytearray([0b01001110])
+        pins = 0b10000000
+        if self.power:
+            pins |= 0x40
+        if self.pullup:
+            pins |= 0x20
+        if self.aux:
+            pins |= 0x10
+        if self.chip_select:
+            pins |= 0x01
+        packet.append(pins)
+        return packet
+
+    @synchronized
+    def read_adc_raw(self):
+        """ Take a single measurement with the ADC
+
+        The ADC only works in raw mode. Switching to raw mode resets the pins of the Bus Pirate, so the power supply,
+        the pull-ups and the aux and chip select outputs are off until the gateway turns them back on in the same
+        write as the measurement. Attached devices see a supply dip of about one USB round trip, a device that
+        resets on a brownout has to be set up again afterwards. The next command for the previous mode enters that
+        mode again with the peripheral configuration of the gateway.
+
+        :return: The raw 10 bit value
+        """
+        packet = self._enter_adc_mode()
+        self._write(packet + b'\x14')
+        response = self.device.read(len(packet) + 2)[len(packet):]
+        if len(response) != 2:
+            raise Exception("No ADC measurement received")
+        return (response[0] << 8) | response[1]
+
+    def read_adc(self):
+        """ Take a single measurement with the ADC
+
+        :return: The voltage on the ADC pin
+        """
+        return self.read_adc_raw() * self.ADC_VOLTAGE / self.ADC_MAX
+
+    @synchronized
+    def adc_stream(self, buffer):
+        """ Fill a buffer with samples from the continuous measurement mode of the ADC. The Bus Pirate sends samples
+        as fast as the serial port allows and they are read directly into the buffer, so the buffer is allocated
+        once and can be reused for every capture.
+
+        The buffer can be anything with the buffer interface: an array.array('H') or a numpy array with the uint16
+        dtype gets the raw 10 bit values, a numpy array with the '>u2' dtype or a bytearray gets the samples in the
+        big endian format of the Bus Pirate. Multiply the raw values by ADC_VOLTAGE / ADC_MAX for the voltage. Like
+        read_adc_raw() this switches to raw mode, with the same short interruption of the power supply and pull-ups.
+
+        :example:
+
+        >>> import array
+        >>> gw = BusPirate("/dev/ttyUSB0") # doctest: +SKIP
+        >>> samples = array.array('H', [0]) * 1000
+        >>> gw.adc_stream(samples) # doctest: +SKIP
+        1000
+        >>> # The same with numpy
+        >>> import numpy # doctest: +SKIP
+        >>> samples = numpy.zeros(1000, dtype=numpy.uint16) # doctest: +SKIP
+        >>> gw.adc_stream(samples) # doctest: +SKIP
+        1000
+        >>> volts = samples * (BusPirate.ADC_VOLTAGE / BusPirate.ADC_MAX) # doctest: +SKIP
+
+        :param buffer: Writable contiguous buffer, it is filled completely
+        :return: The amount of samples
+        """
+        native = memoryview(buffer)
+        # The samples arrive big endian, native 16 bit buffers are swapped afterwards
+        swap = sys.byteorder == 'little' and native.format in ('H', '=H', '<H')
+        view = native.cast('B')
+        if len(view) % 2:
+            raise ValueError('The buffer size has to be a multiple of 2 bytes')
+
+        packet = self._enter_adc_mode()
+        self._write(packet + b'\x15')
+        if len(self.device.read(len(packet))) != len(packet):
+            raise Exception("No response to the pin configuration")
+        received = 0
+        try:
+            while received < len(view):
+                count = self.device.readinto(view[received:])
+                if not count:
+                    raise Exception("The ADC stream stopped after {} bytes".format(received))
+                received += count
+        finally:
+            # Any byte stops the stream, drop the samples that were already underway
+            self.device.write(b'\x00')
+            self.device.timeout = self.PROBE_TIMEOUT
+            while self.device.read(max(self.device.in_waiting, 1)):
+                pass
+            self.device.timeout = 1
+
+        if swap:
+            view[0::2], view[1::2] = view[1::2].tobytes(), view[0::2].tobytes()
+        return len(view) // 2
+
+    UART_SPEEDS = {
+        300: 0,
+        1200: 1,
+        2400: 2,
+        4800: 3,
+        9600: 4,
+        19200: 5,
+        31250: 6,
+        38400: 7,
+        57600: 8,
+        115200: 10,
+    }
+
+    UART_FORMATS = {
+        (8, 'N'): 0,
+        (8, 'E'): 1,
+        (8, 'O'): 2,
+        (9, 'N'): 3,
+    }
+
+    # Maximum amount of data bytes in a bulk write command in UART and 1-Wire mode
+    BULK_CHUNK = 16
+
+    # Maximum amount of bytes sent ahead of the answers in UART and 1-Wire mode, the size of the receive FIFO of the
+    # firmware
+    FIFO_WINDOW = 4
+
+    def _stream_commands(self, packet):
+        """ Send commands that are answered with one byte for every byte, like the bulk writes in UART and 1-Wire
+        mode. The firmware polls a 4 byte receive FIFO while it is busy on the bus, so no more than FIFO_WINDOW bytes
+        are sent ahead of the answers.
+
+        :return: The answers, None when the Bus Pirate stopped answering
+        """
+        answers = bytearray()
+        sent = 0
+        while len(answers) < len(packet):
+            end = min(len(answers) + self.FIFO_WINDOW, len(packet))
+            if end > sent:
+                self._write(packet[sent:end])
+                sent = end
+            answer = self.device.read(1)
+            if not answer:
+                return None
+            answers += answer
+            # Collect the answers that arrived together so the next write can refill the whole window
+            waiting = min(self.device.in_waiting, sent - len(answers))
+            if waiting:
+                answers += self.device.read(waiting)
+        return answers
+
+    @synchronized
+    def uart_config(self, baud=115200, data_bits=8, parity='N', stop_bits=1, open_drain=False, idle_low=False):
+        """ Configure the UART. The settings are sent when the Bus Pirate is in UART mode, otherwise when it enters
+        UART mode.
+
+        :param baud: One of the speeds in UART_SPEEDS
+        :param data_bits: 8 or 9
+        :param parity: 'N', 'E' or 'O'. 9 data bits only work without parity
+        :param stop_bits: 1 or 2
+        :param open_drain: Use open drain outputs instead of 3.3V outputs, the pull-ups or an external pull-up supply
+                           the high level
+        :param idle_low: Invert the receive polarity, the line is low when idle
+        """
+        if baud not in self.UART_SPEEDS:
+            raise ValueError('Invalid baud')
+        if (data_bits, parity) not in self.UART_FORMATS:
+            raise ValueError('Invalid data_bits and parity combination')
+        if stop_bits not in (1, 2):
+            raise ValueError('Invalid stop_bits')
+        if self._uart_stream is not None:
+            raise Exception("Close the UART stream before changing the UART config, the acks would mix with the data")
+        framing = 0b10000000 | (self.UART_FORMATS[(data_bits, parity)] << 2)
+        if not open_drain:
+            framing |= 0x10
+        if stop_bits == 2:
+            framing |= 0x02
+        if idle_low:
+            framing |= 0x01
+        self.uart_baud = baud
+        self.uart_framing = framing
+        if self.mode == self.MODE_UART and not self._bridged:
+            self._apply_config()
+
+    @synchronized
+    def uart_write(self, data):
+        """ Send data over the UART. The data is split in bulk write commands of 16 bytes that are streamed to the Bus
+        Pirate at most FIFO_WINDOW bytes ahead of the acks, so the receive FIFO of the firmware doesn't overflow
+        while it is busy sending at a low baudrate.
+
+        :param data: bytes or list of ints
+        """
+        if self._bridged:
+            # Everything written in bridge mode goes straight to the UART
+            self.device.write(bytes(data))
+            return
+        if self._uart_stream is not None:
+            raise Exception("Close the UART stream before writing, the echoed data would mix with the acks")
+        self._enter_mode(self.MODE_UART)
+        data = bytes(data)
+        packet = bytearray()
+        for start in range(0, len(data), self.BULK_CHUNK):
+            chunk = data[start:start + self.BULK_CHUNK]
+            packet.append(0b00010000 | (len(chunk) - 1))
+            packet += chunk
+        # The command and every data byte are acked
+        response = self._stream_commands(packet)
+        if response != b"\x01" * len(packet):
+            raise Exception("UART write failed. Received: {}".format(repr(response)))
+
+    @synchronized
+    def uart_stream(self, size=65536):
+        """ Start receiving UART data. The Bus Pirate echoes everything it receives on the UART to the serial port
+        and a background thread collects it in a ring buffer. Writing to the UART is not possible while the stream
+        is open because the acks of the commands can't be told apart from the data, use uart_bridge() for that.
+
+        :example:
+
+        >>> gw = BusPirate("/dev/ttyUSB0") # doctest: +SKIP
+        >>> gw.uart_config(baud=9600) # doctest: +SKIP
+        >>> stream = gw.uart_stream() # doctest: +SKIP
+        >>> line = stream.read(64, timeout=1.0) # doctest: +SKIP
+        >>> stream.close() # doctest: +SKIP
+
+        :param size: Size of the ring buffer in bytes. When it is full the oldest data is dropped.
+        :return: UARTStream instance
+        """
+        if self._uart_stream is not None:
+            raise Exception("The UART stream is already open")
+        self._enter_mode(self.MODE_UART)
+        # Start echoing the received data
+        self._write(b'\x02')
+        response = self.device.read(1)
+        if response != b"\x01":
+            raise Exception("Starting the UART echo failed. Received: {}".format(repr(response)))
+        self._uart_stream = UARTStream(self, size)
+        return self._uart_stream
+
+    @synchronized
+    def uart_bridge(self, size=65536):
+        """ Put the Bus Pirate in transparent UART bridge mode. Everything written to the serial port goes out on the
+        UART at full line rate and the received data is collected by a background thread. The Bus Pirate can only
+        leave bridge mode by a reset, after this the gateway can't use other modes anymore.
+
+        :example:
+
+        >>> gw = BusPirate("/dev/ttyUSB0") # doctest: +SKIP
+        >>> gw.uart_config(baud=115200) # doctest: +SKIP
+        >>> bridge = gw.uart_bridge() # doctest: +SKIP
+        >>> bridge.write(b'AT\\r\\n') # doctest: +SKIP
+        >>> reply = bridge.read(timeout=0.5) # doctest: +SKIP
+
+        :param size: Size of the ring buffer in bytes. When it is full the oldest data is dropped.
+        :return: UARTStream instance
+        """
+        if self._uart_stream is not None:
+            raise Exception("The UART stream is already open")
+        self._enter_mode(self.MODE_UART)
+        self._write(b'\x0f')
+        self._bridged = True
+        self._uart_stream = UARTStream(self, size)
+        return self._uart_stream
+
+    def _uart_stream_closed(self):
+        with self.lock:
+            self._uart_stream = None
+            if self._bridged:
+                return
+            # Stop the echo and drop the data that was underway, it can't be told apart from the ack
+            self.device.write(b'\x03')
+            self.device.timeout = self.PROBE_TIMEOUT
+            while self.device.read(max(self.device.in_waiting, 1)):
+                pass
+            self.device.timeout = 1
+
+    @synchronized
+    def onewire_transfer(self, transactions):
+        """ Execute a list of 1-Wire transactions. The commands for all transactions are streamed to the Bus Pirate
+        while the answers come back, like i2c_transfer() this only pays the USB round trip a few times for a string
+        of sensors instead of for every byte.
+
+        Every byte sent in 1-Wire mode is answered with one byte once it is done on the bus, which takes about 0.5ms
+        per 1-Wire byte. The firmware polls a 4 byte receive FIFO, so no more than FIFO_WINDOW bytes are sent
+        ahead of the answers.
+
+        :param transactions: List of electronics.onewire.OneWireTransaction instances
+        :return: List with the read bytes for every transaction, None when nothing was read
+        """
+        self._enter_mode(self.MODE_ONEWIRE)
+        packet = bytearray()
+        responses = []
+        for transaction in transactions:
+            # The reset, every bulk write command, every written byte and every read byte command get one answer
+            if transaction.reset:
+                packet.append(0x02)
+            data = bytes(transaction.data)
+            for start in range(0, len(data), self.BULK_CHUNK):
+                chunk = data[start:start + self.BULK_CHUNK]
+                packet.append(0b00010000 | (len(chunk) - 1))
+                packet += chunk
+            # The read byte command
+            packet += b'\x04' * transaction.read_length
+            responses.append((len(packet), transaction.read_length))
+
+        answers = self._stream_commands(packet)
+        if answers is None:
+            raise Exception("No response from the Bus Pirate in 1-Wire mode")
+
+        results = []
+        for end, read_length in responses:
+            results.append(bytes(answers[end - read_length:end]) if read_length else None)
+        return results
+
+    def onewire_reset(self):
+        """ Send a reset pulse on the 1-Wire bus """
+        self.onewire_transfer([OneWireTransaction(True, b'', 0)])
+
+    def onewire_write(self, data):
+        """ Write bytes to the 1-Wire bus
+
+        :param data: bytes or list of ints
+        """
+        self.onewire_transfer([OneWireTransaction(False, data, 0)])
+
+    def onewire_read(self, length):
+        """ Read bytes from the 1-Wire bus
+
+        :param length: Amount of bytes
+        :return: bytes
+        """
+        return self.onewire_transfer([OneWireTransaction(False, b'', length)])[0]
+
+    @synchronized
+    def onewire_search(self, alarm=False):
+        """ Find the ROM codes of the devices on the 1-Wire bus with the search macro of the Bus Pirate
+
+        :example:
+
+        >>> gw = BusPirate("/dev/ttyUSB0", mode=BusPirate.MODE_ONEWIRE, power=True, pullup=True) # doctest: +SKIP
+        >>> [rom.hex() for rom in gw.onewire_search()] # doctest: +SKIP
+        ['28ff641e0f3a5c86', '28ff1a2b0f3a5c49']
+
+        :param alarm: Only find the devices with an alarm condition
+        :return: List with the 8 byte ROM code of every device
+        """
+        self._enter_mode(self.MODE_ONEWIRE)
+        self._write(b'\x09' if alarm else b'\x08')
+        response = self.device.read(1)
+        if response != b"\x01":
+            raise Exception("1-Wire search failed. Received: {}".format(repr(response)))
+        roms = []
+        while True:
+            rom = self.device.read(8)
+            if len(rom) != 8:
+                raise Exception("1-Wire search stopped after {} devices".format(len(roms)))
+            if rom == b'\xff' * 8:
+                return roms
+            roms.append(rom)
+
     def _write_aux(self, value):
         self.set_peripheral(aux=value)
 
     def _write_cs(self, value):
         self.set_peripheral(chip_select=value)
 
+    SPEED_BITS = {
+        '400kHz': 3,
+        '100kHz': 2,
+        '50kHz': 1,
+        '5kHz': 0,
+    }
+
+    def _speed_byte(self, i2c_speed):
+        if i2c_speed not in self.SPEED_BITS:
+            raise ValueError('Invalid i2c_speed')
+        return 0b01100000 | self.SPEED_BITS[i2c_speed]
+
+    def _i2c_speed_changed(self):
+        self.i2c_clock_hz = self.I2C_SPEEDS[self.i2c_speed]
+        if self.metrics is not None:
+            self.metrics.clock_hz = self.i2c_clock_hz
+
+    @synchronized
     def _set_i2c_speed(self, i2c_speed):
-        """ Set I2C speed to one of '400kHz', '100kHz', 50kHz', '5kHz'
+        """ Set I2C speed to one of '400kHz', '100kHz', 50kHz', '5kHz'. Outside I2C mode the speed is set when the
+        Bus Pirate enters I2C mode.
         """
-        lower_bits_mapping = {
-            '400kHz': 3,
-            '100kHz': 2,
-            '50kHz': 1,
-            '5kHz': 0,
-        }
-        if i2c_speed not in lower_bits_mapping:
-            raise ValueError('Invalid i2c_speed')
-        speed_byte = 0b01100000 | lower_bits_mapping[i2c_speed]
-        self.device.write(bytearray([speed_byte]))
-        response = self.device.read(1)
-        if response != b"\x01":
-            raise Exception("Changing I2C speed failed. Received: {}".format(repr(response)))
+        self._speed_byte(i2c_speed)
+        self.i2c_speed = i2c_speed
+        self._apply_config()
+
+
+class UARTStream(object):
+    """ Collects the UART data a Bus Pirate forwards in a background thread. The data is kept in a ring buffer that
+    is allocated once, reads return everything that is available up to the requested size instead of waiting for
+    single bytes. Use BusPirate.uart_stream() or BusPirate.uart_bridge() to create it.
+
+    :param gateway: The BusPirate instance
+    :param size: Size of the ring buffer in bytes
+    """
+
+    # Time in seconds the reader waits for data before it checks if it has to stop
+    POLL_TIMEOUT = 0.05
+
+    def __init__(self, gateway, size=65536):
+        self.gateway = gateway
+        self.size = size
+        # Amount of bytes that were dropped because the ring buffer was full
+        self.overruns = 0
+
+        self._buffer = bytearray(size)
+        self._start = 0
+        self._count = 0
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+
+        gateway.device.timeout = self.POLL_TIMEOUT
+        self._thread = threading.Thread(target=self._reader, daemon=True)
+        self._thread.start()
+
+    def _reader(self):
+        device = self.gateway.device
+        while not self._stop.is_set():
+            data = device.read(max(device.in_waiting, 1))
+            if data:
+                self._put(data)
+
+    def _put(self, data):
+        size = self.size
+        with self._condition:
+            if len(data) > size:
+                self.overruns += len(data) - size
+                data = data[-size:]
+            dropped = self._count + len(data) - size
+            if dropped > 0:
+                # Overwrite the oldest data
+                self.overruns += dropped
+                self._start = (self._start + dropped) % size
+                self._count -= dropped
+            end = (self._start + self._count) % size
+            first = min(len(data), size - end)
+            self._buffer[end:end + first] = data[:first]
+            self._buffer[0:len(data) - first] = data[first:]
+            self._count += len(data)
+            self._condition.notify_all()
+
+    def available(self):
+        """ Get the amount of bytes that can be read without waiting """
+        return self._count
+
+    def read(self, size=None, timeout=None):
+        """ Get the received data. Waits until data is available, returns everything that is available up to size.
+
+        :param size: Maximum amount of bytes, None for all available data
+        :param timeout: Maximum time in seconds to wait for data, None to wait until it arrives
+        :return: bytes, empty when the timeout expired
+        """
+        with self._condition:
+            if not self._count:
+                self._condition.wait_for(lambda: self._count or self._stop.is_set(), timeout)
+            length = self._count if size is None else min(size, self._count)
+            start = self._start
+            first = min(length, self.size - start)
+            data = bytes(self._buffer[start:start + first]) + bytes(self._buffer[0:length - first])
+            self._start = (start + length) % self.size
+            self._count -= length
+            return data
+
+    def write(self, data):
+        """ Send data over the UART, only possible in bridge mode """
+        self.gateway.uart_write(data)
+
+    def close(self):
+        """ Stop the background reader. In echo mode the Bus Pirate stops echoing and can be used for other modes
+        again, data that is still underway is dropped.
+        """
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join()
+        with self._condition:
+            self._condition.notify_all()
+        self.gateway._uart_stream_closed()
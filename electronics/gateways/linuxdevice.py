@@ -1,42 +1,198 @@
+import ctypes
+import fcntl
+import os
 import smbus
-import struct
+from electronics.batch import I2CTransaction, execute_sequential, READ, WRITE, READ_REGISTER, WRITE_REGISTER
+from electronics.gateways.base import Gateway, GatewayCapabilities, synchronized, coalesced
+from electronics.gateways.metrics import metered, metered_transfer, BusMetrics
 
+# From linux/i2c-dev.h and linux/i2c.h
+I2C_FUNCS = 0x0705
+I2C_RDWR = 0x0707
+I2C_M_RD = 0x0001
+I2C_RDWR_IOCTL_MAX_MSGS = 42
+I2C_FUNC_I2C = 0x00000001
+I2C_FUNC_SMBUS_READ_I2C_BLOCK = 0x04000000
+I2C_FUNC_SMBUS_WRITE_I2C_BLOCK = 0x08000000
+I2C_SMBUS_BLOCK_MAX = 32
 
-class LinuxDevice(object):
+
+class _I2CMessage(ctypes.Structure):
+    _fields_ = [
+        ('addr', ctypes.c_uint16),
+        ('flags', ctypes.c_uint16),
+        ('len', ctypes.c_uint16),
+        ('buf', ctypes.c_char_p),
+    ]
+
+
+class _I2CRdwrData(ctypes.Structure):
+    _fields_ = [
+        ('msgs', ctypes.POINTER(_I2CMessage)),
+        ('nmsgs', ctypes.c_uint32),
+    ]
+
+
+class LinuxDevice(Gateway):
     """
     Class for using a i2c master that is supported by a Linux kernel module. An example is the internal smbus in a
     computer motherboard (supported by i2c-dev) or the i2c connection on the Raspberry Pi (supported by i2c-bcm2708).
     Linux gives every i2c bus a number. For the Raspberry Pi 2 this is "1"
 
+    The capabilities of the adapter are queried from the kernel. Adapters that support plain I2C (like the Raspberry
+    Pi) use the I2C_RDWR ioctl so a register read is a single system call and single transaction. SMBus-only adapters
+    use SMBus block transfers of up to 32 bytes if they support them and fall back to a transaction per byte.
+
     :example:
+
     >>> from electronics.gateways import LinuxDevice
     >>> # Open /dev/i2c-1
     >>> gw = LinuxDevice(1) # doctest: +SKIP
+    >>> gw.capabilities # doctest: +SKIP
+    <GatewayCapabilities i2c i2c_raw i2c_block i2c_combined i2c_bulk max_transfer=8192>
 
     :param i2c_bus_index: The number of the i2c bus.
     """
 
+    # The kernel limits a single I2C_RDWR message to 8192 bytes
+    MAX_MESSAGE_LENGTH = 8192
+
     def __init__(self, i2c_bus_index):
         self.i2c_index = i2c_bus_index
         self.bus = smbus.SMBus(i2c_bus_index)
+        self._fd = os.open('/dev/i2c-{}'.format(i2c_bus_index), os.O_RDWR)
+
+        functionality = ctypes.c_ulong()
+        fcntl.ioctl(self._fd, I2C_FUNCS, functionality)
+        self.functionality = functionality.value
+        self.plain_i2c = bool(self.functionality & I2C_FUNC_I2C)
+        self.block_read = bool(self.functionality & I2C_FUNC_SMBUS_READ_I2C_BLOCK)
+        self.block_write = bool(self.functionality & I2C_FUNC_SMBUS_WRITE_I2C_BLOCK)
+
+        # A transaction costs a system call, the bytes go over the bus at the 100kHz default clock
+        if self.plain_i2c:
+            self.capabilities = GatewayCapabilities(i2c=True, i2c_raw=True, i2c_block=True, i2c_combined=True,
+                                                    i2c_bulk=True, max_transfer=self.MAX_MESSAGE_LENGTH,
+                                                    transaction_cost=0.0001, byte_cost=9 / self.i2c_clock_hz)
+        else:
+            self.capabilities = GatewayCapabilities(i2c=True, i2c_block=self.block_read, i2c_combined=True,
+                                                    max_transfer=I2C_SMBUS_BLOCK_MAX if self.block_read else None,
+                                                    transaction_cost=0.0001, byte_cost=9 / self.i2c_clock_hz)
 
+    @synchronized
+    def close(self):
+        """ Close the i2c bus """
+        self.bus.close()
+        os.close(self._fd)
+
+    @synchronized
+    @metered(BusMetrics.WRITE)
     def i2c_write_register(self, address, register, data):
         if isinstance(data, int):
             data = [data]
-        for b in data:
-            self.bus.write_byte_data(address, register, b)
+        if self.plain_i2c:
+            self._transfer([I2CTransaction(WRITE_REGISTER, address, register, data)])
+        elif self.block_write:
+            data = list(data)
+            for offset in range(0, len(data), I2C_SMBUS_BLOCK_MAX):
+                chunk = data[offset:offset + I2C_SMBUS_BLOCK_MAX]
+                self.bus.write_i2c_block_data(address, register + offset, chunk)
+        else:
+            for offset, b in enumerate(data):
+                self.bus.write_byte_data(address, register + offset, b)
 
+    @coalesced
+    @metered(BusMetrics.READ)
     def i2c_read_register(self, address, register, length):
-        result = b""
-        for r in range(register, register + length):
-            value = self.bus.read_byte_data(address, r)
-            # smbus module uses struct.unpack('@b') but almost nothing is a signed byte with native ordening...
-            temp = struct.pack('@b', value)
-            result += temp
-        return result
+        if self.plain_i2c:
+            return self._transfer([I2CTransaction(READ_REGISTER, address, register, length)])[0]
+        result = bytearray()
+        if self.block_read:
+            for offset in range(0, length, I2C_SMBUS_BLOCK_MAX):
+                chunk = min(I2C_SMBUS_BLOCK_MAX, length - offset)
+                result.extend(self.bus.read_i2c_block_data(address, register + offset, chunk))
+        else:
+            for offset in range(0, length):
+                result.append(self.bus.read_byte_data(address, register + offset))
+        return bytes(result)
 
+    @coalesced
+    @metered(BusMetrics.READ, register=False)
     def i2c_read(self, address, length):
-        raise NotImplementedError()
+        if self.plain_i2c:
+            return self._transfer([I2CTransaction(READ, address, None, length)])[0]
+        if length == 1:
+            return bytes([self.bus.read_byte(address)])
+        raise NotImplementedError('This SMBus adapter only supports raw reads of a single byte')
 
+    @synchronized
+    @metered(BusMetrics.WRITE, register=False)
     def i2c_write(self, address, data):
-        raise NotImplementedError()
\ No newline at end of file
+        if isinstance(data, int):
+            data = [data]
+        if self.plain_i2c:
+            self._transfer([I2CTransaction(WRITE, address, None, data)])
+        elif len(data) == 1:
+            self.bus.write_byte(address, data[0])
+        else:
+            raise NotImplementedError('This SMBus adapter only supports raw writes of a single byte')
+
+    @synchronized
+    @metered_transfer
+    def i2c_transfer(self, transactions):
+        """ Execute a list of transactions with the I2C_RDWR ioctl. Up to 42 messages are combined into a single
+        system call with repeated starts between them. This is used by I2CDevice.batch().
+
+        :param transactions: List of electronics.batch.I2CTransaction instances
+        :return: List with the result for every transaction, None for writes
+        """
+        if not self.plain_i2c:
+            return execute_sequential(self, transactions)
+        return self._transfer(transactions)
+
+    def _transfer(self, transactions):
+        results = [None] * len(transactions)
+        messages = []
+        reads = []
+        for index, transaction in enumerate(transactions):
+            kind = transaction.kind
+            if kind == READ_REGISTER:
+                needed = 2
+            else:
+                needed = 1
+            if len(messages) + needed > I2C_RDWR_IOCTL_MAX_MSGS:
+                self._rdwr(messages, reads, results)
+                messages = []
+                reads = []
+
+            if kind == READ or kind == READ_REGISTER:
+                if kind == READ_REGISTER:
+                    messages.append((transaction.address, 0, ctypes.create_string_buffer(bytes([transaction.register]),
+                                                                                         1)))
+                buffer = ctypes.create_string_buffer(transaction.payload)
+                messages.append((transaction.address, I2C_M_RD, buffer))
+                reads.append((index, buffer))
+            else:
+                data = transaction.payload
+                if isinstance(data, int):
+                    data = [data]
+                data = bytes(data)
+                if kind == WRITE_REGISTER:
+                    data = bytes([transaction.register]) + data
+                messages.append((transaction.address, 0, ctypes.create_string_buffer(data, len(data))))
+
+        if messages:
+            self._rdwr(messages, reads, results)
+        return results
+
+    def _rdwr(self, messages, reads, results):
+        msgs = (_I2CMessage * len(messages))()
+        for i, (address, flags, buffer) in enumerate(messages):
+            msgs[i].addr = address
+            msgs[i].flags = flags
+            msgs[i].len = ctypes.sizeof(buffer)
+            msgs[i].buf = ctypes.cast(buffer, ctypes.c_char_p)
+        data = _I2CRdwrData(msgs, len(messages))
+        fcntl.ioctl(self._fd, I2C_RDWR, data)
+        for index, buffer in reads:
+            results[index] = buffer.raw
@@ -0,0 +1,211 @@
+import functools
+import time
+
+from electronics.batch import READ, READ_REGISTER
+
+
+class BusMetrics(object):
+    """ Transaction statistics for a single gateway.
+
+    Metrics are disabled by default, use enable_metrics() on the gateway to start collecting. The metrics contain the
+    amount of transactions and bytes for every address and register, a latency histogram with fixed buckets and an
+    estimate for the time the bus was occupied based on the bus clock.
+
+    .. testsetup::
+
+        from electronics.gateways import MockGateway
+        from electronics.devices import LM75, BMP180
+        gw = MockGateway()
+
+    :Example:
+
+    >>> metrics = gw.enable_metrics()
+    >>> sensor = LM75(gw)
+    >>> barometer = BMP180(gw)
+    >>> temperature = sensor.temperature()
+    >>> pressure = barometer.pressure()
+    >>> snapshot = metrics.snapshot()
+    >>> snapshot['transactions'], snapshot['bytes_read'], snapshot['bytes_written']
+    (5, 7, 2)
+    >>> snapshot['devices'][0x77][0xF6]
+    {'reads': 2, 'writes': 0, 'bytes_read': 5, 'bytes_written': 0}
+    >>> sum(snapshot['latency_histogram'])
+    5
+    >>> metrics.reset()
+
+    :param clock_hz: The bus clock in Hz, used to estimate the bus occupancy
+    """
+
+    # Upper bounds of the latency histogram buckets in seconds. The last bucket counts everything slower.
+    LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+    READ = 0
+    WRITE = 1
+
+    def __init__(self, clock_hz=100000):
+        self.clock_hz = clock_hz
+        self.reset()
+
+    def reset(self):
+        """ Clear all counters and restart the measurement period """
+        self.started = time.monotonic()
+        self.devices = {}
+        self.transactions = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.latency_total = 0.0
+        self.latency_histogram = [0] * (len(self.LATENCY_BUCKETS) + 1)
+        self.busy_time = 0.0
+
+    def record(self, address, register, direction, length, duration):
+        """ Add a transaction to the metrics. This is called by the gateway.
+
+        :param address: Device address
+        :param register: Register address or None for raw transactions
+        :param direction: BusMetrics.READ or BusMetrics.WRITE
+        :param length: Amount of data bytes
+        :param duration: Time the transaction took in seconds
+        """
+        registers = self.devices.get(address)
+        if registers is None:
+            registers = self.devices[address] = {}
+        counters = registers.get(register)
+        if counters is None:
+            counters = registers[register] = [0, 0, 0, 0]
+
+        # Bytes on the wire: the address byte and the data, for register access also the register byte and a second
+        # address byte after the repeated start when reading
+        wire_bytes = 1 + length
+        if register is not None:
+            wire_bytes += 1
+            if direction == self.READ:
+                wire_bytes += 1
+
+        if direction == self.READ:
+            counters[0] += 1
+            counters[2] += length
+            self.bytes_read += length
+        else:
+            counters[1] += 1
+            counters[3] += length
+            self.bytes_written += length
+
+        self.transactions += 1
+        self.latency_total += duration
+        for index, bound in enumerate(self.LATENCY_BUCKETS):
+            if duration <= bound:
+                self.latency_histogram[index] += 1
+                break
+        else:
+            self.latency_histogram[-1] += 1
+
+        # Every byte is 8 bits and an ack, the start and stop conditions take about a clock cycle each
+        self.busy_time += (wire_bytes * 9 + 2) / self.clock_hz
+
+    def snapshot(self):
+        """ Get a copy of the current metrics
+
+        :return: dict with the totals, the latency histogram, the estimated bus utilization and the counters for every
+                 device as a dict of addresses containing a dict of registers (None for raw transactions)
+        """
+        elapsed = time.monotonic() - self.started
+        devices = {}
+        for address, registers in self.devices.items():
+            devices[address] = {}
+            for register, counters in registers.items():
+                devices[address][register] = {
+                    'reads': counters[0],
+                    'writes': counters[1],
+                    'bytes_read': counters[2],
+                    'bytes_written': counters[3],
+                }
+        return {
+            'elapsed': elapsed,
+            'transactions': self.transactions,
+            'bytes_read': self.bytes_read,
+            'bytes_written': self.bytes_written,
+            'latency_average': self.latency_total / self.transactions if self.transactions else 0.0,
+            'latency_buckets': self.LATENCY_BUCKETS,
+            'latency_histogram': list(self.latency_histogram),
+            'clock_hz': self.clock_hz,
+            'busy_time': self.busy_time,
+            'utilization': self.busy_time / elapsed if elapsed > 0 else 0.0,
+            'devices': devices,
+        }
+
+
+class MeteredGateway(object):
+    """ Adds the opt-in metrics to a gateway. Gateways set i2c_clock_hz to the clock they run the bus at. """
+    metrics = None
+    i2c_clock_hz = 100000
+
+    def enable_metrics(self, clock_hz=None):
+        """ Start collecting transaction metrics for this gateway
+
+        :param clock_hz: Override the bus clock used to estimate the bus occupancy
+        :return: The BusMetrics instance that collects the metrics
+        """
+        self.metrics = BusMetrics(clock_hz or self.i2c_clock_hz)
+        return self.metrics
+
+    def disable_metrics(self):
+        """ Stop collecting metrics """
+        self.metrics = None
+
+
+def metered(direction, register=True):
+    """ Decorator for the i2c methods of a gateway that records them in the gateway metrics when enabled.
+
+    The decorated method gets the address as first argument, then the register if register is True and then the
+    length for reads or the data for writes.
+    """
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, address, *args):
+            if self.metrics is None:
+                return method(self, address, *args)
+            start = time.perf_counter()
+            result = method(self, address, *args)
+            duration = time.perf_counter() - start
+
+            reg = args[0] if register else None
+            payload = args[-1]
+            if direction == BusMetrics.READ:
+                length = payload
+            elif isinstance(payload, int):
+                length = 1
+            else:
+                length = len(payload)
+            self.metrics.record(address, reg, direction, length, duration)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def metered_transfer(method):
+    """ Decorator for the i2c_transfer method of a gateway. The time of the whole transfer is divided over the
+    transactions in it.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, transactions):
+        if self.metrics is None:
+            return method(self, transactions)
+        start = time.perf_counter()
+        result = method(self, transactions)
+        duration = (time.perf_counter() - start) / max(len(transactions), 1)
+
+        for transaction in transactions:
+            register = transaction.register
+            if transaction.kind == READ or transaction.kind == READ_REGISTER:
+                self.metrics.record(transaction.address, register, BusMetrics.READ, transaction.payload, duration)
+            else:
+                payload = transaction.payload
+                length = 1 if isinstance(payload, int) else len(payload)
+                self.metrics.record(transaction.address, register, BusMetrics.WRITE, length, duration)
+        return result
+
+    return wrapper
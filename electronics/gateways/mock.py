@@ -1,15 +1,28 @@
-class MockGateway(object):
+from electronics.gateways.base import Gateway, GatewayCapabilities, synchronized, coalesced
+from electronics.gateways.metrics import metered, BusMetrics
+
+
+class MockGateway(Gateway):
     """
     This is a gateway designed to be used for doctest. It uses a ...ahem... deterministic pre-seeded random number
     generator. This ensures that the values in the doctests are the same but random.
     """
+    capabilities = GatewayCapabilities(i2c=True, i2c_raw=True, i2c_block=True, i2c_combined=True, i2c_bulk=True)
+
     def __init__(self):
         self.counter = 0
 
+    @synchronized
+    @metered(BusMetrics.WRITE)
     def i2c_write_register(self, address, register, bytes):
         pass
 
+    @coalesced
+    @metered(BusMetrics.READ, register=False)
     def i2c_read(self, address, length):
+        return self._read(length)
+
+    def _read(self, length):
         result = bytearray()
         for i in range(0, length):
             self.counter += 1
@@ -18,8 +31,12 @@ class MockGateway(object):
             result.append(self.counter)
         return result
 
+    @coalesced
+    @metered(BusMetrics.READ)
     def i2c_read_register(self, address, register, length):
-        return self.i2c_read(address, length)
+        return self._read(length)
 
+    @synchronized
+    @metered(BusMetrics.WRITE, register=False)
     def i2c_write(self, address, bytes):
         pass
\ No newline at end of file
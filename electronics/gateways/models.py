@@ -0,0 +1,451 @@
+import struct
+
+from electronics.gateways.simulator import RegisterModel, OneWireModel
+from electronics.onewire import crc8
+
+
+def _signed(value):
+    # Two's complement 16 bit value as big endian bytes
+    return struct.pack('>h', max(-32768, min(32767, int(value))))
+
+
+class LM75Model(RegisterModel):
+    """ Simulation of a LM75 temperature sensor. The registers are selected with the pointer register and don't
+    auto-increment, a read returns the 2 byte temperature register again after a read.
+
+    :param temperature: The temperature in degree celcius
+    """
+    size = 4
+    reset = {0x02: 0x4b, 0x03: 0x50}
+    read_only = frozenset([0x00])
+    auto_increment = False
+
+    def __init__(self, temperature=20.0, registers=None):
+        super().__init__(registers)
+        # Every register is 2 bytes except the configuration register
+        self.words = {0x00: 0, 0x02: 0x4b00, 0x03: 0x5000}
+        self.temperature = temperature
+
+    def read(self, length):
+        if self.pointer == 0x00:
+            value = int(round(self.temperature * 256)) & 0xffe0
+        elif self.pointer == 0x01:
+            return bytes([self.registers[0x01]]) * length
+        else:
+            value = self.words[self.pointer]
+        data = struct.pack('>H', value & 0xffff)
+        return (data * (length // 2 + 1))[:length]
+
+    def write(self, data):
+        if not data:
+            return
+        self.pointer = data[0] & 0x03
+        if len(data) < 2:
+            return
+        if self.pointer == 0x01:
+            self.registers[0x01] = data[1]
+        elif self.pointer != 0x00 and len(data) >= 3:
+            self.words[self.pointer] = (data[1] << 8) | data[2]
+
+
+class BMP180Model(RegisterModel):
+    """ Simulation of a Bosch BMP180 pressure sensor with the calibration from the datasheet example.
+
+    Writing a measurement command to the control register starts a conversion, the result registers get the new
+    value after the conversion time of the chip. Until then the start-of-conversion bit is set and reads of the
+    result return the previous value, these reads are counted in early_reads.
+
+    :param ut: The uncompensated temperature value
+    :param up: The uncompensated pressure value for the oversampling setting that is used
+    """
+    CALIBRATION = struct.pack('>hhhHHHhhhhh', 408, -72, -14383, 32741, 32757, 23153, 6190, 4, -32768, -8711, 2868)
+
+    reset = {0xD0: 0x55}
+    read_only = frozenset(range(0xAA, 0xC0)) | frozenset([0xD0, 0xF6, 0xF7, 0xF8])
+
+    def __init__(self, ut=27898, up=23843, registers=None):
+        super().__init__(registers)
+        self.ut = ut
+        self.up = up
+        self.early_reads = 0
+        self._conversion = None
+
+    def power_on_reset(self):
+        super().power_on_reset()
+        self.registers[0xAA:0xC0] = self.CALIBRATION
+        self._conversion = None
+
+    def update(self, register, length):
+        if self._conversion is not None:
+            ready, result = self._conversion
+            if self.now() >= ready:
+                self.registers[0xF6:0xF9] = result
+                self.registers[0xF4] &= ~0x20 & 0xff
+                self._conversion = None
+            elif register <= 0xF8 and register + length > 0xF6:
+                self.early_reads += 1
+
+    def written(self, register, value):
+        if register == 0xE0 and value == 0xB6:
+            self.power_on_reset()
+        elif register == 0xF4:
+            command = value & 0x1f
+            oss = value >> 6
+            if command == 0x0e:
+                result = struct.pack('>H', self.ut & 0xffff) + b'\x00'
+                duration = 0.0045
+            elif command == 0x14:
+                result = struct.pack('>I', (self.up << (8 - oss)) & 0xffffff)[1:]
+                duration = (0.0045, 0.0075, 0.0135, 0.0255)[oss]
+            else:
+                return
+            self.registers[0xF4] = value | 0x20
+            self._conversion = (self.now() + duration, result)
+
+
+class MPU6050Model(RegisterModel):
+    """ Simulation of an InvenSense MPU-6050 motion sensor. The measurement registers are read-only, set the raw
+    sensor values with the acceleration, temperature and angular_rate attributes. The measurements only update while
+    the chip is not sleeping.
+
+    The FIFO is filled at the sample rate set in the SMPLRT_DIV and CONFIG registers with the measurements selected
+    in FIFO_EN, in register order. It holds 1024 bytes, when it overflows the oldest bytes are dropped and the
+    overflow bit in INT_STATUS is set.
+
+    :param acceleration: Tuple with the raw x, y and z accelerometer values
+    :param temperature: The raw temperature value
+    :param angular_rate: Tuple with the raw x, y and z gyroscope values
+    """
+    SMPLRT_DIV = 0x19
+    CONFIG = 0x1A
+    FIFO_EN = 0x23
+    INT_STATUS = 0x3A
+    USER_CTRL = 0x6A
+    PWR_MGMT_1 = 0x6B
+    FIFO_COUNT = 0x72
+    FIFO_R_W = 0x74
+    WHO_AM_I = 0x75
+
+    FIFO_SIZE = 1024
+
+    reset = {PWR_MGMT_1: 0x40, WHO_AM_I: 0x68}
+    read_only = frozenset(range(0x3A, 0x61)) | frozenset([FIFO_COUNT, FIFO_COUNT + 1, WHO_AM_I])
+
+    def __init__(self, acceleration=(0, 0, 0), temperature=0, angular_rate=(0, 0, 0), registers=None):
+        self.fifo = bytearray()
+        self._last_sample = None
+        super().__init__(registers)
+        self.acceleration = acceleration
+        self.temperature = temperature
+        self.angular_rate = angular_rate
+
+    def power_on_reset(self):
+        super().power_on_reset()
+        self.fifo = bytearray()
+        self._last_sample = None
+
+    def sleeping(self):
+        """ True when the chip is in sleep mode """
+        return bool(self.registers[self.PWR_MGMT_1] & 0x40)
+
+    def sample_rate(self):
+        """ The sample rate in Hz that follows from SMPLRT_DIV and the low pass filter setting in CONFIG """
+        output_rate = 8000.0 if self.registers[self.CONFIG] & 0x07 in (0, 7) else 1000.0
+        return output_rate / (1 + self.registers[self.SMPLRT_DIV])
+
+    def _measurements(self):
+        accel = b''.join(_signed(value) for value in self.acceleration)
+        gyro = b''.join(_signed(value) for value in self.angular_rate)
+        return accel + _signed(self.temperature) + gyro
+
+    def _fifo_sample(self, measurements):
+        enabled = self.registers[self.FIFO_EN]
+        sample = bytearray()
+        if enabled & 0x08:
+            sample += measurements[0:6]
+        if enabled & 0x80:
+            sample += measurements[6:8]
+        for bit, offset in ((0x40, 8), (0x20, 10), (0x10, 12)):
+            if enabled & bit:
+                sample += measurements[offset:offset + 2]
+        return bytes(sample)
+
+    def _fill_fifo(self, measurements):
+        now = self.now()
+        if self._last_sample is None:
+            self._last_sample = now
+            return
+        period = 1.0 / self.sample_rate()
+        count = int((now - self._last_sample) / period)
+        if count < 1:
+            return
+        self._last_sample += count * period
+        sample = self._fifo_sample(measurements)
+        if not sample:
+            return
+        # Only the samples that still fit in the FIFO matter
+        count = min(count, self.FIFO_SIZE // len(sample) + 1)
+        self.fifo += sample * count
+        if len(self.fifo) > self.FIFO_SIZE:
+            del self.fifo[:len(self.fifo) - self.FIFO_SIZE]
+            self.registers[self.INT_STATUS] |= 0x10
+
+    def update(self, register, length):
+        if not self.sleeping():
+            measurements = self._measurements()
+            self.registers[0x3B:0x49] = measurements
+            if self.registers[self.USER_CTRL] & 0x40:
+                self._fill_fifo(measurements)
+            else:
+                self._last_sample = None
+        self.registers[self.FIFO_COUNT:self.FIFO_COUNT + 2] = struct.pack('>H', len(self.fifo))
+
+    def next_register(self, register):
+        if register == self.FIFO_R_W:
+            return register
+        return (register + 1) % self.size
+
+    def read(self, length):
+        if self.pointer != self.FIFO_R_W:
+            status = self.pointer <= self.INT_STATUS < self.pointer + length
+            result = super().read(length)
+            if status:
+                # Reading the interrupt status clears it
+                self.registers[self.INT_STATUS] = 0
+            return result
+        self.update(self.pointer, length)
+        data = bytes(self.fifo[:length])
+        del self.fifo[:length]
+        return data + bytes(length - len(data))
+
+    def written(self, register, value):
+        if register == self.PWR_MGMT_1 and value & 0x80:
+            self.power_on_reset()
+        elif register == self.USER_CTRL:
+            if value & 0x04:
+                self.fifo = bytearray()
+                self.registers[self.USER_CTRL] &= ~0x04 & 0xff
+            if value & 0x40 and self._last_sample is None and not self.sleeping():
+                # The FIFO starts filling when it is enabled
+                self._last_sample = self.now()
+        elif register == self.FIFO_R_W:
+            self.fifo.append(value)
+
+
+class HMC5883LModel(RegisterModel):
+    """ Simulation of a Honeywell HMC5883L compass. The data registers are in the X, Z, Y order of the chip, the
+    pointer wraps from the last data register back to the first one so the data can be read continuously. In
+    continuous mode every read gets the current field, in single measurement mode a measurement is taken when the
+    mode register is written and the chip goes idle afterwards. The chip powers up in single measurement mode.
+
+    :param field: Tuple with the raw x, y and z values
+    """
+    size = 13
+    reset = {0x00: 0x10, 0x01: 0x20, 0x02: 0x01, 0x0A: ord('H'), 0x0B: ord('4'), 0x0C: ord('3')}
+    read_only = frozenset(range(0x03, 0x0D))
+
+    def __init__(self, field=(0, 0, 0), registers=None):
+        super().__init__(registers)
+        self.field = field
+        # The chip starts in single measurement mode and takes one measurement after power-on
+        self.written(0x02, self.registers[0x02])
+
+    def next_register(self, register):
+        if register == 0x08:
+            return 0x03
+        return (register + 1) % self.size
+
+    def _measure(self):
+        x, y, z = self.field
+        self.registers[0x03:0x09] = _signed(x) + _signed(z) + _signed(y)
+        self.registers[0x09] |= 0x01
+
+    def update(self, register, length):
+        if self.registers[0x02] & 0x03 == 0x00:
+            self._measure()
+
+    def written(self, register, value):
+        if register == 0x02 and value & 0x03 == 0x01:
+            self._measure()
+            self.registers[0x02] = (value & ~0x03) | 0x03
+
+
+class MCP23017Model(RegisterModel):
+    """ Simulation of a Microchip MCP23017 I/O expander with the default IOCON.BANK=0 register layout.
+
+    The pointer increments through all registers, or toggles between the A and B register of a pair when the SEQOP
+    bit in IOCON is set. Reading GPIO returns the pin levels set with set_inputs() for the input pins, inverted by
+    IPOL, and the output latch for the output pins. Use outputs() to check what the chip drives on its pins.
+    """
+    IOCON = (0x0A, 0x0B)
+    GPIO = (0x12, 0x13)
+    OLAT = (0x14, 0x15)
+
+    size = 0x16
+    reset = {0x00: 0xff, 0x01: 0xff}
+    read_only = frozenset([0x0E, 0x0F, 0x10, 0x11])
+
+    def __init__(self, registers=None):
+        super().__init__(registers)
+        self.inputs = [0, 0]
+
+    def next_register(self, register):
+        if self.registers[0x0A] & 0x20:
+            return register ^ 0x01
+        return (register + 1) % self.size
+
+    def set_inputs(self, port, value):
+        """ Set the level of the pins of a port, only the pins configured as input are read by the chip
+
+        :param port: 0 for port A and 1 for port B
+        :param value: The pin levels as int, bit 0 is pin 0
+        """
+        changed = (self.inputs[port] ^ value) & self.registers[port]
+        self.inputs[port] = value
+        flags = changed & self.registers[0x04 + port]
+        if flags:
+            self.registers[0x0E + port] |= flags
+            self.registers[0x10 + port] = self._gpio(port)
+
+    def outputs(self, port):
+        """ Get the levels the chip drives on the output pins of a port, input pins are 0 """
+        return self.registers[self.OLAT[port]] & ~self.registers[port] & 0xff
+
+    def _gpio(self, port):
+        direction = self.registers[port]
+        inputs = (self.inputs[port] ^ self.registers[0x02 + port]) & direction
+        return inputs | (self.registers[self.OLAT[port]] & ~direction & 0xff)
+
+    def update(self, register, length):
+        self.registers[0x12] = self._gpio(0)
+        self.registers[0x13] = self._gpio(1)
+
+    def read(self, length):
+        register = self.pointer
+        result = super().read(length)
+        # Reading GPIO or INTCAP clears the interrupt of that port
+        for index in range(length):
+            if 0x10 <= register <= 0x13:
+                self.registers[0x0E + (register & 0x01)] = 0
+            register = self.next_register(register)
+        return result
+
+    def written(self, register, value):
+        if register in self.IOCON:
+            value &= 0xfe
+            self.registers[0x0A] = self.registers[0x0B] = value
+        elif register in self.GPIO:
+            self.registers[self.OLAT[register - 0x12]] = value
+
+
+class HT16K33Model(RegisterModel):
+    """ Simulation of a Holtek HT16K33 LED driver. Commands are single byte writes, a write with a first byte below
+    0x10 writes the display RAM at that address. The state of the chip is in the ram, oscillator, display_on, blink
+    and brightness attributes.
+    """
+    size = 16
+
+    def __init__(self, registers=None):
+        super().__init__(registers)
+        self.oscillator = False
+        self.display_on = False
+        self.blink = 0
+        self.brightness = 15
+
+    @property
+    def ram(self):
+        """ The 16 bytes of display RAM """
+        return self.registers
+
+    def write(self, data):
+        if not data:
+            return
+        command = data[0]
+        if command < 0x10:
+            super().write(data)
+        elif command & 0xf0 == 0x20:
+            self.oscillator = bool(command & 0x01)
+        elif command & 0xf0 == 0x80:
+            self.display_on = bool(command & 0x01)
+            self.blink = (command >> 1) & 0x03
+        elif command & 0xf0 == 0xe0:
+            self.brightness = command & 0x0f
+
+    def row(self, row):
+        """ Get the 16 pixels of a row as int, bit 0 is column 0 """
+        return self.registers[row * 2] | (self.registers[row * 2 + 1] << 8)
+
+
+class DS18B20Model(OneWireModel):
+    """ Simulation of a Maxim DS18B20 1-Wire temperature sensor. A conversion takes the time of the configured
+    resolution, the scratchpad has the power-on value of 85 degrees until the first conversion is done. Reads of the
+    scratchpad during a conversion are counted in early_reads.
+
+    :param serial: The 48 bit serial number in the ROM code
+    :param temperature: The temperature in degree celcius
+    """
+    family = 0x28
+
+    CONVERSION_TIME = (0.09375, 0.1875, 0.375, 0.75)
+
+    def __init__(self, serial=1, temperature=20.0):
+        super().__init__(serial)
+        self.temperature = temperature
+        self.early_reads = 0
+        # Temperature LSB and MSB, TH, TL and the configuration register
+        self.scratchpad = bytearray(b'\x50\x05\x4b\x46\x7f\xff\x0c\x10')
+        self.eeprom = bytes(self.scratchpad[2:5])
+        self._conversion = None
+        self._command = None
+        self._data = bytearray()
+        self._output = bytearray()
+
+    def _update(self):
+        if self._conversion is not None and self.now() >= self._conversion:
+            resolution = (self.scratchpad[4] >> 5) & 0x03
+            # The undefined low bits are 0 in the lower resolutions
+            raw = int(round(self.temperature * 16)) & ~((1 << (3 - resolution)) - 1)
+            self.scratchpad[0:2] = struct.pack('<h', max(-32768, min(32767, raw)))
+            self._conversion = None
+
+    def reset(self):
+        self._command = None
+        self._output = bytearray()
+
+    def write(self, value):
+        if self._command == 0x4E:
+            # Write scratchpad: TH, TL and the configuration register
+            index = 2 + len(self._data)
+            if index < 5:
+                self._data.append(value)
+                self.scratchpad[index] = value | 0x1f if index == 4 else value
+            return
+        self._command = value
+        self._data = bytearray()
+        if value == 0x44:
+            resolution = (self.scratchpad[4] >> 5) & 0x03
+            self._conversion = self.now() + self.CONVERSION_TIME[resolution]
+        elif value == 0xBE:
+            if self._conversion is not None and self.now() < self._conversion:
+                self.early_reads += 1
+            self._update()
+            self._output = bytearray(self.scratchpad) + bytes([crc8(self.scratchpad)])
+        elif value == 0x48:
+            self.eeprom = bytes(self.scratchpad[2:5])
+        elif value == 0xB8:
+            self.scratchpad[2:5] = self.eeprom
+
+    def read(self):
+        if self._output:
+            return self._output.pop(0)
+        if self._command == 0x44:
+            # Read slots during a conversion return 0 until it is done
+            self._update()
+            return 0x00 if self._conversion is not None else 0xff
+        return 0xff
+
+    def alarm(self):
+        self._update()
+        temperature = struct.unpack('<h', self.scratchpad[0:2])[0] >> 4
+        high, low = struct.unpack('bb', self.scratchpad[2:4])
+        return temperature >= high or temperature <= low
@@ -0,0 +1,407 @@
+import collections
+import mmap
+import struct
+import time
+import zlib
+
+from electronics.batch import I2CTransaction, READ, WRITE, READ_REGISTER, WRITE_REGISTER
+from electronics.gateways.base import Gateway, GatewayCapabilities, synchronized
+
+__all__ = ['RecordingGateway', 'ReplayGateway', 'LogRecord', 'read_log']
+
+LogRecord = collections.namedtuple('LogRecord', ['timestamp', 'duration', 'kind', 'address', 'register', 'length',
+                                                 'data', 'response', 'error'])
+LogRecord.__doc__ = """ A transaction from a bus log. The timestamp is from time.time(), length is the read length for
+reads and the amount of data bytes for writes. The response is the data that was read, error contains the exception
+message when the transaction failed. """
+
+# File header: magic, format version and flags
+_HEADER = struct.Struct('<4sBB2x')
+_MAGIC = b'ELOG'
+_VERSION = 1
+_FLAG_COMPRESSED = 0x01
+
+# Record: timestamp, duration, kind, address, status, register, length and response length, followed by the written
+# data and the response or error message
+_RECORD = struct.Struct('<dfBBBHHH')
+_STATUS_OK = 0
+_STATUS_ERROR = 1
+_NO_REGISTER = 0xFFFF
+
+
+def _length(transaction):
+    if transaction.kind == READ or transaction.kind == READ_REGISTER:
+        return transaction.payload
+    if isinstance(transaction.payload, int):
+        return 1
+    return len(transaction.payload)
+
+
+def _data(transaction):
+    if transaction.kind == READ or transaction.kind == READ_REGISTER:
+        return b''
+    if isinstance(transaction.payload, int):
+        return bytes([transaction.payload])
+    return bytes(transaction.payload)
+
+
+def _load(path):
+    # Returns a buffer with the records and the mmap of an uncompressed log, which has to be closed after the buffer
+    with open(path, 'rb') as handle:
+        header = handle.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            raise Exception('{} is not a bus log'.format(path))
+        magic, version, flags = _HEADER.unpack(header)
+        if magic != _MAGIC:
+            raise Exception('{} is not a bus log'.format(path))
+        if version != _VERSION:
+            raise Exception('Unsupported bus log version {}'.format(version))
+        if not flags & _FLAG_COMPRESSED:
+            handle.seek(0, 2)
+            if handle.tell() == _HEADER.size:
+                return memoryview(b''), None
+            mapped = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+            return memoryview(mapped)[_HEADER.size:], mapped
+        compressed = handle.read()
+
+    # A log that is appended to several times contains a zlib stream for every recording session
+    result = bytearray()
+    while compressed:
+        stream = zlib.decompressobj()
+        result += stream.decompress(compressed)
+        result += stream.flush()
+        compressed = stream.unused_data
+    return memoryview(bytes(result)), None
+
+
+def _records(buffer):
+    offset = 0
+    end = len(buffer) - _RECORD.size
+    while offset <= end:
+        timestamp, duration, kind, address, status, register, length, response_length = \
+            _RECORD.unpack_from(buffer, offset)
+        offset += _RECORD.size
+        data_length = length if kind == WRITE or kind == WRITE_REGISTER else 0
+        if offset + data_length + response_length > len(buffer):
+            # The last record was cut off, for example by a crash during the recording
+            return
+        yield (timestamp, duration, kind, address, status, register, length, offset, data_length, response_length)
+        offset += data_length + response_length
+
+
+def read_log(path):
+    """ Read all transactions from a bus log
+
+    :param path: Path of the log written by a RecordingGateway
+    :return: List of LogRecord instances
+    """
+    buffer, mapped = _load(path)
+    result = []
+    try:
+        for timestamp, duration, kind, address, status, register, length, offset, data_length, response_length in \
+                _records(buffer):
+            data = bytes(buffer[offset:offset + data_length])
+            response = bytes(buffer[offset + data_length:offset + data_length + response_length])
+            error = None
+            if status == _STATUS_ERROR:
+                error = response.decode('utf-8', 'replace')
+                response = None
+            elif kind == WRITE or kind == WRITE_REGISTER:
+                response = None
+            register = None if register == _NO_REGISTER else register
+            result.append(LogRecord(timestamp, duration, kind, address, register, length, data, response, error))
+    finally:
+        buffer.release()
+        if mapped is not None:
+            mapped.close()
+    return result
+
+
+class RecordingGateway(Gateway):
+    """ Wraps a gateway and records every transaction in an append-only binary log. The log can be served again by a
+    ReplayGateway to run drivers and processing on captured traffic without the hardware.
+
+    Every record contains the time, duration, address, register, the written data and the response or the error of
+    the transaction. With compress=True the log is a zlib stream, this makes logs of sensors with slowly changing
+    values a lot smaller but the replay has to decompress the whole log into memory.
+
+    .. testsetup::
+
+        import os
+        import tempfile
+        from electronics.gateways import MockGateway, RecordingGateway, ReplayGateway
+        from electronics.devices import LM75, BMP180
+        path = os.path.join(tempfile.mkdtemp(), 'bus.log')
+
+    :Example:
+
+    >>> gw = RecordingGateway(MockGateway(), path)
+    >>> sensor = LM75(gw)
+    >>> barometer = BMP180(gw)
+    >>> sensor.temperature()
+    1.0078125
+    >>> barometer.temperature()
+    -134.1
+    >>> gw.close()
+    >>> # Later, on another machine
+    >>> replay = ReplayGateway(path)
+    >>> sensor = LM75(replay)
+    >>> barometer = BMP180(replay)
+    >>> sensor.temperature()
+    1.0078125
+    >>> barometer.temperature()
+    -134.1
+    >>> replay.remaining()
+    0
+    >>> replay.close()
+
+    :param gateway: The gateway to record
+    :param path: Path of the log, a new log is created or the records are appended to an existing log
+    :param compress: Compress the log with zlib, this has to match the existing log when appending
+    :param level: The zlib compression level
+    """
+
+    def __init__(self, gateway, path, compress=False, level=6):
+        self.gateway = gateway
+        self.capabilities = gateway.capabilities
+        self.i2c_clock_hz = gateway.i2c_clock_hz
+        self.path = path
+        self.compress = compress
+        self._file = open(path, 'ab')
+        flags = _FLAG_COMPRESSED if compress else 0
+        if self._file.tell() == 0:
+            self._file.write(_HEADER.pack(_MAGIC, _VERSION, flags))
+        else:
+            with open(path, 'rb') as handle:
+                magic, version, existing = _HEADER.unpack(handle.read(_HEADER.size))
+            if magic != _MAGIC or version != _VERSION:
+                self._file.close()
+                raise Exception('{} is not a bus log'.format(path))
+            if existing != flags:
+                self._file.close()
+                raise ValueError('The compression setting does not match the existing log')
+        self._compressor = zlib.compressobj(level) if compress else None
+
+    def __getattr__(self, name):
+        # Gateway specific methods like set_peripheral() go to the wrapped gateway
+        if 'gateway' not in self.__dict__:
+            raise AttributeError(name)
+        return getattr(self.__dict__['gateway'], name)
+
+    def _write(self, data):
+        if self._compressor is not None:
+            data = self._compressor.compress(data)
+        self._file.write(data)
+
+    def _record(self, transaction, start, duration, response, error):
+        register = _NO_REGISTER if transaction.register is None else transaction.register
+        if error is not None:
+            status = _STATUS_ERROR
+            response = '{}'.format(error).encode('utf-8')[:0xFFFF]
+        else:
+            status = _STATUS_OK
+            response = b'' if response is None else bytes(response)
+        self._write(_RECORD.pack(start, duration, transaction.kind, transaction.address, status, register,
+                                 _length(transaction), len(response)) + _data(transaction) + response)
+
+    def _run(self, transaction, method, *args):
+        start = time.time()
+        begin = time.perf_counter()
+        try:
+            result = method(*args)
+        except Exception as e:
+            self._record(transaction, start, time.perf_counter() - begin, None, e)
+            raise
+        self._record(transaction, start, time.perf_counter() - begin, result, None)
+        return result
+
+    @synchronized
+    def i2c_read(self, address, length):
+        return self._run(I2CTransaction(READ, address, None, length), self.gateway.i2c_read, address, length)
+
+    @synchronized
+    def i2c_write(self, address, data):
+        self._run(I2CTransaction(WRITE, address, None, data), self.gateway.i2c_write, address, data)
+
+    @synchronized
+    def i2c_read_register(self, address, register, length):
+        return self._run(I2CTransaction(READ_REGISTER, address, register, length), self.gateway.i2c_read_register,
+                         address, register, length)
+
+    @synchronized
+    def i2c_write_register(self, address, register, data):
+        self._run(I2CTransaction(WRITE_REGISTER, address, register, data), self.gateway.i2c_write_register,
+                  address, register, data)
+
+    @synchronized
+    def i2c_transfer(self, transactions):
+        """ Execute a list of transactions on the wrapped gateway and record every transaction. When the transfer
+        fails all its transactions are recorded with the error.
+
+        :param transactions: List of electronics.batch.I2CTransaction instances
+        :return: List with the result for every transaction, None for writes
+        """
+        start = time.time()
+        begin = time.perf_counter()
+        try:
+            results = self.gateway.i2c_transfer(transactions)
+        except Exception as e:
+            duration = (time.perf_counter() - begin) / max(len(transactions), 1)
+            for transaction in transactions:
+                self._record(transaction, start, duration, None, e)
+            raise
+        duration = (time.perf_counter() - begin) / max(len(transactions), 1)
+        for transaction, result in zip(transactions, results):
+            self._record(transaction, start, duration, result, None)
+        return results
+
+    def estimate_transfer(self, transactions):
+        return self.gateway.estimate_transfer(transactions)
+
+    @synchronized
+    def flush(self):
+        """ Write the buffered records to the log file """
+        if self._compressor is not None:
+            self._file.write(self._compressor.flush(zlib.Z_SYNC_FLUSH))
+        self._file.flush()
+
+    @synchronized
+    def close(self):
+        """ Finish and close the log. The wrapped gateway stays open. """
+        if self._file.closed:
+            return
+        if self._compressor is not None:
+            self._file.write(self._compressor.flush())
+        self._file.close()
+
+
+class ReplayGateway(Gateway):
+    """ Serves the responses from a log written by a RecordingGateway.
+
+    Uncompressed logs are memory-mapped so the replay starts immediately, even for large logs. By default the
+    responses are served as fast as possible, set speed to 1.0 to reproduce the original timing or to another factor
+    to replay faster or slower.
+
+    In strict mode every transaction has to be the next one in the log, a different transaction raises an exception.
+    This checks that a driver change doesn't change the bus traffic. When strict is False a read gets the next
+    recorded response of the same address, register and length and writes are accepted without checking, so a
+    changed driver or pipeline can be benchmarked against the captured data. Every series of responses starts over
+    when it runs out.
+
+    :param path: Path of the log
+    :param speed: None to replay as fast as possible or a factor of the original speed
+    :param strict: Require the transactions in the same order as in the log
+    :param capabilities: GatewayCapabilities to report, defaults to all I2C features
+    """
+
+    def __init__(self, path, speed=None, strict=True, capabilities=None):
+        self.path = path
+        self.speed = speed
+        self.strict = strict
+        self.capabilities = capabilities or GatewayCapabilities(i2c=True, i2c_raw=True, i2c_block=True,
+                                                                i2c_combined=True, i2c_bulk=True)
+        self._buffer, self._mapped = _load(path)
+        self._log = list(_records(self._buffer))
+        self._position = 0
+        self._series = {}
+        self._cursors = {}
+        for index, record in enumerate(self._log):
+            kind = record[2]
+            if kind == READ or kind == READ_REGISTER:
+                self._series.setdefault((kind, record[3], record[5], record[6]), []).append(index)
+        self._origin = None
+        self._started = None
+
+    def __len__(self):
+        return len(self._log)
+
+    def remaining(self):
+        """ The amount of records that are not replayed yet in strict mode """
+        return len(self._log) - self._position
+
+    def rewind(self):
+        """ Start the replay from the beginning of the log """
+        self._position = 0
+        self._cursors = {}
+        self._origin = None
+
+    def _wait(self, record):
+        if self.speed is None:
+            return
+        timestamp, duration = record[0], record[1]
+        if self._origin is None:
+            self._origin = timestamp
+            self._started = time.monotonic()
+        target = self._started + (timestamp + duration - self._origin) / self.speed
+        delay = target - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _next(self, transaction):
+        kind = transaction.kind
+        register = _NO_REGISTER if transaction.register is None else transaction.register
+        length = _length(transaction)
+        if self.strict:
+            if self._position >= len(self._log):
+                raise Exception('Replay log exhausted')
+            record = self._log[self._position]
+            if record[2] != kind or record[3] != transaction.address or record[5] != register or \
+                    record[6] != length:
+                raise Exception('Replay mismatch at record {}: expected {}, got {}'.format(
+                    self._position, self._describe(record[2], record[3], record[5], record[6]),
+                    self._describe(kind, transaction.address, register, length)))
+            self._position += 1
+            return record
+        if kind == WRITE or kind == WRITE_REGISTER:
+            return None
+        key = (kind, transaction.address, register, length)
+        series = self._series.get(key)
+        if series is None:
+            raise Exception('No recorded response for {}'.format(self._describe(*key)))
+        cursor = self._cursors.get(key, 0)
+        self._cursors[key] = (cursor + 1) % len(series)
+        return self._log[series[cursor]]
+
+    def _describe(self, kind, address, register, length):
+        names = {READ: 'read', WRITE: 'write', READ_REGISTER: 'read', WRITE_REGISTER: 'write'}
+        if register == _NO_REGISTER:
+            return '{} of {} bytes at 0x{:02X}'.format(names[kind], length, address)
+        return '{} of {} bytes at 0x{:02X} register 0x{:02X}'.format(names[kind], length, address, register)
+
+    def _serve(self, transaction):
+        record = self._next(transaction)
+        if record is None:
+            return None
+        self._wait(record)
+        timestamp, duration, kind, address, status, register, length, offset, data_length, response_length = record
+        response = self._buffer[offset + data_length:offset + data_length + response_length]
+        if status == _STATUS_ERROR:
+            raise Exception(bytes(response).decode('utf-8', 'replace'))
+        if kind == WRITE or kind == WRITE_REGISTER:
+            return None
+        return bytes(response)
+
+    @synchronized
+    def i2c_read(self, address, length):
+        return self._serve(I2CTransaction(READ, address, None, length))
+
+    @synchronized
+    def i2c_write(self, address, data):
+        self._serve(I2CTransaction(WRITE, address, None, data))
+
+    @synchronized
+    def i2c_read_register(self, address, register, length):
+        return self._serve(I2CTransaction(READ_REGISTER, address, register, length))
+
+    @synchronized
+    def i2c_write_register(self, address, register, data):
+        self._serve(I2CTransaction(WRITE_REGISTER, address, register, data))
+
+    def close(self):
+        """ Release the log """
+        self._log = []
+        self._series = {}
+        self._buffer.release()
+        if self._mapped is not None:
+            self._mapped.close()
+            self._mapped = None
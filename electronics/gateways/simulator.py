@@ -0,0 +1,410 @@
+import time
+
+from electronics.batch import I2CTransaction, READ, WRITE, READ_REGISTER, WRITE_REGISTER
+from electronics.gateways.base import Gateway, GatewayCapabilities, synchronized, coalesced
+from electronics.gateways.metrics import metered, metered_transfer, BusMetrics
+from electronics.gateways.timing import VirtualClock
+from electronics.onewire import OneWireTransaction, SEARCH_ROM, READ_ROM, MATCH_ROM, SKIP_ROM, ALARM_SEARCH, crc8
+
+__all__ = ['SimulatedGateway', 'RegisterModel', 'OneWireModel']
+
+
+class RegisterModel(object):
+    """ Base class for the simulation of an I2C device with a register file.
+
+    The model has a register pointer like most I2C chips: the first byte of a write selects the register and the
+    following bytes are written starting at that register, a read returns the data starting at the pointer. The
+    pointer moves to the next register after every byte. Subclasses describe the chip with the class attributes and
+    override the hooks for registers with behaviour.
+
+    :param registers: dict with initial register values that override the reset values
+    """
+
+    # Size of the register file
+    size = 256
+
+    # Register values after power-on, all other registers are 0
+    reset = {}
+
+    # Registers that ignore writes
+    read_only = frozenset()
+
+    # Move the pointer to the next register after every byte
+    auto_increment = True
+
+    def __init__(self, registers=None):
+        self.gateway = None
+        self.pointer = 0
+        self.registers = bytearray(self.size)
+        self.power_on_reset()
+        if registers:
+            for register, value in registers.items():
+                self.registers[register] = value
+
+    def power_on_reset(self):
+        """ Load the reset values into the register file """
+        self.registers[:] = bytes(self.size)
+        for register, value in self.reset.items():
+            self.registers[register] = value
+
+    def now(self):
+        """ The current time of the simulation in seconds """
+        if self.gateway is not None:
+            return self.gateway.clock()
+        return time.monotonic()
+
+    def next_register(self, register):
+        """ The register the pointer moves to after reading or writing a byte """
+        if not self.auto_increment:
+            return register
+        return (register + 1) % self.size
+
+    def update(self, register, length):
+        """ Hook that is called before a read, use this to update registers with measurements
+
+        :param register: The first register that is read
+        :param length: Amount of bytes that is read
+        """
+        pass
+
+    def written(self, register, value):
+        """ Hook that is called after a byte is written to a register that is not read-only """
+        pass
+
+    def read(self, length):
+        """ Read bytes starting at the register pointer """
+        register = self.pointer
+        self.update(register, length)
+        registers = self.registers
+        if self.auto_increment and register + length <= self.size and type(self).next_register is \
+                RegisterModel.next_register:
+            # Fast path for the common case of a plain auto-incrementing register file
+            self.pointer = (register + length) % self.size
+            return bytes(registers[register:register + length])
+        result = bytearray(length)
+        for index in range(length):
+            result[index] = registers[register]
+            register = self.next_register(register)
+        self.pointer = register
+        return bytes(result)
+
+    def write(self, data):
+        """ Write bytes, the first byte is the register address """
+        if not data:
+            return
+        register = data[0]
+        for value in data[1:]:
+            if register not in self.read_only:
+                self.registers[register] = value
+                self.written(register, value)
+            register = self.next_register(register)
+        self.pointer = register
+
+    def read_register(self, register, length):
+        """ Select a register and read from it, like a write of the register address followed by a read """
+        self.write(bytes([register]))
+        return self.read(length)
+
+    def write_register(self, register, data):
+        """ Write data starting at a register """
+        self.write(bytes([register]) + bytes(data))
+
+
+class OneWireModel(object):
+    """ Base class for the simulation of a 1-Wire device. The gateway handles the reset and the ROM commands, the
+    model gets the function command and its data after it is selected. Subclasses override the hooks.
+
+    :param serial: The 48 bit serial number in the ROM code
+    """
+
+    # The family code in the first byte of the ROM code
+    family = 0x00
+
+    def __init__(self, serial=1):
+        self.gateway = None
+        rom = bytes([self.family]) + serial.to_bytes(6, 'little')
+        self.rom = rom + bytes([crc8(rom)])
+
+    def now(self):
+        """ The current time of the simulation in seconds """
+        if self.gateway is not None:
+            return self.gateway.clock()
+        return time.monotonic()
+
+    def reset(self):
+        """ Hook that is called on every reset pulse, the device waits for a ROM command after it """
+        pass
+
+    def write(self, value):
+        """ Hook that is called for every byte that is written after the device is selected """
+        pass
+
+    def read(self):
+        """ Hook that is called for every byte that is read after the device is selected
+
+        :return: The byte as int, the bus is high when the device doesn't drive it
+        """
+        return 0xff
+
+    def alarm(self):
+        """ Check if the device answers the alarm search """
+        return False
+
+
+class SimulatedGateway(Gateway):
+    """ Gateway that simulates the devices on a bus with register models, for testing and benchmarking drivers
+    without hardware. Reads from an address without a model raise the same error as a missing ack on a real bus.
+
+    The models for the drivers in electronics.devices are in electronics.gateways.models. A model only holds a small
+    register file, so a single process can simulate thousands of devices on many simulated gateways.
+
+    .. testsetup::
+
+        from electronics.gateways import SimulatedGateway
+        from electronics.gateways.models import LM75Model, MPU6050Model
+        from electronics.devices import LM75, MPU6050I2C
+
+    :Example:
+
+    >>> gw = SimulatedGateway()
+    >>> thermometer = gw.attach(0x49, LM75Model(temperature=21.5))
+    >>> sixaxis = gw.attach(0x68, MPU6050Model(acceleration=(0, 0, 2048)))
+    >>> sensor = LM75(gw)
+    >>> sensor.temperature()
+    21.5
+    >>> thermometer.temperature = -3
+    >>> sensor.temperature()
+    -3.0
+    >>> imu = MPU6050I2C(gw)
+    >>> imu.wakeup()
+    >>> imu.acceleration()
+    (0.0, 0.0, 1.0)
+    >>> LM75(gw, 0x48).temperature()
+    Traceback (most recent call last):
+    ...
+    Exception: No ack from device
+
+    :param models: dict with an address and a RegisterModel instance for every simulated device
+    :param clock: Function that returns the current time in seconds, the models use it for their timing. Defaults to
+                  time.monotonic, or to a new VirtualClock when there is a timing model.
+    :param timing: Optional TimingModel that charges every transaction the time it takes on a real gateway. When the
+                   clock has an advance() method, like a VirtualClock, it is moved forward by that time.
+
+    The gateway also simulates a 1-Wire bus, attach OneWireModel instances with attach_onewire(). The 1-Wire
+    transactions are not charged by the timing model.
+    """
+    capabilities = GatewayCapabilities(i2c=True, i2c_raw=True, i2c_block=True, i2c_combined=True, i2c_bulk=True,
+                                       onewire=True)
+
+    def __init__(self, models=None, clock=None, timing=None):
+        if clock is None:
+            clock = time.monotonic if timing is None else VirtualClock()
+        self.clock = clock
+        self.timing = timing
+        if timing is not None:
+            self.capabilities = timing.capabilities(i2c=True, i2c_raw=True, i2c_block=True, i2c_combined=True,
+                                                    i2c_bulk=True, onewire=True)
+            self.i2c_clock_hz = timing.clock_hz
+        self.models = {}
+        self.onewire_models = []
+        # The devices selected by the last ROM command, None while the bus waits for a ROM command after a reset
+        self._selected = []
+        self._rom_command = None
+        self._match = bytearray()
+        self._rom_read = bytearray()
+        if models:
+            for address, model in models.items():
+                self.attach(address, model)
+
+    def attach(self, address, model):
+        """ Add a simulated device to the bus
+
+        :param address: The I2C address of the device
+        :param model: RegisterModel instance
+        :return: The model
+        """
+        model.gateway = self
+        self.models[address] = model
+        return model
+
+    def detach(self, address):
+        """ Remove the simulated device at an address """
+        self.models.pop(address).gateway = None
+
+    def _execute(self, transaction):
+        model = self.models.get(transaction.address)
+        if model is None:
+            raise Exception('No ack from device')
+        kind = transaction.kind
+        if kind == READ_REGISTER:
+            return model.read_register(transaction.register, transaction.payload)
+        if kind == READ:
+            return model.read(transaction.payload)
+        data = transaction.payload
+        if isinstance(data, int):
+            data = [data]
+        if kind == WRITE_REGISTER:
+            model.write_register(transaction.register, data)
+        else:
+            model.write(bytes(data))
+        return None
+
+    def _run(self, transaction):
+        if self.timing is None:
+            return self._execute(transaction)
+        # The time is spent on the bus even when the device doesn't answer
+        duration = self.timing.charge([transaction])
+        if hasattr(self.clock, 'advance'):
+            self.clock.advance(duration)
+        return self._execute(transaction)
+
+    @coalesced
+    @metered(BusMetrics.READ, register=False)
+    def i2c_read(self, address, length):
+        return self._run(I2CTransaction(READ, address, None, length))
+
+    @synchronized
+    @metered(BusMetrics.WRITE, register=False)
+    def i2c_write(self, address, data):
+        self._run(I2CTransaction(WRITE, address, None, data))
+
+    @coalesced
+    @metered(BusMetrics.READ)
+    def i2c_read_register(self, address, register, length):
+        return self._run(I2CTransaction(READ_REGISTER, address, register, length))
+
+    @synchronized
+    @metered(BusMetrics.WRITE)
+    def i2c_write_register(self, address, register, data):
+        self._run(I2CTransaction(WRITE_REGISTER, address, register, data))
+
+    @synchronized
+    @metered_transfer
+    def i2c_transfer(self, transactions):
+        """ Execute a list of transactions. With a timing model the transactions are charged like the bulk transfer
+        of the real gateway.
+
+        :param transactions: List of electronics.batch.I2CTransaction instances
+        :return: List with the result for every transaction, None for writes
+        """
+        if self.timing is not None:
+            duration = self.timing.charge(transactions, bulk=True)
+            if hasattr(self.clock, 'advance'):
+                self.clock.advance(duration)
+        results = []
+        error = None
+        for transaction in transactions:
+            try:
+                results.append(self._execute(transaction))
+            except Exception as e:
+                error = error or e
+                results.append(None)
+        if error is not None:
+            raise error
+        return results
+
+    def estimate_transfer(self, transactions):
+        """ Estimate the time i2c_transfer() takes, this uses the timing model when there is one
+
+        :param transactions: List of electronics.batch.I2CTransaction instances
+        :return: Estimated time in seconds
+        """
+        if self.timing is None:
+            return super().estimate_transfer(transactions)
+        return sum(self.timing.cost(transactions, bulk=True))
+
+    def attach_onewire(self, model):
+        """ Add a simulated device to the 1-Wire bus
+
+        :param model: OneWireModel instance
+        :return: The model
+        """
+        model.gateway = self
+        self.onewire_models.append(model)
+        return model
+
+    def _onewire_reset(self):
+        self._selected = None
+        self._rom_command = None
+        self._rom_read = bytearray()
+        for model in self.onewire_models:
+            model.reset()
+
+    def _onewire_write(self, value):
+        if self._selected is not None:
+            for model in self._selected:
+                model.write(value)
+            return
+        if self._rom_command == MATCH_ROM:
+            self._match.append(value)
+            if len(self._match) == 8:
+                self._selected = [model for model in self.onewire_models if model.rom == self._match]
+            return
+        # The first byte after a reset is the ROM command
+        self._rom_command = value
+        if value == SKIP_ROM:
+            self._selected = list(self.onewire_models)
+        elif value == MATCH_ROM:
+            self._match = bytearray()
+        elif value == READ_ROM:
+            # Only works with a single device, more devices answer at the same time and the bus is the AND
+            rom = bytearray(b'\xff' * 8)
+            for model in self.onewire_models:
+                rom = bytearray(a & b for a, b in zip(rom, model.rom))
+            self._rom_read = rom
+            self._selected = list(self.onewire_models)
+        elif value in (SEARCH_ROM, ALARM_SEARCH):
+            raise Exception('Use onewire_search() for the search commands')
+        else:
+            self._selected = []
+
+    def _onewire_read(self):
+        if self._rom_read:
+            return self._rom_read.pop(0)
+        value = 0xff
+        for model in self._selected or ():
+            value &= model.read()
+        return value
+
+    def _onewire_execute(self, transaction):
+        if transaction.reset:
+            self._onewire_reset()
+        for value in bytes(transaction.data):
+            self._onewire_write(value)
+        if not transaction.read_length:
+            return None
+        return bytes(self._onewire_read() for i in range(transaction.read_length))
+
+    @synchronized
+    def onewire_transfer(self, transactions):
+        """ Execute a list of 1-Wire transactions
+
+        :param transactions: List of electronics.onewire.OneWireTransaction instances
+        :return: List with the read bytes for every transaction, None when nothing was read
+        """
+        return [self._onewire_execute(transaction) for transaction in transactions]
+
+    def onewire_reset(self):
+        """ Send a reset pulse on the 1-Wire bus """
+        self.onewire_transfer([OneWireTransaction(True, b'', 0)])
+
+    def onewire_write(self, data):
+        """ Write bytes to the 1-Wire bus """
+        self.onewire_transfer([OneWireTransaction(False, data, 0)])
+
+    def onewire_read(self, length):
+        """ Read bytes from the 1-Wire bus """
+        return self.onewire_transfer([OneWireTransaction(False, b'', length)])[0]
+
+    @synchronized
+    def onewire_search(self, alarm=False):
+        """ Find the ROM codes of the devices on the 1-Wire bus, in the order of the search algorithm
+
+        :param alarm: Only find the devices with an alarm condition
+        :return: List with the 8 byte ROM code of every device
+        """
+        self._onewire_reset()
+        models = [model for model in self.onewire_models if not alarm or model.alarm()]
+        # The search walks the ROM bits from the least significant bit of the first byte and takes the 0 branch first
+        return sorted((model.rom for model in models),
+                      key=lambda rom: [(byte >> bit) & 1 for byte in rom for bit in range(8)])
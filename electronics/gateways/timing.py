@@ -0,0 +1,242 @@
+from electronics.batch import READ, READ_REGISTER, WRITE_REGISTER
+from electronics.gateways.base import GatewayCapabilities
+
+__all__ = ['VirtualClock', 'TimingModel', 'BusPirateTiming', 'LinuxTiming']
+
+
+class VirtualClock(object):
+    """ Clock for simulations that only moves when it is advanced. Use it as the clock of a SimulatedGateway and as
+    the clock and sleep function of a Scheduler so a simulation runs as fast as possible and gives the same result on
+    every run.
+
+    :param start: The initial time in seconds
+    """
+
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        """ Move the clock forward """
+        if seconds > 0:
+            self.now += seconds
+
+    def sleep(self, seconds):
+        """ Replacement for time.sleep() that advances the clock instead of waiting """
+        self.advance(seconds)
+
+
+class TimingModel(object):
+    """ Estimates the time a real gateway would take for the transactions of a SimulatedGateway.
+
+    The time of a call to the gateway is split in the host time and the bus time. The host time is the round trip to
+    the adapter, like a system call or a USB transfer, a fixed cost for every transaction in the adapter and the time
+    to move the bytes between the host and the adapter. The bus time follows from the I2C clock: every byte on the
+    wire is 8 bits and an ack, the start and stop conditions take about a clock cycle each.
+
+    The model keeps the totals of all charged transactions, use statistics() for the projected throughput.
+
+    :param clock_hz: The I2C clock in Hz
+    :param round_trip: Time in seconds for every round trip between the host and the adapter
+    :param transaction_cost: Time in seconds the adapter needs for every transaction
+    :param byte_cost: Time in seconds to move a byte between the host and the adapter
+    """
+
+    # Clock cycles for a start, repeated start or stop condition
+    CONDITION_CLOCKS = 1
+
+    # Transactions that are sent in a single round trip by i2c_transfer(), None for all of them
+    group_size = None
+
+    def __init__(self, clock_hz=100000, round_trip=0.0, transaction_cost=0.0, byte_cost=0.0):
+        self.clock_hz = clock_hz
+        self.round_trip = round_trip
+        self.transaction_cost = transaction_cost
+        self.byte_cost = byte_cost
+        self.reset_statistics()
+
+    def reset_statistics(self):
+        """ Clear the totals """
+        self.transactions = 0
+        self.round_trips = 0
+        self.host_time = 0.0
+        self.bus_time = 0.0
+
+    def bus_clocks(self, transaction):
+        """ The amount of I2C clock cycles for a transaction """
+        kind = transaction.kind
+        if kind == READ or kind == READ_REGISTER:
+            length = transaction.payload
+        elif isinstance(transaction.payload, int):
+            length = 1
+        else:
+            length = len(transaction.payload)
+        wire_bytes = 1 + length
+        conditions = 2
+        if kind == READ_REGISTER:
+            # Register byte, repeated start and the address again for the read
+            wire_bytes += 2
+            conditions += 1
+        elif kind == WRITE_REGISTER:
+            wire_bytes += 1
+        return wire_bytes * 9 + conditions * self.CONDITION_CLOCKS
+
+    def link_bytes(self, transaction):
+        """ The amount of bytes exchanged between the host and the adapter for a transaction """
+        return 0
+
+    def count_round_trips(self, transactions, bulk):
+        """ The amount of round trips for a list of transactions
+
+        :param transactions: List of electronics.batch.I2CTransaction instances
+        :param bulk: True when the transactions are sent with i2c_transfer(), False when every transaction is a
+                     separate call
+        """
+        if not bulk:
+            return len(transactions)
+        if self.group_size is None:
+            return 1 if transactions else 0
+        return (len(transactions) + self.group_size - 1) // self.group_size
+
+    def cost(self, transactions, bulk=False):
+        """ Calculate the time for a list of transactions without adding it to the totals
+
+        :param transactions: List of electronics.batch.I2CTransaction instances
+        :param bulk: True when the transactions are sent with i2c_transfer()
+        :return: Tuple with the host time and the bus time in seconds
+        """
+        clocks = 0
+        link = 0
+        for transaction in transactions:
+            clocks += self.bus_clocks(transaction)
+            link += self.link_bytes(transaction)
+        host = self.count_round_trips(transactions, bulk) * self.round_trip + \
+            len(transactions) * self.transaction_cost + link * self.byte_cost
+        return host, clocks / self.clock_hz
+
+    def charge(self, transactions, bulk=False):
+        """ Calculate the time for a list of transactions and add it to the totals
+
+        :param transactions: List of electronics.batch.I2CTransaction instances
+        :param bulk: True when the transactions are sent with i2c_transfer()
+        :return: The total time in seconds
+        """
+        host, bus = self.cost(transactions, bulk)
+        self.transactions += len(transactions)
+        self.round_trips += self.count_round_trips(transactions, bulk)
+        self.host_time += host
+        self.bus_time += bus
+        return host + bus
+
+    def capabilities(self, **kwargs):
+        """ Get GatewayCapabilities with the cost estimates of this model for a single byte transaction
+
+        :param kwargs: The other arguments for GatewayCapabilities
+        """
+        byte_cost = 9.0 / self.clock_hz + self.byte_cost
+        transaction_cost = self.round_trip + self.transaction_cost + \
+            (9 + 2 * self.CONDITION_CLOCKS) / self.clock_hz
+        return GatewayCapabilities(transaction_cost=transaction_cost, byte_cost=byte_cost, **kwargs)
+
+    def statistics(self):
+        """ Get the totals of the charged transactions
+
+        :return: dict with the amount of transactions and round trips, the host, bus and total time in seconds, the
+                 projected transactions per second and the fraction of the time the bus is busy
+        """
+        elapsed = self.host_time + self.bus_time
+        return {
+            'transactions': self.transactions,
+            'round_trips': self.round_trips,
+            'host_time': self.host_time,
+            'bus_time': self.bus_time,
+            'elapsed': elapsed,
+            'throughput': self.transactions / elapsed if elapsed else 0.0,
+            'bus_utilization': self.bus_time / elapsed if elapsed else 0.0,
+        }
+
+
+class BusPirateTiming(TimingModel):
+    """ Timing of a Bus Pirate in binary I2C mode. Every call is a USB round trip, the commands, data and responses
+    go over the serial port. The i2c_transfer() of the BusPirate gateway pipelines PIPELINE_DEPTH transactions per
+    round trip.
+
+    :param i2c_speed: One of the speeds of the BusPirate gateway: '400kHz', '100kHz', '50kHz' or '5kHz'
+    :param usb_latency: Round trip time of the USB-serial adapter in seconds. The FTDI chip of the Bus Pirate v3
+                        sends short responses when its latency timer expires, this is 16ms with the default driver
+                        settings and 1ms when it is tuned.
+    :param baud: The baudrate of the serial port
+    :param pipeline_depth: The PIPELINE_DEPTH of the gateway, 1 unless pipelining is enabled on the gateway
+    """
+    # The same values as BusPirate.I2C_SPEEDS, this module doesn't import the BusPirate gateway so simulations don't
+    # need pyserial
+
+    I2C_SPEEDS = {
+        '400kHz': 400000,
+        '100kHz': 100000,
+        '50kHz': 50000,
+        '5kHz': 5000,
+    }
+
+    def __init__(self, i2c_speed='100kHz', usb_latency=0.002, baud=115200, pipeline_depth=1):
+        if i2c_speed not in self.I2C_SPEEDS:
+            raise ValueError('Invalid i2c_speed')
+        self.group_size = pipeline_depth
+        # Every serial byte is 8 data bits with a start and stop bit
+        super().__init__(self.I2C_SPEEDS[i2c_speed], round_trip=usb_latency, byte_cost=10.0 / baud)
+
+    def link_bytes(self, transaction):
+        # Write then read command: 5 header bytes, the address and data bytes, the status byte and the read bytes
+        kind = transaction.kind
+        if kind == READ:
+            return 5 + 1 + 1 + transaction.payload
+        if kind == READ_REGISTER:
+            return 5 + 2 + 1 + transaction.payload
+        payload = transaction.payload
+        length = 1 if isinstance(payload, int) else len(payload)
+        return 5 + (2 if kind == WRITE_REGISTER else 1) + length + 1
+
+    def capabilities(self, **kwargs):
+        kwargs.setdefault('max_transfer', 4096)
+        return super().capabilities(**kwargs)
+
+
+class LinuxTiming(TimingModel):
+    """ Timing of the Linux i2c-dev interface. Every call is a system call and the kernel driver has a fixed cost
+    for every I2C message, the I2C_RDWR ioctl of i2c_transfer() combines up to 42 messages in one system call.
+
+    :param clock_hz: The I2C clock in Hz, set in the device tree or the bus driver
+    :param syscall: Time in seconds for the ioctl system call
+    :param message_cost: Time in seconds the kernel driver needs for every I2C message, mostly the interrupt
+                         handling of the I2C controller
+    """
+    MAX_MESSAGES = 42
+
+    def __init__(self, clock_hz=100000, syscall=0.00002, message_cost=0.00005):
+        super().__init__(clock_hz, round_trip=syscall, transaction_cost=message_cost)
+
+    def _messages(self, transaction):
+        return 2 if transaction.kind == READ_REGISTER else 1
+
+    def count_round_trips(self, transactions, bulk):
+        if not bulk:
+            return len(transactions)
+        calls = 0
+        messages = self.MAX_MESSAGES
+        for transaction in transactions:
+            needed = self._messages(transaction)
+            if messages + needed > self.MAX_MESSAGES:
+                calls += 1
+                messages = 0
+            messages += needed
+        return calls
+
+    def cost(self, transactions, bulk=False):
+        host, bus = super().cost(transactions, bulk)
+        # A register read is a write message with the register followed by the read message
+        for transaction in transactions:
+            if transaction.kind == READ_REGISTER:
+                host += self.transaction_cost
+        return host, bus
@@ -1,5 +1,12 @@
+import collections
+
+
 class GPIOBus(object):
-    """ This is a helper class for when your pins don't line up with ports. """
+    """ This is a helper class for when your pins don't line up with ports.
+
+    Pins on a chip with a write_pins() method, like the MCP23017, are collected and written with a single call per
+    chip instead of a write per pin.
+    """
 
     def __init__(self, pins):
         self.pins = pins
@@ -10,8 +17,18 @@ class GPIOBus(object):
         if value > self.max:
             raise AttributeError('{} pins is not enough to represent {}'.format(len(self.pins), value))
 
+        # Pins on a chip that can set multiple pins at once are written a whole port at a time
+        ports = collections.OrderedDict()
         for i in range(0, len(self.pins)):
-            self.pins[i].write(value & (1 << i) > 0)
+            pin = self.pins[i]
+            level = value & (1 << i) > 0
+            if hasattr(pin.chip, 'write_pins'):
+                ports.setdefault(pin.chip, []).append((pin, level))
+            else:
+                pin.write(level)
+
+        for chip, levels in ports.items():
+            chip.write_pins(levels)
 
     def read(self):
         result = 0
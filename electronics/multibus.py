@@ -0,0 +1,254 @@
+import collections
+import heapq
+import multiprocessing
+import queue
+import threading
+import time
+
+from electronics.scheduler import Scheduler
+
+Sample = collections.namedtuple('Sample', ['timestamp', 'bus', 'name', 'value', 'error'])
+Sample.__doc__ = """ A single read from a MultiBusSampler. The timestamp is from time.monotonic(), error contains the
+exception message if the read failed. """
+
+
+def _worker(bus, factory, args, setup, output, stop, overflow):
+    # Runs in the worker thread or process of a bus. The last item on the output queue is a Sample without name that
+    # contains the statistics of the bus or the error that stopped it.
+    dropped = [0]
+
+    def send(sample):
+        if overflow == MultiBusSampler.DROP:
+            try:
+                output.put_nowait(sample)
+            except queue.Full:
+                dropped[0] += 1
+            return
+        # Block until the consumer catches up, the scheduler skips the releases that pass in the meantime
+        while not stop.is_set():
+            try:
+                output.put(sample, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def on_value(task, value):
+        send(Sample(task.timestamp, bus, task.name, value, None))
+
+    def on_error(task, error):
+        send(Sample(time.monotonic(), bus, task.name, None, '{}: {}'.format(type(error).__name__, error)))
+
+    result = None
+    try:
+        gateway = factory(*args)
+        scheduler = Scheduler(on_error=on_error)
+        setup(gateway, scheduler)
+        for task in scheduler.tasks:
+            task.callback = on_value
+
+        while not stop.is_set():
+            scheduler.run_pending()
+            wake = scheduler.next_release()
+            delay = 0.1 if wake is None else min(wake - time.monotonic(), 0.1)
+            if delay > 0:
+                stop.wait(delay)
+
+        result = {'tasks': scheduler.statistics(), 'dropped': dropped[0]}
+        error = None
+        if hasattr(gateway, 'close'):
+            gateway.close()
+    except Exception as e:
+        error = '{}: {}'.format(type(e).__name__, e)
+
+    # The end marker is always delivered, the consumer waits for it
+    while True:
+        try:
+            output.put(Sample(time.monotonic(), bus, None, result, error), timeout=0.1)
+            return
+        except queue.Full:
+            pass
+
+
+class MultiBusSampler(object):
+    """ Samples several buses at the same time with a worker for every gateway.
+
+    Every bus gets a worker thread, or a worker process when the decoding of the values is heavy enough to be limited
+    by the GIL. The worker creates the gateway, calls the setup function to add the reads to a Scheduler and runs it.
+    The results of all buses are merged into a single stream ordered on timestamp.
+
+    The queue between a worker and the consumer has a fixed size. When the consumer is too slow the worker waits
+    (the default) and the scheduler of that bus skips the releases it misses, or with overflow=DROP the new samples
+    are dropped. A failing read is delivered as a sample with the error set and the bus keeps running. When a worker
+    fails completely the other buses are not affected.
+
+    The gateway factory and setup function have to be picklable, like a module level function or a class, when the
+    bus runs in a process. The timestamps use time.monotonic(), which is the same clock for all processes.
+
+    .. testsetup::
+
+        from electronics.gateways import MockGateway
+        from electronics.devices import LM75
+        from electronics.multibus import MultiBusSampler
+
+    :Example:
+
+    >>> def setup(gateway, scheduler):
+    ...     sensor = LM75(gateway)
+    ...     scheduler.add(sensor.temperature, rate=100, name='lm75')
+    >>> sampler = MultiBusSampler()
+    >>> sampler.add_bus('bus1', MockGateway, setup)
+    >>> sampler.add_bus('bus2', MockGateway, setup)
+    >>> sampler.start()
+    >>> samples = sampler.read(10)
+    >>> sampler.stop()
+    >>> sorted(set(sample.bus for sample in samples))
+    ['bus1', 'bus2']
+    >>> all(a.timestamp <= b.timestamp for a, b in zip(samples, samples[1:]))
+    True
+    >>> sampler.statistics['bus1']['tasks']['lm75']['errors']
+    0
+    >>> # Run a bus in its own process, the factory arguments are passed to the gateway
+    >>> sampler.add_bus('i2c-1', LinuxDevice, setup_bus1, args=(1,), process=True) # doctest: +SKIP
+
+    :param queue_size: Maximum amount of samples waiting in the queue of every bus
+    :param overflow: BLOCK to make the worker wait when the queue is full or DROP to drop the new samples
+    :param latency: Maximum time in seconds the merge waits for a bus that is behind before giving out samples of the
+                    other buses. Samples of a bus that is later than this can be out of order.
+    """
+
+    BLOCK = 'block'
+    DROP = 'drop'
+
+    def __init__(self, queue_size=1000, overflow=BLOCK, latency=0.05):
+        if overflow not in (self.BLOCK, self.DROP):
+            raise ValueError('Unknown overflow mode {}, use BLOCK or DROP'.format(overflow))
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.latency = latency
+        self.buses = collections.OrderedDict()
+        self.statistics = {}
+        self.errors = {}
+        self._workers = {}
+        self._heads = {}
+        self._merge = []
+        self._running = set()
+
+    def add_bus(self, name, factory, setup, args=(), process=False):
+        """ Add a bus to sample
+
+        :param name: Name of the bus, used in the samples
+        :param factory: Function or class that creates the gateway, called in the worker
+        :param setup: Function that gets the gateway and a Scheduler and adds the reads for this bus
+        :param args: Arguments for the factory
+        :param process: Run the worker in a process instead of a thread
+        """
+        if name in self.buses:
+            raise ValueError('Bus {} is already added'.format(name))
+        if self._workers:
+            raise Exception('Add all buses before starting the sampler')
+        self.buses[name] = (factory, setup, tuple(args), process)
+
+    def start(self):
+        """ Start the workers for all buses """
+        if self._workers:
+            return
+        context = multiprocessing.get_context()
+        self.statistics = {}
+        self.errors = {}
+        self._heads = {}
+        self._merge = []
+        for name, (factory, setup, args, process) in self.buses.items():
+            if process:
+                output = context.Queue(self.queue_size)
+                stop = context.Event()
+                worker = context.Process(target=_worker, daemon=True,
+                                         args=(name, factory, args, setup, output, stop, self.overflow))
+            else:
+                output = queue.Queue(self.queue_size)
+                stop = threading.Event()
+                worker = threading.Thread(target=_worker, daemon=True,
+                                          args=(name, factory, args, setup, output, stop, self.overflow))
+            worker.start()
+            self._workers[name] = (worker, output, stop)
+        self._running = set(self.buses)
+
+    def stop(self):
+        """ Stop all workers and wait until they are finished. Samples that were not read yet are discarded. """
+        for worker, output, stop in self._workers.values():
+            stop.set()
+        # Drain the queues until every worker delivered its end marker, a full queue would block the worker
+        while self._running:
+            self._fill(0.1)
+            self._merge = []
+            self._heads = {}
+        for worker, output, stop in self._workers.values():
+            worker.join()
+        self._workers = {}
+
+    def _fill(self, timeout):
+        # Make sure every running bus has its oldest sample in the merge heap, wait at most timeout for a bus
+        deadline = time.monotonic() + timeout
+        for name in list(self._running):
+            if name in self._heads:
+                continue
+            output = self._workers[name][1]
+            try:
+                sample = output.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                continue
+            if sample.name is None:
+                self._running.discard(name)
+                if sample.error is None:
+                    self.statistics[name] = sample.value
+                else:
+                    self.errors[name] = sample.error
+                continue
+            self._heads[name] = sample
+            heapq.heappush(self._merge, (sample.timestamp, name, sample))
+
+    def _next(self, timeout):
+        end = time.monotonic() + timeout
+        while True:
+            self._fill(min(self.latency, max(end - time.monotonic(), 0)))
+            if self._merge:
+                timestamp, name, sample = self._merge[0]
+                # Only give out the oldest sample when every bus has a later one or when it is old enough that a
+                # slower bus can't deliver anything earlier anymore
+                if len(self._heads) == len(self._running) or time.monotonic() - timestamp >= self.latency:
+                    heapq.heappop(self._merge)
+                    del self._heads[name]
+                    return sample
+            elif not self._running:
+                return None
+            if time.monotonic() >= end:
+                return None
+
+    def read(self, count, timeout=None):
+        """ Read samples from all buses in timestamp order
+
+        :param count: Amount of samples to read
+        :param timeout: Maximum time in seconds to wait or None to wait until the samples are available
+        :return: List of Sample instances, shorter than count on a timeout or when all workers have stopped
+        """
+        end = None if timeout is None else time.monotonic() + timeout
+        result = []
+        while len(result) < count:
+            remaining = self.latency if end is None else end - time.monotonic()
+            if remaining <= 0:
+                break
+            sample = self._next(remaining)
+            if sample is None:
+                if not self._running:
+                    break
+                continue
+            result.append(sample)
+        return result
+
+    def samples(self):
+        """ Iterate over the samples of all buses in timestamp order until all workers have stopped """
+        while True:
+            sample = self._next(self.latency)
+            if sample is not None:
+                yield sample
+            elif not self._running:
+                return
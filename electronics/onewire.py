@@ -0,0 +1,131 @@
+import collections
+
+OneWireTransaction = collections.namedtuple('OneWireTransaction', ['reset', 'data', 'read_length'])
+OneWireTransaction.__doc__ = """ A 1-Wire transaction: an optional bus reset, the bytes to write and the amount of bytes
+to read afterwards. """
+
+# ROM commands, the first byte after a reset
+SEARCH_ROM = 0xF0
+READ_ROM = 0x33
+MATCH_ROM = 0x55
+SKIP_ROM = 0xCC
+ALARM_SEARCH = 0xEC
+
+
+def crc8(data):
+    """ Calculate the Dallas/Maxim CRC-8 used for the ROM codes and the scratchpad of 1-Wire devices. The CRC over
+    data that ends with its own CRC byte is 0.
+
+    .. testsetup::
+
+        from electronics.onewire import crc8
+
+    >>> crc8(b'\\x28\\xff\\x64\\x1e\\x0f\\x3a\\x5c')
+    134
+    >>> crc8(b'\\x28\\xff\\x64\\x1e\\x0f\\x3a\\x5c\\x86')
+    0
+
+    :param data: bytes or list of ints
+    :return: The CRC as int
+    """
+    crc = 0
+    for byte in data:
+        for i in range(8):
+            mix = (crc ^ byte) & 0x01
+            crc >>= 1
+            if mix:
+                crc ^= 0x8C
+            byte >>= 1
+    return crc
+
+
+def execute_sequential(bus, transactions):
+    """ Execute a list of 1-Wire transactions one by one with the onewire_reset(), onewire_write() and onewire_read()
+    methods of the gateway. This is the fallback for gateways without onewire_transfer().
+
+    :param bus: The gateway
+    :param transactions: List of OneWireTransaction instances
+    :return: List with the read bytes for every transaction, None when nothing was read
+    """
+    results = []
+    for transaction in transactions:
+        if transaction.reset:
+            bus.onewire_reset()
+        if transaction.data:
+            bus.onewire_write(transaction.data)
+        results.append(bus.onewire_read(transaction.read_length) if transaction.read_length else None)
+    return results
+
+
+def transfer(bus, transactions):
+    """ Execute a list of 1-Wire transactions with the fastest path the gateway has
+
+    :param bus: The gateway
+    :param transactions: List of OneWireTransaction instances
+    :return: List with the read bytes for every transaction, None when nothing was read
+    """
+    method = getattr(bus, 'onewire_transfer', None)
+    if method is None:
+        return execute_sequential(bus, transactions)
+    return method(transactions)
+
+
+class OneWireDevice(object):
+    """ Base class for devices on a 1-Wire bus. The device is addressed with its 64 bit ROM code, or with the skip ROM
+    command when it is the only device on the bus.
+
+    :param bus: Gateway with 1-Wire support
+    :param rom: The 8 byte ROM code of the device, None when it is the only device on the bus
+    """
+
+    # The family code in the first byte of the ROM, None for any family
+    FAMILY = None
+
+    def __init__(self, bus, rom=None):
+        capabilities = getattr(bus, 'capabilities', None)
+        if capabilities is None or not capabilities.onewire:
+            raise Exception('Bus does not support 1-Wire')
+        if rom is not None:
+            rom = bytes(rom)
+            if len(rom) != 8 or crc8(rom) != 0:
+                raise ValueError('Invalid ROM code')
+        self.onewire_bus = bus
+        self.rom = rom
+
+    def __repr__(self):
+        if self.rom is None:
+            return '<{}>'.format(type(self).__name__)
+        return '<{} {}>'.format(type(self).__name__, self.rom.hex())
+
+    @classmethod
+    def find(cls, bus):
+        """ Search the bus for devices of this family
+
+        :param bus: Gateway with 1-Wire support
+        :return: List with an instance for every device that is found
+        """
+        return [cls(bus, rom) for rom in bus.onewire_search() if cls.FAMILY is None or rom[0] == cls.FAMILY]
+
+    def select(self):
+        """ The ROM command that addresses this device after a reset """
+        if self.rom is None:
+            return bytes([SKIP_ROM])
+        return bytes([MATCH_ROM]) + self.rom
+
+    def command(self, data, read_length=0):
+        """ Build the transaction that resets the bus, selects this device and sends a function command
+
+        :param data: The function command and its data
+        :param read_length: Amount of bytes to read after the command
+        :return: OneWireTransaction instance
+        """
+        return OneWireTransaction(True, self.select() + bytes(data), read_length)
+
+    def onewire_command(self, data, read_length=0):
+        """ Send a function command to this device
+
+        :param data: The function command and its data
+        :param read_length: Amount of bytes to read after the command
+        :return: The read bytes or None when nothing was read
+        """
+        return transfer(self.onewire_bus, [self.command(data, read_length)])[0]
@@ -82,17 +82,32 @@ class GPIOPin(PinReference):
 
 
 class AnalogOutputPin(PinReference):
+    """ This is a reference to a pin with an analog output, like a DAC channel """
+
     def __init__(self, chip_instance, method, arguments=None, name=""):
         self.max = 1024
         super().__init__(chip_instance, method, arguments, name=name)
 
     def write(self, value):
-        pass
+        """ Set the output level of the pin
+
+        :type value: float
+        :param value: The level between 0 and 1
+        """
+        m = getattr(self.chip, self.method)
+        m(value, **self.arguments)
 
 
 class AnalogInputPin(PinReference):
+    """ This is a reference to a pin with an analog input, like an ADC channel """
+
     def __init__(self, chip_instance, method, arguments=None, name=""):
         super().__init__(chip_instance, method, arguments, name=name)
 
     def read(self):
-        pass
+        """ Measure the input level of the pin
+
+        :return: The level between 0 and 1
+        """
+        m = getattr(self.chip, self.method)
+        return m(**self.arguments)
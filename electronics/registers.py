@@ -0,0 +1,177 @@
+import collections
+import struct
+
+# Placeholder for a register value that isn't known yet
+_UNKNOWN = object()
+
+
+class _RegisterState(object):
+    def __init__(self):
+        # Shadow copy of the register values, indexed by register address
+        self.values = {}
+        # Registers that are modified but not yet written to the device
+        self.dirty = collections.OrderedDict()
+        self.deferred = 0
+
+
+def register_state(device):
+    """ Get the shadow register state for a device instance, it's created on first use """
+    try:
+        return device.__dict__['_register_state']
+    except KeyError:
+        state = device.__dict__['_register_state'] = _RegisterState()
+        return state
+
+
+class Register(object):
+    """ Declares a register on an I2CDevice subclass.
+
+    The register value is kept in a shadow copy on the device instance. Reading the attribute returns the shadow copy
+    without bus I/O. Assigning the attribute writes the register to the device (write-through) unless the value is
+    the same as the shadow copy, then nothing is sent. Registers declared with write_through=False are only marked
+    dirty and are sent by flush_registers() on the device.
+
+    The shadow copy starts at the reset value of the register from the datasheet. The chip may hold something else,
+    it might not have been reset since a previous program changed it, so the first assignment to a register is always
+    sent. After that the shadow copy is known and unchanged values are skipped. Use refresh_registers() on the device
+    to load the actual values from the chip.
+
+    .. testsetup::
+
+        from electronics.gateways import MockGateway
+        from electronics.device import I2CDevice
+        from electronics.registers import Register, BitField, RegisterBlock
+        gw = MockGateway()
+
+    :Example:
+
+    >>> class Example(I2CDevice):
+    ...     CONFIG = Register(0x00, reset=0x10)
+    ...     COMMAND = Register(0x01, volatile=True)
+    ...     enable = BitField(CONFIG, 0)
+    ...     rate = BitField(CONFIG, 2, 3, values={10: 0, 50: 4, 100: 7})
+    ...     DATA = RegisterBlock(0x03, '>hhh')
+    >>> device = Example(gw, 0x40)
+    >>> device.rate
+    50
+    >>> # Update the bitfields without reading the register from the device
+    >>> device.rate = 100
+    >>> device.enable = True
+    >>> hex(device.CONFIG)
+    '0x1d'
+    >>> # The shadow copy is known now, assigning the same value again sends nothing
+    >>> device.enable = True
+    >>> # Read and decode a block of registers
+    >>> device.read_block(Example.DATA)
+    (258, 772, 1286)
+
+    :param address: The register address
+    :param fmt: struct format of the register value, the default is a single unsigned byte
+    :param reset: The value of the register after a reset of the chip
+    :param write_through: Write changes directly to the device. If False use flush_registers() to send changes
+    :param volatile: The register is changed by the device or triggers an action when written. Every assignment is
+                     sent to the device even if the value didn't change
+    :param readonly: Assigning the register raises an AttributeError
+    """
+
+    def __init__(self, address, fmt='B', reset=0, write_through=True, volatile=False, readonly=False):
+        self.address = address
+        self.struct = struct.Struct(fmt)
+        self.reset = reset
+        self.write_through = write_through
+        self.volatile = volatile
+        self.readonly = readonly
+        self.name = None
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return register_state(instance).values.get(self.address, self.reset)
+
+    def __set__(self, instance, value):
+        if self.readonly:
+            raise AttributeError('Register {} is read-only'.format(self.name))
+        state = register_state(instance)
+        # Registers that were never written or refreshed are not in values, the first assignment is always sent
+        if not self.volatile and state.values.get(self.address, _UNKNOWN) == value:
+            return
+        state.values[self.address] = value
+        if self.write_through and state.deferred == 0:
+            instance.i2c_write_register(self.address, self.struct.pack(value))
+            state.dirty.pop(self.address, None)
+        else:
+            state.dirty[self.address] = self
+
+
+class BitField(object):
+    """ Declares a field of one or more bits in a register.
+
+    Reading and writing the field only uses the shadow copy of the register, the updated register is written to the
+    device like an assignment to the register itself.
+
+    :param register: The Register instance that contains the field
+    :param offset: The bit offset of the lowest bit of the field
+    :param width: The amount of bits in the field
+    :param values: Optional dict that maps the values of the attribute to the raw bits in the register
+    """
+
+    def __init__(self, register, offset, width=1, values=None):
+        self.register = register
+        self.offset = offset
+        self.mask = ((1 << width) - 1) << offset
+        self.values = values
+        if values is not None:
+            self.reverse = dict((raw, value) for value, raw in values.items())
+        self.name = None
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        raw = (self.register.__get__(instance, owner) & self.mask) >> self.offset
+        if self.values is not None:
+            return self.reverse.get(raw, raw)
+        if self.mask >> self.offset == 1:
+            return bool(raw)
+        return raw
+
+    def __set__(self, instance, value):
+        if self.values is not None:
+            if value not in self.values:
+                options = ', '.join(str(option) for option in sorted(self.values))
+                raise ValueError('Invalid value {} for {}, choose one of: {}'.format(value, self.name, options))
+            value = self.values[value]
+        current = self.register.__get__(instance, type(instance))
+        new = (current & ~self.mask) | ((int(value) << self.offset) & self.mask)
+        self.register.__set__(instance, new)
+
+
+class RegisterBlock(object):
+    """ Declares a block of consecutive registers that is read in one transaction.
+
+    The struct format is compiled once when the class is defined, read_block() on the device reads the block and
+    unpacks it with the precompiled decoder.
+
+    :param address: The address of the first register in the block
+    :param fmt: struct format for the contents of the block
+    :param names: Optional list of field names, the block is then returned as a namedtuple
+    """
+
+    def __init__(self, address, fmt, names=None):
+        self.address = address
+        self.struct = struct.Struct(fmt)
+        self.length = self.struct.size
+        self.tuple = None
+        if names is not None:
+            self.tuple = collections.namedtuple('RegisterBlock', names)
+
+    def decode(self, raw):
+        values = self.struct.unpack(raw)
+        if self.tuple is not None:
+            return self.tuple(*values)
+        return values
@@ -0,0 +1,314 @@
+import collections
+import re
+import struct
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+RingRecord = collections.namedtuple('RingRecord', ['sequence', 'timestamp', 'source', 'values'])
+RingRecord.__doc__ = """ A sample from a SampleRing. The sequence numbers start at 0 and count every published
+sample. """
+
+# Header: magic, capacity, published samples, slot size, format of the values and comma separated names of the values
+_HEADER = struct.Struct('<4sIQI4x64s184s')
+_MAGIC = b'ERNG'
+_SEQUENCE_OFFSET = 8
+
+# Slot: sequence number + 1 (0 while it is being written), timestamp and source id, followed by the values
+_SLOT_HEADER = struct.Struct('<QdH')
+
+_NUMPY_TYPES = {
+    'b': 'i1', 'B': 'u1', '?': '?', 'h': 'i2', 'H': 'u2', 'i': 'i4', 'I': 'u4', 'l': 'i4', 'L': 'u4', 'q': 'i8',
+    'Q': 'u8', 'e': 'f2', 'f': 'f4', 'd': 'f8',
+}
+
+
+def _attach_untracked(name):
+    # The resource tracker removes tracked memory when the process exits, only the creator of the ring should do that
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+    # Python before 3.13 always tracks the memory. Unregistering it afterwards would also remove the registration of
+    # the creator when the processes share a tracker, so skip the registration instead.
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+class SampleRing(object):
+    """ Ring buffer in shared memory with fixed size records, for sharing samples between processes.
+
+    One process owns the bus and publishes the samples, any amount of other processes attach to the ring by name and
+    read them without access to the bus. There are no locks: the publisher never waits for the readers and the
+    readers detect records that were overwritten while they read them. Only a single publisher per ring is supported.
+
+    Every record has a timestamp, a source number to tell devices apart and the values, which are packed with a
+    struct format that is the same for all records in the ring.
+
+    .. testsetup::
+
+        from electronics.gateways import MockGateway
+        from electronics.devices import MPU6050I2C
+        from electronics.scheduler import Scheduler
+        from electronics.ring import SampleRing
+        gw = MockGateway()
+
+    :Example:
+
+    >>> ring = SampleRing.create(fmt='hhh', capacity=256, names=['x', 'y', 'z'])
+    >>> sensor = MPU6050I2C(gw)
+    >>> sensor.wakeup()
+    >>> # Publish every read of a scheduler task
+    >>> scheduler = Scheduler()
+    >>> task = scheduler.add_block(sensor, MPU6050I2C.ACCEL_OUT, rate=100, callback=ring.publisher(source=1))
+    >>> scheduler.run_pending()
+    1
+    >>> # In another process
+    >>> reader = SampleRing.attach(ring.name)
+    >>> reader.latest().values
+    (258, 772, 1286)
+    >>> records, position, lost = reader.read_since(0)
+    >>> len(records), position, lost
+    (1, 1, 0)
+    >>> # Zero-copy access to the records with numpy
+    >>> samples = reader.array() # doctest: +SKIP
+    >>> samples['values']['x'][samples['sequence'] > 0] # doctest: +SKIP
+    array([258], dtype=int16)
+    >>> reader.close()
+    >>> ring.close()
+    >>> ring.unlink()
+
+    Use create() in the publishing process and attach() in the readers instead of the constructor.
+    """
+
+    def __init__(self, memory, owner):
+        self.memory = memory
+        self.owner = owner
+        self.buffer = memory.buf
+        magic, capacity, sequence, slot_size, fmt, names = _HEADER.unpack_from(self.buffer, 0)
+        if magic != _MAGIC:
+            raise Exception('Shared memory {} is not a sample ring'.format(memory.name))
+        self.capacity = capacity
+        self.slot_size = slot_size
+        self.format = fmt.rstrip(b'\0').decode()
+        names = names.rstrip(b'\0').decode()
+        self.names = names.split(',') if names else None
+        self._values = struct.Struct('<' + self.format)
+        self._next = sequence
+
+    @property
+    def name(self):
+        """ The name of the shared memory, pass this to attach() in the readers """
+        return self.memory.name
+
+    @classmethod
+    def create(cls, fmt, capacity=1024, name=None, names=None):
+        """ Create a new ring in shared memory
+
+        :param fmt: The struct format of the values in a record without byte order, the values are stored little endian
+        :param capacity: Amount of records in the ring
+        :param name: Name of the shared memory or None to generate a name
+        :param names: Optional list with a name for every value, used for the numpy fields
+        :return: SampleRing instance
+        """
+        fmt = fmt.lstrip('@=<>!')
+        values = struct.Struct('<' + fmt)
+        if names is not None and len(names) != len(values.unpack(bytes(values.size))):
+            raise ValueError('The amount of names does not match the format')
+        if len(fmt) > 64:
+            raise ValueError('The format is too long')
+        encoded_names = ','.join(names).encode() if names else b''
+        if len(encoded_names) > 184:
+            raise ValueError('The names are too long')
+
+        # Keep every slot 8 byte aligned so the sequence numbers are never split
+        slot_size = (_SLOT_HEADER.size + values.size + 7) // 8 * 8
+        memory = shared_memory.SharedMemory(name=name, create=True, size=_HEADER.size + capacity * slot_size)
+        _HEADER.pack_into(memory.buf, 0, _MAGIC, capacity, 0, slot_size, fmt.encode(), encoded_names)
+        return cls(memory, True)
+
+    @classmethod
+    def attach(cls, name):
+        """ Attach to a ring that is created by another process
+
+        :param name: The name of the ring
+        :return: SampleRing instance
+        """
+        ring = cls(_attach_untracked(name), False)
+        ring._next = ring.published()
+        return ring
+
+    def published(self):
+        """ Get the amount of records that are published, this is the sequence number of the next record """
+        return struct.unpack_from('<Q', self.buffer, _SEQUENCE_OFFSET)[0]
+
+    def publish(self, values, timestamp=None, source=0):
+        """ Write a record to the ring, overwriting the oldest record when the ring is full
+
+        :param values: Tuple with the values or a single value
+        :param timestamp: Time of the sample, defaults to time.monotonic()
+        :param source: Number to tell devices apart, 0-65535
+        :return: The sequence number of the record
+        """
+        if not isinstance(values, (tuple, list)):
+            values = (values,)
+        if timestamp is None:
+            timestamp = time.monotonic()
+        sequence = self._next
+        offset = _HEADER.size + (sequence % self.capacity) * self.slot_size
+        buffer = self.buffer
+
+        # Mark the slot as being written, readers that see this or a different sequence number retry or skip it
+        _SLOT_HEADER.pack_into(buffer, offset, 0, timestamp, source)
+        self._values.pack_into(buffer, offset + _SLOT_HEADER.size, *values)
+        struct.pack_into('<Q', buffer, offset, sequence + 1)
+        struct.pack_into('<Q', buffer, _SEQUENCE_OFFSET, sequence + 1)
+        self._next = sequence + 1
+        return sequence
+
+    def publisher(self, source=0):
+        """ Get a callback for Scheduler tasks that publishes every value
+
+        :param source: Number to tell devices apart, 0-65535
+        :return: Function that can be used as callback in Scheduler.add()
+        """
+
+        def callback(task, value):
+            self.publish(value, task.timestamp, source)
+
+        return callback
+
+    def read(self, sequence):
+        """ Read a single record
+
+        :param sequence: The sequence number of the record
+        :return: RingRecord instance or None if the record is overwritten or not published yet
+        """
+        offset = _HEADER.size + (sequence % self.capacity) * self.slot_size
+        buffer = self.buffer
+        for attempt in range(3):
+            marker, timestamp, source = _SLOT_HEADER.unpack_from(buffer, offset)
+            if marker != sequence + 1:
+                if marker == 0:
+                    # The publisher is writing this slot right now
+                    continue
+                return None
+            values = self._values.unpack_from(buffer, offset + _SLOT_HEADER.size)
+            if struct.unpack_from('<Q', buffer, offset)[0] == marker:
+                return RingRecord(sequence, timestamp, source, values)
+        return None
+
+    def latest(self):
+        """ Read the newest record
+
+        :return: RingRecord instance or None if there are no records
+        """
+        sequence = self.published()
+        while sequence > 0:
+            record = self.read(sequence - 1)
+            if record is not None:
+                return record
+            sequence = self.published()
+        return None
+
+    def read_since(self, sequence):
+        """ Read all records from a sequence number up to the newest record
+
+        :param sequence: Sequence number of the first record to read, usually the position returned by the previous
+                         call
+        :return: Tuple with a list of RingRecord instances, the position to continue from and the amount of records
+                 that were overwritten before they could be read
+        """
+        published = self.published()
+        lost = 0
+        oldest = published - self.capacity
+        if sequence < oldest:
+            lost = oldest - sequence
+            sequence = oldest
+        records = []
+        for number in range(sequence, published):
+            record = self.read(number)
+            if record is None:
+                lost += 1
+            else:
+                records.append(record)
+        return records, published, lost
+
+    def slot(self, sequence):
+        """ Get a zero-copy memoryview of the values in a record. The publisher overwrites it when the ring wraps
+        around, use valid() after using the view.
+
+        :param sequence: The sequence number of the record
+        :return: memoryview of the packed values
+        """
+        offset = _HEADER.size + (sequence % self.capacity) * self.slot_size + _SLOT_HEADER.size
+        return self.buffer[offset:offset + self._values.size]
+
+    def valid(self, sequence):
+        """ Check if a record still contains the sample with this sequence number
+
+        :param sequence: The sequence number of the record
+        :return: True if the record is not overwritten
+        """
+        offset = _HEADER.size + (sequence % self.capacity) * self.slot_size
+        return struct.unpack_from('<Q', self.buffer, offset)[0] == sequence + 1
+
+    def dtype(self):
+        """ Get the numpy dtype of a record. The sequence field is the sequence number + 1 or 0 for an empty or
+        changing record. The values are in the values field, named after the names given to create() or f0, f1, ...
+        """
+        import numpy
+
+        fields = []
+        offset = 0
+        index = 0
+        for count, code in re.findall(r'(\d*)([xcbB?hHiIlLqQefds])', self.format):
+            count = int(count) if count else 1
+            if code == 'x':
+                offset += count
+                continue
+            if code == 's':
+                repeat, numpy_type = 1, 'S{}'.format(count)
+            elif code == 'c':
+                repeat, numpy_type = count, 'S1'
+            else:
+                repeat, numpy_type = count, '<' + _NUMPY_TYPES[code]
+            for i in range(repeat):
+                name = self.names[index] if self.names else 'f{}'.format(index)
+                fields.append((name, numpy_type, offset))
+                offset += numpy.dtype(numpy_type).itemsize
+                index += 1
+        values = numpy.dtype({
+            'names': [field[0] for field in fields],
+            'formats': [field[1] for field in fields],
+            'offsets': [field[2] for field in fields],
+            'itemsize': self._values.size,
+        })
+        return numpy.dtype({
+            'names': ['sequence', 'timestamp', 'source', 'values'],
+            'formats': ['<u8', '<f8', '<u2', values],
+            'offsets': [0, 8, 16, _SLOT_HEADER.size],
+            'itemsize': self.slot_size,
+        })
+
+    def array(self):
+        """ Get a zero-copy numpy structured array of all records in the ring. Records are in slot order, sort on the
+        sequence field and ignore the records where it is 0. Requires numpy.
+
+        :return: numpy.ndarray backed by the shared memory
+        """
+        import numpy
+
+        return numpy.ndarray((self.capacity,), dtype=self.dtype(), buffer=self.buffer, offset=_HEADER.size)
+
+    def close(self):
+        """ Detach from the shared memory. Views returned by slot() and array() have to be released first. """
+        self.buffer = None
+        self.memory.close()
+
+    def unlink(self):
+        """ Remove the shared memory, call this in the creating process when the ring is not needed anymore """
+        self.memory.unlink()
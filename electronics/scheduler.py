@@ -0,0 +1,367 @@
+import heapq
+import itertools
+import threading
+import time
+
+from electronics.batch import I2CBatch
+
+
+class PollTask(object):
+    """ A read that is repeated at a fixed rate by the Scheduler. Use Scheduler.add() or Scheduler.add_block() to
+    create a task.
+
+    The last result is available in the value attribute and the time it was read in the timestamp attribute. The
+    last exception of a failed read is kept in the error attribute.
+    """
+
+    def __init__(self, function, rate, deadline=None, trigger=None, conversion_time=0.0, callback=None, name=None,
+                 device=None, block=None):
+        if rate <= 0:
+            raise ValueError('The rate should be higher than 0')
+        self.function = function
+        self.period = 1.0 / rate
+        self.deadline = deadline if deadline is not None else self.period
+        self.trigger = trigger
+        self.conversion_time = conversion_time
+        self.callback = callback
+        self.name = name or getattr(function, '__qualname__', repr(function))
+        self.device = device
+        self.block = block
+
+        self.value = None
+        self.timestamp = None
+        self.error = None
+        self.reset_statistics()
+
+    @property
+    def rate(self):
+        return 1.0 / self.period
+
+    def reset_statistics(self):
+        """ Clear the jitter and deadline statistics of this task """
+        self.runs = 0
+        self.errors = 0
+        self.misses = 0
+        self.skipped = 0
+        self.jitter_total = 0.0
+        self.jitter_max = 0.0
+        self.duration_total = 0.0
+        self.duration_max = 0.0
+
+    def statistics(self):
+        """ Get the timing statistics of this task
+
+        :return: dict with the amount of runs, failed reads, deadline misses and skipped releases and the average and
+                 maximum jitter and bus time in seconds. Jitter is the delay between the planned release and the start
+                 of the read.
+        """
+        return {
+            'rate': self.rate,
+            'runs': self.runs,
+            'errors': self.errors,
+            'misses': self.misses,
+            'skipped': self.skipped,
+            'jitter_average': self.jitter_total / self.runs if self.runs else 0.0,
+            'jitter_max': self.jitter_max,
+            'duration_average': self.duration_total / self.runs if self.runs else 0.0,
+            'duration_max': self.duration_max,
+        }
+
+    def __repr__(self):
+        return '<PollTask {} {:g} Hz>'.format(self.name, self.rate)
+
+
+class Scheduler(object):
+    """ Polls reads on many devices at their own rate.
+
+    The tasks are released at fixed times derived from the monotonic clock, so the time spent reading doesn't add up
+    as drift. When several tasks are due at the same time they run in rate-monotonic order: the task with the highest
+    rate goes first. Register block reads from add_block() that are due together on the same bus are sent in a single
+    batch, see electronics.batch.
+
+    Sensors that need time for a conversion get a trigger and a conversion_time. The trigger is sent at the release
+    time and the read is planned after the conversion, the bus is free for other tasks in the meantime.
+
+    .. testsetup::
+
+        from electronics.gateways import MockGateway
+        from electronics.devices import LM75, MPU6050I2C
+        from electronics.scheduler import Scheduler
+        gw = MockGateway()
+
+    :Example:
+
+    >>> sensor = LM75(gw)
+    >>> sixaxis = MPU6050I2C(gw)
+    >>> sixaxis.wakeup()
+    >>> scheduler = Scheduler()
+    >>> temperature = scheduler.add(sensor.temperature, rate=1)
+    >>> acceleration = scheduler.add_block(sixaxis, MPU6050I2C.ACCEL_OUT, rate=500)
+    >>> gyro = scheduler.add_block(sixaxis, MPU6050I2C.GYRO_OUT, rate=500)
+    >>> # Run all tasks that are due now, the two block reads are sent in one batch
+    >>> scheduler.run_pending()
+    3
+    >>> temperature.value, acceleration.value, gyro.value
+    (17.0703125, (1286, 1800, 2314), (2828, 3342, 3856))
+    >>> scheduler.run(duration=0.1) # doctest: +SKIP
+    >>> acceleration.statistics()['misses'] # doctest: +SKIP
+    0
+
+    :param clock: Function that returns the current time in seconds, defaults to time.monotonic
+    :param sleep: Function that waits for an amount of seconds, used by run() when no stop event is needed
+    :param on_error: Function that is called with the task and the exception when a read fails. Without it the
+                     exception is raised from run_pending() after the other due tasks have run. The failed task is
+                     planned again in both cases.
+    """
+
+    def __init__(self, clock=time.monotonic, sleep=None, on_error=None):
+        self.clock = clock
+        self.sleep = sleep
+        self.on_error = on_error
+        self.tasks = []
+        self._queue = []
+        self._sequence = itertools.count()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def add(self, function, rate, deadline=None, trigger=None, conversion_time=0.0, callback=None, name=None,
+            offset=0.0):
+        """ Poll a function at a fixed rate
+
+        :param function: Function without arguments that reads the value, usually a method of a device
+        :param rate: Amount of reads per second
+        :param deadline: Time in seconds after the release that the read should be finished, defaults to the period
+        :param trigger: Function that starts a conversion on the device, called at the release time
+        :param conversion_time: Time in seconds between the trigger and the read
+        :param callback: Function that is called with the task and the value after every read
+        :param name: Name used in the statistics, defaults to the function name
+        :param offset: Delay of the first release in seconds, use this to spread tasks with the same rate
+        :return: PollTask instance
+        """
+        task = PollTask(function, rate, deadline, trigger, conversion_time, callback, name)
+        return self._add(task, offset)
+
+    def add_block(self, device, block, rate, deadline=None, trigger=None, conversion_time=0.0, callback=None,
+                  name=None, offset=0.0):
+        """ Poll a register block of a device at a fixed rate. Block reads that are due at the same time on the same
+        bus are sent as a single batch. The value of the task is the decoded block.
+
+        :param device: I2CDevice instance
+        :param block: RegisterBlock declared on the device class
+        :param rate: Amount of reads per second
+
+        The other arguments are the same as for add()
+        """
+        name = name or '{}@{:#04x}'.format(type(device).__name__, block.address)
+        task = PollTask(lambda: device.read_block(block), rate, deadline, trigger, conversion_time, callback, name,
+                        device=device, block=block)
+        return self._add(task, offset)
+
+    def _add(self, task, offset):
+        self.tasks.append(task)
+        task._origin = self.clock() + offset
+        task._index = 0
+        self._push(task._origin, task, False)
+        return task
+
+    def remove(self, task):
+        """ Stop polling a task
+
+        :param task: PollTask returned by add() or add_block()
+        """
+        self.tasks.remove(task)
+        self._queue = [entry for entry in self._queue if entry[4] is not task]
+        heapq.heapify(self._queue)
+
+    def _push(self, when, task, converted, release=None):
+        # Entries are ordered on time, then on period for the rate-monotonic priority
+        if release is None:
+            release = when
+        heapq.heappush(self._queue, (when, task.period, next(self._sequence), release, task, converted))
+
+    def next_release(self):
+        """ Get the time of the next planned bus access
+
+        :return: Time in the clock of the scheduler or None if there are no tasks
+        """
+        if not self._queue:
+            return None
+        return self._queue[0][0]
+
+    def run_pending(self):
+        """ Run all tasks that are due, returns the amount of reads that were done """
+        now = self.clock()
+        due = []
+        while self._queue and self._queue[0][0] <= now:
+            due.append(heapq.heappop(self._queue))
+        if not due:
+            return 0
+
+        # Rate-monotonic order, the task with the shortest period first
+        due.sort(key=lambda entry: (entry[1], entry[2]))
+        reads = []
+        errors = []
+        for when, period, sequence, release, task, converted in due:
+            if task.trigger is not None and not converted:
+                self._record_release(task, release)
+                try:
+                    task.trigger()
+                except Exception as e:
+                    errors.append(e)
+                    self._failed(task, e)
+                    continue
+                self._push(release + task.conversion_time, task, True, release)
+            else:
+                reads.append((release, task, converted))
+
+        done = 0
+        while reads:
+            release, task, converted = reads.pop(0)
+            if task.block is None:
+                started = self.clock()
+                try:
+                    value = task.function()
+                except Exception as e:
+                    errors.append(e)
+                    self._failed(task, e, release, converted)
+                    continue
+                self._finish(task, release, started, value, converted)
+                done += 1
+                continue
+
+            # Coalesce all due block reads on the same bus into a single batch
+            group = [(release, task, converted)]
+            bus = task.device.i2c_bus
+            for item in list(reads):
+                if item[1].block is not None and item[1].device.i2c_bus is bus:
+                    group.append(item)
+                    reads.remove(item)
+            batch = I2CBatch(bus)
+            pending = []
+            started = self.clock()
+            try:
+                with batch:
+                    for item in group:
+                        batch.attach(item[1].device)
+                        pending.append(item[1].device.read_block(item[1].block))
+            except Exception as e:
+                errors.append(e)
+                for release, task, converted in group:
+                    self._failed(task, e, release, converted)
+                continue
+            for (release, task, converted), result in zip(group, pending):
+                self._finish(task, release, started, result.result(), converted)
+                done += 1
+
+        if errors and self.on_error is None:
+            raise errors[0]
+        return done
+
+    def _record_release(self, task, release):
+        jitter = self.clock() - release
+        task.jitter_total += jitter
+        if jitter > task.jitter_max:
+            task.jitter_max = jitter
+
+    def _failed(self, task, error, release=None, converted=True):
+        # A failing read doesn't stop the task, it is planned again for the next release
+        if not converted:
+            self._record_release(task, release)
+        task.errors += 1
+        task.error = error
+        if self.on_error is not None:
+            self.on_error(task, error)
+        self._plan(task, self.clock())
+
+    def _finish(self, task, release, started, value, converted):
+        finished = self.clock()
+        if not converted:
+            self._record_release(task, release)
+        duration = finished - started
+        task.runs += 1
+        task.duration_total += duration
+        if duration > task.duration_max:
+            task.duration_max = duration
+        if finished - release > task.deadline:
+            task.misses += 1
+
+        task.value = value
+        task.timestamp = finished
+        if task.callback is not None:
+            task.callback(task, value)
+        self._plan(task, finished)
+
+    def _plan(self, task, now):
+        # Plan from the first release instead of the current time so the timing doesn't drift, not even by rounding
+        # errors. Releases that are already over are skipped instead of run in a burst.
+        task._index += 1
+        next_release = task._origin + task._index * task.period
+        if next_release < now:
+            missed = int((now - next_release) / task.period) + 1
+            task.skipped += missed
+            task._index += missed
+            next_release = task._origin + task._index * task.period
+        self._push(next_release, task, False)
+
+    def run(self, duration=None):
+        """ Run the tasks until stop() is called or the duration has passed
+
+        :param duration: Time in seconds to run or None to run until stop()
+        """
+        end = None if duration is None else self.clock() + duration
+        while not self._stop.is_set():
+            self.run_pending()
+            wake = self.next_release()
+            if end is not None:
+                if self.clock() >= end:
+                    break
+                wake = end if wake is None else min(wake, end)
+            if wake is None:
+                self._stop.wait(0.1)
+                continue
+            delay = wake - self.clock()
+            if delay > 0:
+                if self.sleep is not None:
+                    self.sleep(delay)
+                else:
+                    self._stop.wait(delay)
+        self._stop.clear()
+
+    def start(self):
+        """ Start polling in a background thread """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """ Stop the background thread or a running run() call """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def statistics(self):
+        """ Get the timing statistics of all tasks
+
+        :return: dict with the task name as key and the statistics from PollTask.statistics() as value
+        """
+        return {task.name: task.statistics() for task in self.tasks}
+
+    def utilization(self):
+        """ Get the fraction of the time every bus is busy with the tasks, based on the measured bus time of the reads.
+        The rate-monotonic order meets every deadline on a bus as long as this stays below about 0.69.
+
+        :return: dict with the gateway as key and the utilization as value. Tasks from add() count for the bus of the
+                 device the method belongs to.
+        """
+        result = {}
+        for task in self.tasks:
+            if task.device is not None:
+                bus = task.device.i2c_bus
+            else:
+                bus = getattr(getattr(task.function, '__self__', None), 'i2c_bus', None)
+            average = task.duration_total / task.runs if task.runs else 0.0
+            result[bus] = result.get(bus, 0.0) + average * task.rate
+        return result
@@ -0,0 +1,154 @@
+import collections
+import logging
+import struct
+
+TraceEntry = collections.namedtuple('TraceEntry', ['timestamp', 'address', 'register', 'direction', 'length',
+                                                   'duration'])
+
+
+class TraceBuffer(object):
+    """ Records bus transactions as compact binary entries in a fixed size ring buffer.
+
+    Tracing is disabled by default and costs a single attribute check per transaction. Install a TraceBuffer as the
+    tracer on I2CDevice to trace every device or on a single device instance to only trace that one. When the buffer
+    is full the oldest entries are overwritten.
+
+    Every entry contains the start time (from time.perf_counter), the device address, the register (None for raw
+    reads and writes), the direction, the amount of bytes and the duration of the transaction in seconds.
+
+    .. testsetup::
+
+        from electronics.gateways import MockGateway
+        from electronics.devices import LM75
+        from electronics.device import I2CDevice
+        from electronics.trace import TraceBuffer
+        gw = MockGateway()
+
+    :Example:
+
+    >>> sensor = LM75(gw)
+    >>> # Trace only this sensor, use I2CDevice.tracer = trace to trace all devices
+    >>> sensor.tracer = TraceBuffer(size=256)
+    >>> temperature = sensor.temperature()
+    >>> temperature = sensor.temperature()
+    >>> len(sensor.tracer)
+    2
+    >>> entry = sensor.tracer.entries()[0]
+    >>> entry.address, entry.register, entry.direction, entry.length
+    (73, None, 'read', 2)
+    >>> # The raw entries can be saved and loaded again later
+    >>> raw = sensor.tracer.dump()
+    >>> len(TraceBuffer.load(raw))
+    2
+
+    :param size: The maximum amount of entries in the buffer
+    """
+    READ = 0
+    WRITE = 1
+
+    # Register value stored for transactions without register
+    NO_REGISTER = 0xFFFF
+
+    entry_format = struct.Struct('<dBHBHf')
+
+    def __init__(self, size=4096):
+        self.size = size
+        self.data = bytearray(self.entry_format.size * size)
+        self.index = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def record(self, address, register, direction, length, start, end):
+        """ Add a transaction to the buffer. This is called by I2CDevice for every transaction.
+
+        :param address: Address of the device
+        :param register: Register address or None
+        :param direction: TraceBuffer.READ or TraceBuffer.WRITE
+        :param length: Amount of bytes transferred
+        :param start: time.perf_counter() value at the start of the transaction
+        :param end: time.perf_counter() value at the end of the transaction
+        """
+        if register is None:
+            register = self.NO_REGISTER
+        self.entry_format.pack_into(self.data, self.index * self.entry_format.size, start, address, register,
+                                    direction, length, end - start)
+        self.index += 1
+        if self.index == self.size:
+            self.index = 0
+        if self.count < self.size:
+            self.count += 1
+
+    def clear(self):
+        """ Remove all entries from the buffer """
+        self.index = 0
+        self.count = 0
+
+    def dump(self):
+        """ Get the raw entries in the buffer, oldest first
+
+        :return: bytes with the packed entries, use TraceBuffer.load() to decode them again
+        """
+        entry_size = self.entry_format.size
+        if self.count < self.size:
+            return bytes(self.data[0:self.count * entry_size])
+        split = self.index * entry_size
+        return bytes(self.data[split:] + self.data[0:split])
+
+    def entries(self):
+        """ Get the decoded entries in the buffer, oldest first
+
+        :return: list of TraceEntry instances
+        """
+        return self.load(self.dump())
+
+    @classmethod
+    def load(cls, raw):
+        """ Decode raw entries created with dump()
+
+        :param raw: bytes with packed entries
+        :return: list of TraceEntry instances
+        """
+        result = []
+        for timestamp, address, register, direction, length, duration in cls.entry_format.iter_unpack(raw):
+            if register == cls.NO_REGISTER:
+                register = None
+            direction = 'read' if direction == cls.READ else 'write'
+            result.append(TraceEntry(timestamp, address, register, direction, length, duration))
+        return result
+
+    def export_csv(self, fileobj):
+        """ Write the entries in the buffer as CSV
+
+        :param fileobj: File opened in text mode
+        """
+        fileobj.write('timestamp,address,register,direction,length,duration\n')
+        for entry in self.entries():
+            register = '' if entry.register is None else '0x{:02X}'.format(entry.register)
+            fileobj.write('{:.6f},0x{:02X},{},{},{},{:.6f}\n'.format(entry.timestamp, entry.address, register,
+                                                                     entry.direction, entry.length, entry.duration))
+
+
+class LoggingTracer(object):
+    """ Tracer that writes every transaction to the debug log. This formats a log line for every transaction so it's
+    only useful for debugging.
+
+    :Example:
+
+    >>> import logging
+    >>> from electronics.device import I2CDevice
+    >>> from electronics.trace import LoggingTracer
+    >>> logging.basicConfig(level=logging.DEBUG) # doctest: +SKIP
+    >>> I2CDevice.tracer = LoggingTracer() # doctest: +SKIP
+    """
+
+    def __init__(self, logger=None):
+        self.logger = logger or logging.getLogger('electronics')
+
+    def record(self, address, register, direction, length, start, end):
+        arrow = '->' if direction == TraceBuffer.READ else '<-'
+        if register is None:
+            self.logger.debug('0x{:02X} {} PC: {} bytes'.format(address, arrow, length))
+        else:
+            self.logger.debug('0x{:02X} {} PC: reg 0x{:02X}: {} bytes'.format(address, arrow, register, length))
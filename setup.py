@@ -12,9 +12,11 @@ setup(
         author_email='martijn@brixit.nl',
         description='Python 3 library for working with electronics',
         keywords=["electronics", "spi", "i2c", "buspirate"],
+        python_requires='>=3.7',
         classifiers=[
             "Programming Language :: Python",
             "Programming Language :: Python :: 3",
+            "Programming Language :: Python :: 3 :: Only",
             "Development Status :: 4 - Beta",
             "Operating System :: POSIX :: Linux",
             "License :: OSI Approved :: MIT License"